@@ -16,13 +16,14 @@ Kết hợp:
 
 import pandas as pd
 import numpy as np
-import csv
 import json
 import re
 from datetime import datetime
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import KNNImputer, IterativeImputer
 from scipy import stats
+from csv_repair import read_csv_repaired
+from numeric_parsing import parse_float_series
 
 print("="*80)
 print(" TIỀN XỬ LÍ DỮ LIỆU MARKETING - PHIÊN BẢN HOÀN CHỈNH")
@@ -31,45 +32,19 @@ print("="*80)
 # ==================== BƯỚC 1: FIX CẤU TRÚC CSV ====================
 print("\n BƯỚC 1: ĐỌC VÀ FIX CẤU TRÚC CSV...")
 
-rows = []
-with open('./data/Raw/marketing_data.csv', 'r', encoding='utf-8') as f:
-    reader = csv.reader(f)
-    header = next(reader)
-    
-    print(f"   Header: {len(header)} cột")
-    
-    for i, row in enumerate(reader):
-        # Fix: Data có 29 cột, header có 28 cột → bỏ cột cuối
-        if len(row) > len(header):
-            row = row[:len(header)]
-        elif len(row) < len(header):
-            row = row + ['NA'] * (len(header) - len(row))
-        
-        rows.append(row)
-        
-        if (i+1) % 10000 == 0:
-            print(f"   Đang đọc: {i+1:,} dòng...")
+# Fix: Data có 29 cột, header có 28 cột → cắt trường thừa / bù trường thiếu ngay lúc parse
+# (C engine, không dựng list Python cho từng dòng). Giữ mọi giá trị dạng chuỗi như csv.reader.
+# Khác bản cũ: ô bù của dòng thiếu trường là '' (như ô rỗng) thay vì 'NA'; các bước sau
+# (parse_float_series, clean_text, bool, ngày) xử lý '' và 'NA' như nhau.
+df = read_csv_repaired('./data/Raw/marketing_data.csv', encoding='utf-8', dtype=str, keep_default_na=False)
+print(f"   Header: {len(df.columns)} cột")
+print(f"✅ Đọc xong: {len(df):,} dòng")
 
-print(f"✅ Đọc xong: {len(rows):,} dòng")
-
-# Tạo DataFrame
-df = pd.DataFrame(rows, columns=header)
 print(f"📊 DataFrame gốc: {df.shape[0]:,} dòng × {df.shape[1]} cột")
 
 # ==================== BƯỚC 2: PARSE NUMERIC COLUMNS ====================
 print("\n🔧 BƯỚC 2: PARSE NUMERIC COLUMNS...")
 
-def parse_numeric(value):
-    """Parse numeric values, xử lí NA/null/currency"""
-    if pd.isna(value) or value in ['NA', 'na', 'N/A', '', 'NULL', 'null']:
-        return np.nan
-    try:
-        # Remove currency symbols và commas
-        cleaned = str(value).replace(',', '').replace('$', '').replace('€', '').replace('£', '')
-        return float(cleaned)
-    except:
-        return np.nan
-
 # Parse các cột numeric
 numeric_columns = {
     'Price': 'Price',
@@ -86,7 +61,7 @@ numeric_columns = {
 
 for col in numeric_columns:
     if col in df.columns:
-        df[col] = df[col].apply(parse_numeric)
+        df[col] = parse_float_series(df[col])
         null_pct = df[col].isna().sum() / len(df) * 100
         print(f"   ✅ {col}: {df[col].notna().sum():,} values ({100-null_pct:.2f}% complete)")
 
@@ -108,12 +83,23 @@ def clean_text(text):
     
     return text if text else 'Unknown'
 
+def clean_text_series(series):
+    """clean_text cho cả cột: mỗi giá trị khác nhau chỉ làm sạch một lần rồi map ngược lại.
+    Kết quả giống hệt series.apply(clean_text)."""
+    # factorize gộp 1 / 1.0 / True thành một nhóm nên chỉ dùng khi cột toàn chuỗi
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        return series.apply(clean_text)
+    codes, uniques = pd.factorize(series)
+    # Mã -1 (NaN/None) -> 'Unknown' ở vị trí cuối
+    lookup = np.array([clean_text(v) for v in uniques] + ['Unknown'], dtype=object)
+    return pd.Series(lookup[codes], index=series.index, name=series.name)
+
 text_columns = ['Title', 'Manufacturer', 'Model Name', 'Carrier', 
                 'Color Category', 'Internal Memory', 'Screen Size', 'Specifications']
 
 for col in text_columns:
     if col in df.columns:
-        df[col] = df[col].apply(clean_text)
+        df[col] = clean_text_series(df[col])
 
 print(f"✅ Làm sạch {len([c for c in text_columns if c in df.columns])} cột text")
 
@@ -1,32 +1,69 @@
+import argparse
 import subprocess
 import os
+import sys
+from datetime import datetime
 from dotenv import load_dotenv
 
-# === Load biến môi trường từ file .env ===
-load_dotenv()
-api_key = os.getenv("API_KEY")
-
-if not api_key:
-    raise ValueError("⚠️ Không tìm thấy API_KEY trong file .env! Hãy tạo file .env và thêm API_KEY=...")
-
 # === Danh sách các bước cần chạy tuần tự ===
 steps = [
     "src/call_API.py",
     "src/save_data.py",
-    "src/analyze_data.py",   
+    "src/analyze_data.py",
     "src/clean_data.py",
     "src/eda_api.py"
 ]
 
-print("Bắt đầu chạy toàn bộ pipeline...\n")
 
-for step in steps:
-    print(f"Đang chạy: {step}")
-    result = subprocess.run(["python", step], capture_output=True, text=True)
-    print(result.stdout)
-    if result.returncode != 0:
-        print(f"Lỗi ở bước: {step}")
-        print(result.stderr)
-        break
+def parse_args(argv=None):
+    """Tham số dòng lệnh: --profile [cprofile|sample], --profile-memory, --profile-top N."""
+    parser = argparse.ArgumentParser(description="Chạy toàn bộ pipeline Walmart API.")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=["cprofile", "sample"],
+                        help="chạy từng bước dưới profiler, lưu vào data/profiles/<run_id>/")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="trace cấp phát bộ nhớ (tracemalloc), quy về dòng code lúc đỉnh")
+    parser.add_argument("--profile-top", type=int, default=20, help="số hàm / dòng nóng nhất in ra")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Chạy lần lượt các bước; trả về mã lỗi của bước hỏng đầu tiên (0 nếu mọi bước chạy xong)."""
+    args = parse_args(argv)
+
+    # === Load biến môi trường từ file .env ===
+    load_dotenv()
+    api_key = os.getenv("API_KEY")
+
+    if not api_key:
+        raise ValueError("⚠️ Không tìm thấy API_KEY trong file .env! Hãy tạo file .env và thêm API_KEY=...")
+
+    # === Profile: mỗi bước chạy qua profiler.py, kết quả lưu theo run id ===
+    profiling = args.profile or args.profile_memory
+    if profiling:
+        run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{os.urandom(3).hex()}"
+        profile_dir = os.path.join("data", "profiles", run_id)
+        print(f"Profile ({args.profile or 'chỉ bộ nhớ'}) lưu vào: {profile_dir}")
+
+    print("Bắt đầu chạy toàn bộ pipeline...\n")
+
+    for step in steps:
+        print(f"Đang chạy: {step}")
+        command = ["python", step]
+        if profiling:
+            command = ["python", "profiler.py", "--out", profile_dir, "--top", str(args.profile_top)]
+            command += ["--mode", args.profile] if args.profile else []
+            command += ["--memory"] if args.profile_memory else []
+            command.append(step)
+        result = subprocess.run(command, capture_output=True, text=True)
+        print(result.stdout)
+        if result.returncode != 0:
+            print(f"Lỗi ở bước: {step}")
+            print(result.stderr)
+            return result.returncode
+
+    print("\nPipeline hoàn tất! Kiểm tra thư mục 'data/' để xem kết quả.")
+    return 0
+
 
-print("\nPipeline hoàn tất! Kiểm tra thư mục 'data/' để xem kết quả.")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Chạy một bước (script trong src/) của pipeline dưới profiler, lưu kết quả và in các hàm /
+dòng code nóng nhất (pipeline.py in lại stdout của mỗi bước).
+
+    python profiler.py --mode cprofile --out data/profiles/<run_id> src/clean_data.py
+    python profiler.py --mode sample --memory --top 30 --out data/profiles/<run_id> src/eda_api.py
+
+--mode cprofile: profile tất định (đếm mọi lời gọi hàm), lưu <bước>.prof (pstats / snakeviz).
+--mode sample: lấy mẫu stack mỗi --interval giây, chi phí thấp, lưu <bước>.stacks.txt dạng
+collapsed (flamegraph.pl / speedscope).
+--memory: tracemalloc, lưu <bước>.memory.txt gồm dòng code trong src/ cấp phát nhiều nhất
+lúc bộ nhớ đạt đỉnh (chạy chậm hơn nhiều lần).
+
+File này chỉ dùng thư viện chuẩn và không import gì ngoài WalmartAPI/ vì image Docker chỉ copy
+thư mục này. ETL ở thư mục gốc có bản riêng của StackSampler / PeakAllocationTracer /
+cprofile_summary (etl_profiler.py); sửa ở đây thì sửa cả bản đó.
+"""
+import argparse
+import cProfile
+import io
+import linecache
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# ======== XÁC ĐỊNH THƯ MỤC GỐC =========
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE_DIR, "src")
+
+
+# ======== LẤY MẪU STACK =========
+class StackSampler:
+    """Profiler lấy mẫu: thread nền đọc stack của thread gọi start() mỗi interval giây.
+
+    Mỗi mẫu được tính bằng thời gian thực kể từ mẫu trước, nên lời gọi C dài (giữ GIL, sampler
+    phải chờ) vẫn được tính đủ thời gian. Chi phí không tăng theo số lời gọi hàm như cProfile.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()  # stack (hàm ngoài cùng trước) -> giây
+        self._stop = threading.Event()
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += now - last
+            last = now
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, path):
+        """Ghi stack dạng collapsed (hàm;hàm;... mili giây), xem bằng flamegraph.pl hoặc speedscope."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, seconds in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {round(seconds * 1000)}\n")
+
+    def summary(self, top_n):
+        """top_n hàm có thời gian tự thân (đang ở đỉnh stack) lớn nhất."""
+        own, total = Counter(), Counter()
+        for stack, seconds in self.stacks.items():
+            own[stack[-1]] += seconds
+            for func in set(stack):
+                total[func] += seconds
+        lines = [f"{'tự thân':>9} {'tích luỹ':>9}  hàm"]
+        lines += [f"{seconds:8.2f}s {total[func]:8.2f}s  {func}" for func, seconds in own.most_common(top_n)]
+        return "\n".join(lines)
+
+
+# ======== TRACE BỘ NHỚ =========
+class PeakAllocationTracer:
+    """tracemalloc kèm thread nền chụp snapshot mỗi khi bộ nhớ đang cấp phát vượt snapshot trước 10%.
+
+    Snapshot gần đỉnh được quy về dòng code gần nhất thuộc roots (file hoặc thư mục,
+    vd src/) trên traceback của từng khối cấp phát, nên dòng gọi pandas/numpy
+    được tính cả phần thư viện cấp phát bên dưới. Bộ nhớ ngoài tracemalloc (pool của Arrow,
+    DuckDB) không được tính. Chạy chậm hơn nhiều lần so với bình thường, nên thời gian của
+    profiler chạy cùng lúc không còn đúng tỉ lệ.
+    """
+
+    def __init__(self, roots, label, frames=64, interval=0.05):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.label, self.frames, self.interval = label, frames, interval
+        self.snapshot, self.snapshot_size, self.peak = None, 0, 0
+        self._stop = threading.Event()
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._thread = threading.Thread(target=self._run, name="profiler-tracemalloc", daemon=True)
+        self._thread.start()
+
+    def _check(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.snapshot_size * 1.1:
+            self.snapshot, self.snapshot_size = tracemalloc.take_snapshot(), current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._check()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._check()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def _in_roots(self, filename):
+        path = os.path.abspath(filename)
+        return any(path == root or path.startswith(root + os.sep) for root in self.roots)
+
+    def line_sizes(self):
+        """Bytes của snapshot theo (file, dòng) trong roots (None: khối cấp phát không qua roots)."""
+        sizes, in_roots = Counter(), {}
+        for trace in self.snapshot.traces if self.snapshot else []:
+            # Bỏ qua cấp phát của thread nền (sampler, tracer), frame gốc của chúng ở threading.py
+            if trace.traceback[0].filename == threading.__file__:
+                continue
+            where = None
+            for frame in reversed(trace.traceback):
+                if frame.filename not in in_roots:
+                    in_roots[frame.filename] = self._in_roots(frame.filename)
+                if in_roots[frame.filename]:
+                    where = (frame.filename, frame.lineno)
+                    break
+            sizes[where] += trace.size
+        return sizes
+
+    def summary(self, top_n):
+        lines = [f"đỉnh tracemalloc {self.peak / 2 ** 20:,.1f} MB, snapshot lúc {self.snapshot_size / 2 ** 20:,.1f} MB"]
+        for where, size in self.line_sizes().most_common(top_n):
+            line = (f"{os.path.basename(where[0])}:{where[1]}  {linecache.getline(where[0], where[1]).strip()}"
+                    if where else f"(không qua {self.label})")
+            lines.append(f"{size / 2 ** 20:9.1f} MB  {line}")
+        return "\n".join(lines)
+
+
+def cprofile_summary(prof, top_n):
+    """top_n hàm có thời gian tự thân lớn nhất của cProfile.Profile."""
+    stream = io.StringIO()
+    pstats.Stats(prof, stream=stream).sort_stats("tottime").print_stats(top_n)
+    return stream.getvalue().strip()
+
+
+# ======== CHẠY MỘT BƯỚC =========
+def run_step(script, mode=None, memory=False, out_dir=".", top_n=20, interval=0.005):
+    """Chạy script như `python script` (run_name='__main__') dưới profiler; lỗi của script được raise lại."""
+    name = os.path.splitext(os.path.basename(script))[0]
+    base = os.path.join(out_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    sys.argv = [script]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    tracer = PeakAllocationTracer([SRC_DIR], "src/") if memory else None
+    sampler = StackSampler(interval) if mode == "sample" else None
+    prof = cProfile.Profile() if mode == "cprofile" else None
+    for started in (tracer, sampler):
+        if started is not None:
+            started.start()
+    if prof is not None:
+        prof.enable()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(base + ".prof")
+            print(f"\n[profile] {name}: cProfile -> {base}.prof\n{cprofile_summary(prof, top_n)}")
+        if sampler is not None:
+            sampler.stop()
+            sampler.save(base + ".stacks.txt")
+            print(f"\n[profile] {name}: mẫu stack -> {base}.stacks.txt\n{sampler.summary(top_n)}")
+        if tracer is not None:
+            tracer.stop()
+            with open(base + ".memory.txt", "w", encoding="utf-8") as f:
+                f.write(tracer.summary(None) + "\n")
+            print(f"\n[profile] {name}: bộ nhớ -> {base}.memory.txt\n{tracer.summary(top_n)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy một bước của pipeline dưới profiler.")
+    parser.add_argument("script")
+    parser.add_argument("--mode", choices=["cprofile", "sample"])
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--out", default=".")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+    run_step(args.script, args.mode, args.memory, args.out, args.top, args.interval)
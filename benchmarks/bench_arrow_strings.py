@@ -0,0 +1,79 @@
+"""
+Đo bộ nhớ và thời gian ETL của marketing_data và walmart_products với cột text dạng
+object Python (mặc định của pandas < 3) và dạng string Arrow (ARROW_STRINGS=True).
+
+Mỗi (bảng, chế độ) chạy trong một process riêng: extract_csv -> transform_data -> load
+vào DuckDB in-memory. In kích thước DataFrame sau khi đọc, thời gian và RSS đỉnh (tính
+từ RSS trước khi đọc) của từng bước: đọc, duplicated, transform, load.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_arrow_strings.py [số dòng]
+"""
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import duckdb
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import etl  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def child(path, table_name, arrow):
+    """Chạy trong process con: extract, transform, load và in kết quả một dòng."""
+    if not arrow:
+        # Baseline: cột text là object Python như pandas < 3
+        try:
+            pd.set_option('future.infer_string', False)
+        except (KeyError, pd.errors.OptionError):
+            pass
+    etl.ARROW_STRINGS = arrow
+    etl.IMPUTER_STORE_DIR = None
+    logging.disable(logging.INFO)
+
+    timings, peaks = {}, {}
+    base_rss = etl._proc_status_mb('VmRSS')
+
+    def stage(name, func):
+        # RSS đỉnh của từng bước, tính từ RSS trước khi đọc
+        etl._reset_peak_rss()
+        start = time.perf_counter()
+        result = func()
+        timings[name] = time.perf_counter() - start
+        peaks[name] = etl._proc_status_mb('VmHWM') - base_rss
+        return result
+
+    df = stage('đọc', lambda: etl.extract_csv(path, table_name))
+    input_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    stage('duplicated', df.duplicated)
+    df = stage('transform', lambda: etl.transform_data(df, table_name))
+    conn = duckdb.connect()
+    stage('load', lambda: etl.load_table(conn, df, table_name))
+    conn.close()
+
+    steps = ' | '.join(f"{name} {timings[name]:5.2f}s / {peaks[name]:5,.0f} MB" for name in timings)
+    print(f"  {'Arrow ' if arrow else 'object'} | DataFrame sau đọc {input_mb:5,.0f} MB | {steps}", flush=True)
+
+
+def main(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        for table_name in ('marketing_data', 'walmart_products'):
+            path = os.path.join(tmp, f'{table_name}.csv')
+            synthetic.write_csv(table_name, path, n)
+            print(f"\n=== {table_name} ({n:,} dòng) ===", flush=True)
+            for arrow in (False, True):
+                subprocess.run([sys.executable, __file__, '--child', path, table_name, str(int(arrow))], check=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], sys.argv[4] == '1')
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
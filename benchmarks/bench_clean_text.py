@@ -0,0 +1,89 @@
+"""
+Benchmark clean_text (apply từng ô) vs clean_text_series (mỗi giá trị khác nhau một lần).
+
+Tạo các cột text giống marketing_data: Manufacturer/Carrier/Color Category ít giá trị,
+Title/Model Name vài nghìn giá trị, Specifications dài và gần như mỗi dòng một giá trị.
+Kiểm tra kết quả giống hệt apply(clean_text) rồi in thời gian từng cột.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_clean_text.py [số dòng] [số process cho Specifications]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import etl  # noqa: E402
+from etl import MARKETING_LONG_TEXT_COLUMNS, clean_text, clean_text_series  # noqa: E402
+
+DIRTY = ['NA', 'na', 'N/A', '', 'NULL', 'null', None, '  ', '---', '"quoted"']
+
+
+def make_text_columns(n, seed=42):
+    """DataFrame các cột text của marketing_data với độ đa dạng giá trị khác nhau."""
+    rng = np.random.default_rng(seed)
+    manufacturers = [f' Brand{i}  ' for i in range(60)]
+    carriers = ['Unlocked', 'AT&T', 'Verizon ', 'T-Mobile', ' Sprint']
+    colors = ['Black', 'White', ' Blue', 'Red ', 'Gold', '(Silver)']
+    memory = ['16 GB', '32 GB', '64GB', '128 GB ', '256 GB']
+    screens = ['5.5 inches', '6.1 inches', '6.7"', ' 4.7 inches']
+    n_models = max(n // 20, 10)
+    models = [f'Model  {i}' for i in range(n_models)]
+    titles = [f'  Phone {i} - {rng.integers(16, 512)}GB  Smartphone!! ' for i in range(n_models)]
+    specs = [f'Display: {i % 7}.{i % 10} inch;\tRAM: {i % 12} GB;  Battery: {3000 + i} mAh;  OS: Android {i % 14} ...'
+             for i in range(max(int(n * 0.7), 1))]
+
+    def pick(values):
+        col = np.array(values, dtype=object)[rng.integers(0, len(values), n)]
+        mask = rng.random(n) < 0.05
+        col[mask] = np.array(DIRTY, dtype=object)[rng.integers(0, len(DIRTY), mask.sum())]
+        return col
+
+    return pd.DataFrame({
+        'Title': pick(titles), 'Manufacturer': pick(manufacturers), 'Model Name': pick(models),
+        'Carrier': pick(carriers), 'Color Category': pick(colors), 'Internal Memory': pick(memory),
+        'Screen Size': pick(screens), 'Specifications': pick(specs),
+    })
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n, workers):
+    # Ngưỡng song song thấp để cột Specifications của benchmark luôn được chia process
+    etl.TEXT_CLEAN_PARALLEL_MIN = 1
+    df = make_text_columns(n)
+    for col in df.columns:
+        expected = df[col].apply(clean_text)
+        pd.testing.assert_series_equal(expected, clean_text_series(df[col]))
+        pd.testing.assert_series_equal(expected, clean_text_series(df[col].astype('str')))
+    pd.testing.assert_series_equal(df['Specifications'].apply(clean_text),
+                                   clean_text_series(df['Specifications'], workers=max(workers, 2)))
+    print("Kết quả giống hệt clean_text: OK")
+
+    total_apply = total_series = 0.0
+    for col in df.columns:
+        col_workers = workers if col in MARKETING_LONG_TEXT_COLUMNS else 1
+        t_apply = timed(lambda s: s.apply(clean_text), df[col])
+        t_series = timed(lambda s: clean_text_series(s, workers=col_workers), df[col])
+        total_apply += t_apply
+        total_series += t_series
+        print(f"  {col:<16} {df[col].nunique():>9,} giá trị | apply: {t_apply:.3f}s | "
+              f"clean_text_series: {t_series:.3f}s | {t_apply / t_series:.1f}x")
+    print(f"{n:,} dòng | tổng apply: {total_apply:.3f}s | tổng clean_text_series: {total_series:.3f}s | "
+          f"nhanh hơn {total_apply / total_series:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1)
@@ -0,0 +1,97 @@
+"""
+Benchmark smart_impute_numeric: engine quy mô lớn (chia khối theo Manufacturer, lấy mẫu
+tập láng giềng / tập fit MICE, transform theo batch) vs KNN/MICE trên toàn bảng.
+
+Dữ liệu giống các cột số của marketing_data, tỉ lệ thiếu rơi vào đủ 3 tầng
+(KNN < 5%, MICE 5-30%, median > 30%). Giá trị bị xoá được giữ lại để đo sai số (RMSE)
+của mỗi cách, tức đánh đổi tốc độ / độ chính xác. Cách toàn bảng là O(n^2) nên chỉ chạy
+đến --full-max dòng.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_impute.py [--sizes 10000 100000 1000000] [--full-max 100000]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import etl  # noqa: E402
+
+MISSING_RATES = {'Price': 0.03, 'Num Of Reviews': 0.02, 'Number Of Ratings': 0.02, 'Average Rating': 0.10,
+                 'Five Star': 0.20, 'Four Star': 0.20, 'Monthly Price': 0.50}
+
+
+def make_marketing_numeric(n, n_manufacturers=60, seed=42):
+    """Trả về (bảng đủ giá trị, bảng có NaN). Giá theo hãng, số rating tương quan với số review."""
+    rng = np.random.default_rng(seed)
+    brand = rng.integers(0, n_manufacturers, n)
+    brand_price = rng.lognormal(5, 0.6, n_manufacturers)
+    reviews = rng.poisson(rng.lognormal(3, 1, n)).astype('float64')
+    rating = np.clip(rng.normal(4.1, 0.5, n), 1, 5).round(1)
+    full = pd.DataFrame({
+        'Manufacturer': np.array([f'Brand{i}' for i in range(n_manufacturers)], dtype=object)[brand],
+        'Price': (brand_price[brand] * rng.lognormal(0, 0.2, n)).round(2),
+        'Num Of Reviews': reviews,
+        'Number Of Ratings': (reviews * rng.uniform(1.2, 3, n)).round(),
+        'Average Rating': rating,
+        'Five Star': (rating * 15 + rng.normal(0, 5, n)).round(),
+        'Four Star': (rating * 5 + rng.normal(0, 3, n)).round(),
+        'Monthly Price': (brand_price[brand] / 24).round(2),
+    })
+    dirty = full.copy()
+    for col, rate in MISSING_RATES.items():
+        dirty.loc[rng.random(n) < rate, col] = np.nan
+    return full, dirty
+
+
+def run(dirty, scalable):
+    """Impute với engine quy mô lớn (scalable=True) hoặc KNN/MICE trên toàn bảng."""
+    saved = (etl.IMPUTE_PARTITION_COLUMN, etl.IMPUTE_PARTITION_MIN_ROWS, etl.IMPUTE_KNN_MAX_DONORS, etl.IMPUTE_MICE_MAX_SAMPLES)
+    if not scalable:
+        etl.IMPUTE_PARTITION_COLUMN, etl.IMPUTE_KNN_MAX_DONORS, etl.IMPUTE_MICE_MAX_SAMPLES = None, None, None
+    else:
+        # Luôn chia khối để thấy ảnh hưởng tới độ chính xác ngay cả ở bảng nhỏ
+        etl.IMPUTE_PARTITION_MIN_ROWS = 0
+    try:
+        start = time.perf_counter()
+        result = etl.smart_impute_numeric(dirty, list(MISSING_RATES))
+        return result, time.perf_counter() - start
+    finally:
+        (etl.IMPUTE_PARTITION_COLUMN, etl.IMPUTE_PARTITION_MIN_ROWS,
+         etl.IMPUTE_KNN_MAX_DONORS, etl.IMPUTE_MICE_MAX_SAMPLES) = saved
+
+
+def rmse(full, dirty, result, col):
+    mask = dirty[col].isna()
+    return float(np.sqrt(((full.loc[mask, col] - result.loc[mask, col]) ** 2).mean()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--full-max', type=int, default=100_000, help='Số dòng tối đa chạy KNN/MICE toàn bảng')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    warnings.filterwarnings('ignore', message=r'\[IterativeImputer\] Early stopping')
+
+    for n in args.sizes:
+        full, dirty = make_marketing_numeric(n)
+        engines = [('quy mô lớn', True)] + ([('toàn bảng', False)] if n <= args.full_max else [])
+        for name, scalable in engines:
+            result, elapsed = run(dirty, scalable)
+            assert not result[list(MISSING_RATES)].isna().any().any()
+            errors = ' | '.join(f"{col}: {rmse(full, dirty, result, col):.2f}" for col in ['Price', 'Number Of Ratings', 'Average Rating', 'Five Star'])
+            print(f"{n:>9,} dòng | {name:<10} | {elapsed:8.2f}s | RMSE {errors}")
+        if n > args.full_max:
+            print(f"{n:>9,} dòng | toàn bảng  | bỏ qua (O(n^2), tăng --full-max để chạy)")
+
+
+if __name__ == '__main__':
+    main()
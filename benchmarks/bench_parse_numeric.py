@@ -0,0 +1,64 @@
+"""
+Benchmark parse_numeric (apply từng ô) vs parse_numeric_series (vector hoá).
+
+Kiểm tra hai cách cho kết quả giống hệt nhau trên dữ liệu bẩn (NA markers, tiền tệ,
+dấu phẩy, '-', '.', chuỗi hỏng, số dạng khoa học) rồi in thời gian và tốc độ tăng.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_parse_numeric.py [số dòng]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from numeric_parsing import parse_numeric, parse_numeric_series  # noqa: E402
+
+
+def make_dirty_numeric(n, seed=42):
+    """Cột object giống cột số của marketing_data: phần lớn là số, còn lại là giá trị bẩn."""
+    rng = np.random.default_rng(seed)
+    values = rng.exponential(200, n).round(2)
+    formatted = np.array([f"${v:,.2f}" if i % 3 == 0 else str(v) for i, v in enumerate(values)], dtype=object)
+    dirty = np.array(['NA', 'n/a', ' null ', 'None', '', '-', '.', '1.2.3', '--5', ' 12 ', '€1.234,5',
+                      '1e5', 'abc', None, np.nan, 3, 2.5, 1e20, 1e-7, float('inf'), True], dtype=object)
+    mask = rng.random(n) < 0.1
+    formatted[mask] = rng.choice(dirty, mask.sum())
+    return pd.Series(formatted, name='Price')
+
+
+def check_equivalent(series):
+    expected = series.apply(parse_numeric).astype('float64')
+    actual = parse_numeric_series(series)
+    np.testing.assert_array_equal(expected.to_numpy(), actual.to_numpy())
+    assert actual.index.equals(series.index)
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n):
+    series = make_dirty_numeric(n)
+    check_equivalent(series)
+    check_equivalent(pd.Series(np.random.default_rng(0).normal(0, 1e6, n)))
+    check_equivalent(pd.Series([1e20, 1e-7, 0.0, -0.0, np.nan, 5.0, float('inf')]))
+    check_equivalent(pd.Series([1, 2, 3], index=[7, 7, 7]))
+    print("Kết quả giống hệt parse_numeric: OK")
+
+    t_apply = timed(lambda s: s.apply(parse_numeric), series)
+    t_vector = timed(parse_numeric_series, series)
+    print(f"{n:,} dòng | apply: {t_apply:.3f}s | vector hoá: {t_vector:.3f}s | nhanh hơn {t_apply / t_vector:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,271 @@
+"""
+Bộ benchmark các hàm transform của etl.py trên dữ liệu giả lập (synthetic.py), lưu kết quả
+thành baseline JSON để so sánh giữa các commit / máy.
+
+Mỗi case đo thời gian thực, CPU và RSS đỉnh (etl.memory_stage) của một hàm trên bảng n dòng
+và lấy lần nhanh nhất trong --repeat lần; run_etl chạy một lần và kèm thời gian từng bước
+lấy từ bảng etl_run_metrics (RSS đỉnh của run_etl chỉ tính từ bước cuối vì mỗi bước đặt
+lại VmHWM). Đầu vào của mỗi case (vd. cột số đã parse trước khi impute) được chuẩn bị
+ngoài phần đo. CSV giả lập được cache trong --data-dir theo (bảng, số dòng, seed) vì sinh
+10 triệu dòng mất vài phút.
+
+Chạy từ thư mục gốc:
+    python benchmarks/bench_suite.py --sizes 10000 100000 1000000 --output benchmarks/baselines/main.json
+    python benchmarks/bench_suite.py --sizes 10000 100000 --compare benchmarks/baselines/main.json
+
+--compare in tỉ lệ thời gian so với baseline và trả về exit code 1 nếu có case chậm hơn
+--threshold lần (bỏ qua case nhanh hơn --min-seconds ở cả hai lần vì nhiễu).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+from datetime import datetime
+
+import duckdb
+import numpy as np
+import pandas as pd
+import sklearn
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import csv_reader  # noqa: E402
+import etl  # noqa: E402
+import synthetic  # noqa: E402
+
+BASELINE_DIR = os.path.join(BASE_DIR, 'benchmarks', 'baselines')
+# Cấu hình etl ảnh hưởng tới kết quả, được ghi vào baseline
+ETL_SETTINGS = ['ENGINE', 'STREAMING', 'PIPELINE', 'WORKERS', 'COPY_FREE', 'ARROW_STRINGS', 'TEXT_CLEAN_WORKERS',
+                'CLEAN_FORMAT', 'IMPUTE_PARTITION_COLUMN', 'IMPUTE_KNN_MAX_DONORS', 'IMPUTE_MICE_MAX_SAMPLES']
+
+
+class Inputs:
+    """Đầu vào của các case ở một kích thước, tạo khi cần và dùng lại giữa các case."""
+
+    def __init__(self, n, seed, data_dir):
+        self.n, self.seed, self.data_dir = n, seed, data_dir
+        self._cache = {}
+
+    def _cached(self, key, make):
+        if key not in self._cache:
+            self._cache[key] = make()
+        return self._cache[key]
+
+    def csv_path(self, table_name):
+        """CSV giả lập của bảng, sinh một lần cho mỗi (bảng, n, seed)."""
+        path = os.path.join(self.data_dir, f'{self.n}-{self.seed}', f'{table_name}.csv')
+        if not os.path.exists(path):
+            print(f"  sinh {table_name} ({self.n:,} dòng) -> {path}", flush=True)
+            synthetic.write_csv(table_name, path + '.tmp', self.n, self.seed)
+            os.replace(path + '.tmp', path)
+        return path
+
+    def raw(self, table_name):
+        """Bảng như vừa đọc từ CSV."""
+        return self._cached(('raw', table_name), lambda: etl.extract_csv(self.csv_path(table_name), table_name))
+
+    def rows(self, table_name):
+        """Bảng sau dedup + transform_rows (cột số đã parse, text đã làm sạch)."""
+        plan = etl.compile_plan(table_name)
+        return self._cached(('rows', table_name),
+                            lambda: plan.transform_rows(plan.drop_duplicates(self.raw(table_name).copy())))
+
+    def imputed(self):
+        """marketing_data sau impute, đầu vào của outlier và feature engineering."""
+        return self._cached('imputed', lambda: etl.smart_impute_numeric(
+            self.rows('marketing_data'), etl.MARKETING_IMPUTE_COLUMNS))
+
+
+def _read_case(table_name):
+    def prepare(inputs):
+        path = inputs.csv_path(table_name)
+        return lambda: etl.extract_csv(path, table_name)
+    return table_name, prepare
+
+
+def _parse_numeric(inputs):
+    raw = inputs.raw('marketing_data')
+    return lambda: [etl.parse_numeric_series(raw[col]) for col in etl.MARKETING_NUMERIC_COLUMNS]
+
+
+def _clean_text(inputs):
+    raw = inputs.raw('marketing_data')
+    return lambda: [etl.clean_text_series(raw[col]) for col in etl.MARKETING_TEXT_COLUMNS]
+
+
+def _smart_impute(inputs):
+    df = inputs.rows('marketing_data')
+    return lambda: etl.smart_impute_numeric(df, etl.MARKETING_IMPUTE_COLUMNS)
+
+
+def _outliers(inputs):
+    # Hàm clip tại chỗ nên mỗi lần đo dùng một bản copy
+    df = inputs.imputed().copy()
+    return lambda: etl.detect_and_handle_outliers(df, etl.MARKETING_OUTLIER_COLUMNS)
+
+
+def _drop_low_null(inputs):
+    df = inputs.rows('walmart_products').copy()
+    return lambda: etl.drop_low_null_products(df, 'root_category_name', etl.PRODUCTS_VALUE_COLUMNS)
+
+
+def _features(inputs):
+    df = inputs.imputed()
+    return lambda: etl.feature_engineering(df)
+
+
+def _run_etl(inputs):
+    """run_etl trên cả bốn bảng trong thư mục tạm; thời gian từng bước lấy từ etl_run_metrics."""
+    # Thư mục của lần chạy trước (cùng kích thước) bị xoá, lần cuối được giữ lại để xem
+    work_dir = os.path.join(inputs.data_dir, f'{inputs.n}-{inputs.seed}', 'run_etl')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    source_dir = os.path.join(work_dir, 'Raw')
+    os.makedirs(source_dir)
+    for table_name in synthetic.GENERATORS:
+        os.symlink(os.path.abspath(inputs.csv_path(table_name)), os.path.join(source_dir, f'{table_name}.csv'))
+    etl.SOURCE_DIR, etl.CLEAN_DIR = source_dir, os.path.join(work_dir, 'Clean')
+    etl.DATABASE_PATH = os.path.join(work_dir, 'staging.db')
+    return lambda: etl.run_etl(incremental=False)
+
+
+def _run_etl_stages():
+    """Tổng thời gian (giây) theo bảng và bước của lần run_etl vừa chạy."""
+    conn = duckdb.connect(etl.DATABASE_PATH, read_only=True)
+    try:
+        rows = conn.execute(f"SELECT table_name, stage, sum(wall_seconds) FROM {etl.METRICS_TABLE} "
+                            "GROUP BY ALL ORDER BY min(started_at)").fetchall()
+    finally:
+        conn.close()
+    stages = {}
+    for table_name, stage, seconds in rows:
+        stages.setdefault(table_name, {})[stage] = round(seconds, 4)
+    return stages
+
+
+# case -> (bảng, prepare(inputs) trả về hàm không tham số cần đo)
+CASES = {f'safe_read_csv[{table_name}]': _read_case(table_name) for table_name in synthetic.GENERATORS}
+CASES.update({
+    'parse_numeric': ('marketing_data', _parse_numeric),
+    'clean_text': ('marketing_data', _clean_text),
+    'smart_impute_numeric': ('marketing_data', _smart_impute),
+    'detect_and_handle_outliers': ('marketing_data', _outliers),
+    'drop_low_null_products': ('walmart_products', _drop_low_null),
+    'feature_engineering': ('marketing_data', _features),
+    'run_etl': ('*', _run_etl),
+})
+
+
+def measure(case, table_name, inputs, repeat):
+    """Lần đo nhanh nhất trong repeat lần (run_etl: một lần)."""
+    best = None
+    for _ in range(1 if case == 'run_etl' else repeat):
+        func = CASES[case][1](inputs)
+        with etl.collect_stage_metrics():
+            with etl.memory_stage(case, table_name) as record:
+                func()
+        if best is None or record['wall_seconds'] < best['wall_seconds']:
+            best = record
+    result = {
+        'case': case, 'table': table_name, 'rows': inputs.n,
+        'wall_seconds': round(best['wall_seconds'], 4), 'cpu_seconds': round(best['cpu_seconds'], 4),
+        'peak_rss_delta_mb': round(best['peak_rss_delta_mb'], 1) if best['peak_rss_delta_mb'] is not None else None,
+        'rows_per_second': round(inputs.n / best['wall_seconds']) if best['wall_seconds'] else None,
+    }
+    if case == 'run_etl':
+        result['stages'] = _run_etl_stages()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'git_commit': commit or None, 'python': platform.python_version(), 'platform': platform.platform(),
+        'cpu_count': os.cpu_count(), 'pandas': pd.__version__, 'numpy': np.__version__,
+        'duckdb': duckdb.__version__, 'sklearn': sklearn.__version__,
+        'pyarrow': getattr(etl.pa, '__version__', None),
+        'etl_settings': {name: getattr(etl, name, None) for name in ETL_SETTINGS},
+    }
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """In tỉ lệ so với baseline; trả về danh sách case chậm hơn threshold lần."""
+    old = {(r['case'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nSo với baseline {baseline.get('created_at')} (commit {baseline.get('environment', {}).get('git_commit')}):")
+    for r in results:
+        b = old.get((r['case'], r['rows']))
+        if b is None:
+            print(f"  {r['case']:<40} {r['rows']:>11,} | không có trong baseline")
+            continue
+        ratio = r['wall_seconds'] / b['wall_seconds'] if b['wall_seconds'] else float('inf')
+        slower = ratio > threshold and max(r['wall_seconds'], b['wall_seconds']) >= min_seconds
+        if slower:
+            regressions.append(r)
+        print(f"  {r['case']:<40} {r['rows']:>11,} | {b['wall_seconds']:9.3f}s -> {r['wall_seconds']:9.3f}s "
+              f"| {ratio:5.2f}x{'  CHẬM HƠN' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Số dòng mỗi bảng, vd. 10000 100000 1000000 10000000')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'etl_bench_data'),
+                        help='Thư mục cache CSV giả lập')
+    parser.add_argument('--output', help='File JSON kết quả (mặc định benchmarks/baselines/<thời điểm>.json)')
+    parser.add_argument('--compare', help='Baseline JSON để so sánh')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Tỉ lệ thời gian coi là chậm hơn baseline')
+    parser.add_argument('--min-seconds', type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    warnings.filterwarnings('ignore', message=r'\[IterativeImputer\] Early stopping')
+    # Không đọc/ghi artifact của lần chạy thật; encoding luôn được phát hiện lại
+    etl.IMPUTER_STORE_DIR = etl.PROFILE_DIR = csv_reader.ENCODING_CACHE_PATH = None
+    etl.METRICS_LOG_PATH = None
+    etl.OVERWRITE_TABLES = True
+
+    created_at = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for n in args.sizes:
+        print(f"\n=== {n:,} dòng ===", flush=True)
+        inputs = Inputs(n, args.seed, args.data_dir)
+        for case in args.cases:
+            result = measure(case, CASES[case][0], inputs, args.repeat)
+            results.append(result)
+            peak = result['peak_rss_delta_mb']
+            print(f"  {case:<40} {result['wall_seconds']:9.3f}s | CPU {result['cpu_seconds']:9.3f}s | "
+                  f"RSS đỉnh +{peak if peak is not None else float('nan'):8,.0f} MB | "
+                  f"{result['rows_per_second'] or 0:>12,} dòng/s", flush=True)
+
+    output = args.output or os.path.join(BASELINE_DIR, f"{created_at.replace(':', '')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'created_at': created_at, 'seed': args.seed, 'repeat': args.repeat,
+                   'environment': environment(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"\nĐã lưu kết quả vào {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} case chậm hơn baseline quá {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Đo bộ nhớ của transform_data('marketing_data') ở chế độ mặc định và COPY_FREE.
+
+Mỗi chế độ chạy trong một process riêng để RSS đỉnh không bị ảnh hưởng bởi lần chạy trước.
+In RSS đỉnh của từng bước (memory_stage) và tỉ lệ (bảng đầu vào + phần tăng thêm lúc
+transform) / bảng đầu vào.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_transform_memory.py [số dòng]
+"""
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import etl  # noqa: E402
+import synthetic  # noqa: E402
+
+
+class StagePeaks(logging.Handler):
+    """Gom RSS đỉnh của các bước từ log của etl.memory_stage."""
+
+    def __init__(self):
+        super().__init__()
+        self.peaks = []
+
+    def emit(self, record):
+        if hasattr(record, 'peak_rss_mb'):
+            self.peaks.append(record.peak_rss_mb)
+
+
+def child(path, copy_free):
+    """Chạy trong process con: đọc CSV, transform với MEMORY_REPORT bật, in kết quả."""
+    etl.COPY_FREE = copy_free
+    etl.MEMORY_REPORT = True
+    etl.IMPUTER_STORE_DIR = None
+    logging.getLogger().setLevel(logging.WARNING)
+    etl.logger.setLevel(logging.INFO)
+    etl.logger.addFilter(lambda record: hasattr(record, 'peak_rss_mb'))
+    stage_peaks = StagePeaks()
+    etl.logger.addHandler(stage_peaks)
+
+    df = etl.extract_csv(path)
+    input_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    rss_before = etl._proc_status_mb('VmRSS')
+    etl.transform_data(df, 'marketing_data')
+    extra = max(stage_peaks.peaks) - rss_before
+    print(f"bảng đầu vào {input_mb:,.0f} MB | tăng thêm lúc transform {extra:,.0f} MB | "
+          f"đỉnh / đầu vào = {(input_mb + extra) / input_mb:.2f}x")
+
+
+def main(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'marketing_data.csv')
+        synthetic.write_csv('marketing_data', path, n)
+        for copy_free in (False, True):
+            print(f"\n=== COPY_FREE={copy_free} ({n:,} dòng) ===", flush=True)
+            subprocess.run([sys.executable, __file__, '--child', path, str(int(copy_free))], check=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3] == '1')
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
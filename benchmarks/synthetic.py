@@ -0,0 +1,211 @@
+"""
+Sinh dữ liệu giả lập (tất định theo seed) cho bốn bảng nguồn của etl.py: marketing_data,
+walmart_products, walmart_customers_purchases và cleaned_products_api.
+
+Dữ liệu được sinh theo khối CHUNK_ROWS dòng (khối k dùng seed [seed, k]) nên cùng (bảng, n, seed)
+luôn cho cùng một file, và bộ nhớ khi sinh 10 triệu dòng không phụ thuộc n. Mỗi bảng có:
+tỉ lệ giá trị rỗng giống dữ liệu thật (kèm các marker NA dạng chuỗi), số dạng chuỗi tiền tệ,
+text bẩn (khoảng trắng thừa, ký tự đặc biệt, hoa/thường), category lệch (phân phối Zipf)
+và khoảng 1% dòng trùng lặp hoàn toàn.
+
+    from synthetic import make_frame, write_csv
+    df = make_frame('marketing_data', 100_000)
+    write_csv('walmart_products', 'data/Raw/walmart_products.csv', 1_000_000)
+
+Chạy trực tiếp để sinh cả bốn file:  python benchmarks/synthetic.py <số dòng> <thư mục> [seed]
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 250_000  # Số dòng mỗi khối khi sinh dữ liệu
+DUPLICATE_RATE = 0.01  # Tỉ lệ dòng trùng lặp hoàn toàn (chép lại đầu mỗi khối)
+NA_MARKERS = ['NA', '', 'null', 'N/A']  # Marker rỗng xuất hiện trong cột dạng chuỗi
+
+
+def _pick(rng, values, n, skew=None):
+    """Lấy n giá trị từ values; skew (tham số Zipf > 1) làm vài giá trị đầu chiếm phần lớn."""
+    values = np.asarray(values, dtype=object)
+    index = (rng.zipf(skew, n) - 1) % len(values) if skew else rng.integers(0, len(values), n)
+    return values[index]
+
+
+def _with_nulls(rng, values, rate, markers=None):
+    """Thay ngẫu nhiên rate giá trị bằng marker NA (hoặc NaN nếu markers là None)."""
+    values = np.asarray(values, dtype=object).copy()
+    mask = rng.random(len(values)) < rate
+    values[mask] = np.nan if markers is None else rng.choice(markers, mask.sum())
+    return values
+
+
+def _labels(prefix, ids):
+    """Chuỗi prefix + số, vd. _labels('id', [1, 2]) -> ['id1', 'id2']."""
+    return np.char.add(prefix, np.asarray(ids).astype(str)).astype(object)
+
+
+def _numeric_text(rng, n, scale, null_rate, currency_rate=0.0):
+    """Cột số dạng chuỗi: phần lớn '12.5', một phần '$1,234.50', còn lại là marker NA."""
+    values = rng.exponential(scale, n).round(2)
+    text = values.astype(str).astype(object)
+    currency = rng.random(n) < currency_rate
+    text[currency] = pd.Series(values[currency]).map('${:,.2f}'.format).to_numpy(dtype=object)
+    return _with_nulls(rng, text, null_rate, NA_MARKERS)
+
+
+def _timestamps(rng, n, start, days, fmt):
+    stamps = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')
+    return stamps.strftime(fmt).to_numpy(dtype=object)
+
+
+def marketing_data(rng, start, n):
+    """Điện thoại crawl từ web: số dạng chuỗi có NA/tiền tệ, text bẩn, bool dạng chữ, timestamp có múi giờ."""
+    ids = np.arange(start, start + n)
+    manufacturers = [' Apple', 'Samsung ', 'LG', 'Motorola!!', 'NOKIA', 'Google', 'OnePlus', 'Sony  ', 'HTC', 'ZTE'] + \
+                    [f'Brand{i}' for i in range(50)]
+    models = [f'  Model {i}  ' if i % 4 == 0 else f'M{i}' for i in range(max(n // 20, 10))]
+    spec_ids = rng.integers(0, max(n, 1) * 7 // 10 + 1, n)
+    return pd.DataFrame({
+        'Uniq Id': _labels('id', ids),
+        'Crawl Timestamp': _timestamps(rng, n, '2020-01-01', 365, '%Y-%m-%d %H:%M:%S +0000'),
+        'Pageurl': _labels('https://example.com/p/', ids),
+        'Title': _with_nulls(rng, _labels('  Phone  ', rng.integers(0, 5000, n)) + '   model!! ', 0.01, NA_MARKERS),
+        'Manufacturer': _with_nulls(rng, _pick(rng, manufacturers, n, skew=1.3), 0.05, NA_MARKERS),
+        'Model Name': _with_nulls(rng, _pick(rng, models, n, skew=1.2), 0.05, NA_MARKERS),
+        'Carrier': _with_nulls(rng, _pick(rng, ['Unlocked', 'Verizon', 'AT&T ', ' T-Mobile', 'Sprint'], n, skew=1.5), 0.2, NA_MARKERS),
+        'Color Category': _with_nulls(rng, _pick(rng, ['Black', 'White', ' Blue', 'Red ', 'Gold', '(Silver)'], n, skew=1.6), 0.05, NA_MARKERS),
+        'Internal Memory': _with_nulls(rng, _pick(rng, ['64GB', '128 GB', '32GB', '256GB ', '16 GB', '512GB'], n, skew=1.5), 0.1, NA_MARKERS),
+        'Screen Size': _with_nulls(rng, _pick(rng, ['6.1 inches', '5.5 in', '6.7"', ' 4.7 inches'], n), 0.1, NA_MARKERS),
+        # Text dài, gần như mỗi dòng một giá trị
+        'Specifications': _with_nulls(rng, _labels('Display ', spec_ids % 7) + _labels('.', spec_ids % 10)
+                                      + _labels(' in;  RAM ', spec_ids % 12) + _labels(' GB;\tBattery ', 3000 + spec_ids)
+                                      + ' mAh ...', 0.05, NA_MARKERS),
+        'Price': _numeric_text(rng, n, 200, 0.03, currency_rate=0.33),
+        'Monthly Price': _numeric_text(rng, n, 30, 0.5, currency_rate=0.1),
+        'Stock': _pick(rng, ['True', 'False', 't', '1', 'yes'], n),
+        'Discontinued': _pick(rng, ['False', '0', 'f', 'True'], n, skew=3),
+        'Broken Link': _pick(rng, ['False', 'f', 'True'], n, skew=3),
+        'Num Of Reviews': _numeric_text(rng, n, 50, 0.02),
+        'Average Rating': _numeric_text(rng, n, 3, 0.1),
+        'Number Of Ratings': _numeric_text(rng, n, 80, 0.02),
+        'Five Star': _numeric_text(rng, n, 10, 0.2), 'Four Star': _numeric_text(rng, n, 10, 0.2),
+        'Three Star': _numeric_text(rng, n, 10, 0.2), 'Two Star': _numeric_text(rng, n, 10, 0.2),
+        'One Star': _numeric_text(rng, n, 10, 0.2),
+    })
+
+
+def walmart_products(rng, start, n):
+    """Sản phẩm Walmart: tên dài, brand/category lệch, giá có NaN, discount dạng '$', cột thừa không dùng."""
+    ids = np.arange(start, start + n)
+    root = (rng.zipf(1.6, n) - 1) % 40
+    brand = _labels('Brand', (rng.zipf(1.4, n) - 1) % 900)
+    price = rng.lognormal(3, 1, n).round(2)
+    discount = pd.Series(rng.uniform(0, 20, n)).map('${:.2f}'.format).to_numpy(dtype=object)
+    return pd.DataFrame({
+        'product_id': 10 ** 8 + ids,
+        'product_name': brand + ' Everyday Item ' + _labels('', ids) + ' - ' + _labels('', rng.integers(1, 64, n)) + ' Count, Assorted Colors',
+        'brand': _with_nulls(rng, brand, 0.01),
+        'final_price': price,
+        'initial_price': np.where(rng.random(n) < 0.03, np.nan, (price * rng.uniform(1, 1.3, n)).round(2)),
+        'discount': _with_nulls(rng, discount, 0.04),
+        'review_count': rng.poisson(30, n),
+        'rating': np.where(rng.random(n) < 0.1, np.nan, rng.uniform(1, 5, n).round(1)),
+        'category_name': _labels('Category ', root) + '/' + _labels('', rng.integers(0, 12, n)),
+        'root_category_name': _labels('Root ', root),
+        'available_for_delivery': _pick(rng, ['True', 'False'], n),
+        'available_for_pickup': _pick(rng, ['True', 'False'], n),
+        'url': _labels('https://www.walmart.com/ip/', ids),
+        'description': _labels('Long description of product ', ids) + ('. Durable, easy to clean, great value' * 3),
+    })
+
+
+def walmart_customers_purchases(rng, start, n):
+    """Giao dịch mua hàng: khách hàng quay lại (lệch), category/thành phố lệch, ngày '%m-%d-%y' có vài giá trị hỏng."""
+    categories = ['Electronics', 'Home', 'Clothing', 'Beauty', 'Sports', 'Toys', 'Grocery']
+    products = {'Electronics': ['Laptop', 'Smartphone', 'Headphones', 'TV'], 'Home': ['Blender', 'Vacuum', 'Lamp'],
+                'Clothing': ['Jeans', 'T-Shirt', 'Jacket'], 'Beauty': ['Shampoo', 'Perfume'], 'Sports': ['Bike', 'Yoga Mat'],
+                'Toys': ['Lego Set', 'Puzzle'], 'Grocery': ['Coffee', 'Cereal', 'Snacks']}
+    category_index = (rng.zipf(1.4, n) - 1) % len(categories)
+    # Bảng (category, 12 ô) lặp lại sản phẩm của category để chọn sản phẩm theo category mà không cần vòng lặp
+    product_table = np.array([[products[c][i % len(products[c])] for i in range(12)] for c in categories], dtype=object)
+    dates = _timestamps(rng, n, '2023-01-01', 730, '%m-%d-%y')
+    return pd.DataFrame({
+        'Customer_ID': _labels('C', (rng.zipf(1.2, n) - 1) % 50_000 + 10_000),
+        'Age': rng.integers(18, 70, n),
+        'Gender': _pick(rng, ['Male', 'Female', 'Other'], n, skew=4),
+        'City': _pick(rng, ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Dallas', 'Miami'], n, skew=1.5),
+        'Category': np.array(categories, dtype=object)[category_index],
+        'Product_Name': product_table[category_index, rng.integers(0, 12, n)],
+        'Purchase_Date': _with_nulls(rng, dates, 0.005, ['', '13-45-23', 'unknown']),
+        'Purchase_Amount': rng.lognormal(4, 0.8, n).round(2),
+        'Payment_Method': _pick(rng, ['Credit Card', 'Debit Card', 'Cash on Delivery', 'UPI'], n, skew=2),
+        'Discount_Applied': _pick(rng, ['True', 'False'], n),
+        'Rating': rng.integers(1, 6, n),
+        'Repeat_Customer': _pick(rng, ['True', 'False'], n),
+    })
+
+
+def cleaned_products_api(rng, start, n):
+    """Kết quả gọi Walmart API: mỗi sản phẩm được fetch nhiều lần (trùng us_item_id), seller lệch."""
+    # Khoảng 3 lần fetch mỗi sản phẩm, phân bố trên toàn file (không chỉ trong một khối)
+    item = rng.integers(0, max((start + n) // 3, 1), n)
+    return pd.DataFrame({
+        'fetch_time': _timestamps(rng, n, '2024-01-01', 60, '%Y-%m-%dT%H:%M:%S.000000'),
+        'us_item_id': 10 ** 6 + item,
+        'product_id': _labels('P', item * 7919 % 10 ** 7),
+        'title': _with_nulls(rng, _labels('  Great Value Item ', item) + ' , 12 oz ', 0.01),
+        'rating': np.where(rng.random(n) < 0.15, np.nan, rng.uniform(1, 5, n).round(1)),
+        'reviews': rng.poisson(rng.lognormal(2, 1.5, n)),
+        'seller_name': _with_nulls(rng, _pick(rng, ['Walmart.com', 'SuperSeller', 'Deals4U', 'GadgetHub', 'HomeGoods Co'], n, skew=2), 0.02),
+        'query': _pick(rng, ['coffee', 'toys', 'laptop', 'shampoo', 'tv', 'snacks'], n, skew=1.3),
+        'price_per_unit': _with_nulls(rng, pd.Series(rng.uniform(0.05, 3, n)).map('${:.2f}/oz'.format).to_numpy(dtype=object), 0.3),
+        'two_day_shipping': _pick(rng, ['True', 'False'], n),
+        'free_shipping': _pick(rng, ['True', 'False'], n),
+        'free_shipping_with_walmart_plus': _pick(rng, ['True', 'False'], n),
+        'out_of_stock': _pick(rng, ['False', 'True'], n, skew=3),
+        'thumbnail': _labels('https://i5.walmartimages.com/', item) + '.jpeg',
+    })
+
+
+GENERATORS = {
+    'marketing_data': marketing_data,
+    'walmart_products': walmart_products,
+    'walmart_customers_purchases': walmart_customers_purchases,
+    'cleaned_products_api': cleaned_products_api,
+}
+
+
+def iter_chunks(table_name, n, seed=0, chunk_rows=None):
+    """Sinh bảng theo khối; khối k có seed [seed, k] và kèm DUPLICATE_RATE dòng trùng của chính nó."""
+    generator = GENERATORS[table_name]
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    for k, start in enumerate(range(0, n, chunk_rows)):
+        rows = min(chunk_rows, n - start)
+        chunk = generator(np.random.default_rng([seed, k]), start, rows)
+        yield pd.concat([chunk, chunk.iloc[:int(rows * DUPLICATE_RATE)]], ignore_index=True)
+
+
+def make_frame(table_name, n, seed=0):
+    """Bảng table_name khoảng n dòng (thêm dòng trùng) dưới dạng DataFrame, như đọc từ CSV chưa parse."""
+    return pd.concat(iter_chunks(table_name, n, seed), ignore_index=True)
+
+
+def write_csv(table_name, path, n, seed=0):
+    """Ghi bảng table_name ra CSV theo từng khối."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    for k, chunk in enumerate(iter_chunks(table_name, n, seed)):
+        chunk.to_csv(path, index=False, mode='w' if k == 0 else 'a', header=k == 0)
+
+
+def write_source_dir(directory, n, seed=0, tables=None):
+    """Ghi các bảng (mặc định cả bốn) vào directory với tên file run_etl dùng làm tên bảng."""
+    paths = {}
+    for table_name in tables or GENERATORS:
+        paths[table_name] = os.path.join(directory, f'{table_name}.csv')
+        write_csv(table_name, paths[table_name], n, seed)
+    return paths
+
+
+if __name__ == '__main__':
+    write_source_dir(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
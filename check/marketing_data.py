@@ -24,75 +24,25 @@ from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import KNNImputer, IterativeImputer
 import logging
 import os
-from charset_normalizer import from_path
+import sys
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # ==================== BƯỚC 1: FIX CẤU TRÚC CSV ====================
+# Dùng chung bộ đọc CSV với etl.py (csv_reader.py, không phải import cả etl.py): C engine, encoding cache, dòng hỏng ghi ra staging/bad_lines
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csv_reader import safe_read_csv  # noqa: E402
+from numeric_parsing import parse_numeric_series  # noqa: E402
+
 def safe_read_walmart(file_path):
-    """Try several encodings and parser fallbacks to read a messy CSV.
+    """Read a messy CSV with the shared csv_reader.safe_read_csv.
 
+    Malformed lines are skipped by the C engine and quarantined to a sidecar file
+    instead of re-parsing the whole file with engine='python'.
     Returns a DataFrame or raises a RuntimeError with a helpful message.
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File does not exist: {file_path}")
-
-    # Try to detect encoding first
-    detected = None
-    try:
-        det = from_path(file_path)
-        best = det.best()
-        if best:
-            detected = best.encoding
-    except Exception:
-        detected = None
-
-    encodings_to_try = [
-        detected,
-        'utf-8', 'utf-8-sig',
-        'cp1252', 'windows-1252',
-        'latin1', 'iso-8859-1',
-    ]
-    encodings_to_try = [e for e in dict.fromkeys(encodings_to_try) if e]
-
-    # Try reading with the fast C engine first, then fallback to python engine
-    last_err = None
-    for enc in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=enc, low_memory=False)
-            logger.info(f"Read success with encoding={enc} (C engine)")
-            return df
-        except UnicodeDecodeError as e:
-            last_err = e
-            # try next encoding
-            continue
-        except pd.errors.ParserError as e:
-            # Tokenization/parsing error with C engine — try python engine with permissive on_bad_lines
-            try:
-                df = pd.read_csv(file_path, encoding=enc, engine='python', on_bad_lines='warn')
-                logger.info(f"Read success with encoding={enc} (python engine, on_bad_lines=warn)")
-                return df
-            except Exception as e2:
-                last_err = e2
-                continue
-        except Exception as e:
-            last_err = e
-            continue
-
-    # Final fallback: latin1 + python engine (will not fail on byte values but may produce mangled text)
-    try:
-        df = pd.read_csv(file_path, encoding='latin1', engine='python', on_bad_lines='warn')
-        logger.info("Read success with fallback encoding=latin1 (python engine)")
-        # try to coerce text columns back to utf-8 where possible
-        for col in df.select_dtypes(include=['object']).columns:
-            try:
-                df[col] = df[col].astype(str).apply(lambda s: s.encode('latin1').decode('utf-8', errors='replace'))
-            except Exception:
-                pass
-        return df
-    except Exception as e:
-        raise RuntimeError(f"Cannot read file despite fallbacks: {file_path} | Last error: {last_err or e}")
+    return safe_read_csv(file_path)
 
 # ==================== BƯỚC 2: Tiền xử lý ====================
 def transform(df):
@@ -113,7 +63,7 @@ def transform(df):
     }
     for col in numeric_columns:
         if col in df.columns:
-            df[col] = df[col].apply(parse_numeric)
+            df[col] = parse_numeric_series(df[col])
             null_pct = df[col].isna().sum() / len(df) * 100
             logger.info(f"   ✅ {col}: {df[col].notna().sum():,} values ({100-null_pct:.2f}% complete)")
     
@@ -121,7 +71,7 @@ def transform(df):
     text_columns = ['Title', 'Manufacturer', 'Model Name', 'Carrier', 'Color Category', 'Internal Memory', 'Screen Size', 'Specifications']
     for col in text_columns:
         if col in df.columns:
-            df[col] = df[col].apply(clean_text)
+            df[col] = clean_text_series(df[col])
     logger.info(f"✅ Làm sạch {len([c for c in text_columns if c in df.columns])} cột text")
     
     # Parse boolean columns
@@ -171,22 +121,6 @@ def transform(df):
 
     return df
 
-def parse_numeric(value):
-    """Parse a single value into float, handling common NA markers and currency/commas."""
-    try:
-        if pd.isna(value):
-            return np.nan
-        sval = str(value).strip()
-        if sval.lower() in ['na', 'n/a', 'null', 'none', '']:
-            return np.nan
-        # Remove currency symbols and thousands separators, keep minus and dot
-        cleaned = re.sub(r"[^0-9\-\.]", "", sval)
-        if cleaned in ['', '-', '.']:
-            return np.nan
-        return float(cleaned)
-    except Exception:
-        return np.nan
-
 def clean_text(text):
     """Làm sạch text: normalize whitespace, handle NA"""
     if pd.isna(text) or text in ['NA', 'na', 'N/A', '', 'NULL', 'null']:
@@ -202,6 +136,17 @@ def clean_text(text):
     
     return text if text else 'Unknown'
 
+def clean_text_series(series):
+    """clean_text cho cả cột: mỗi giá trị khác nhau chỉ làm sạch một lần rồi map ngược lại.
+    Kết quả giống hệt series.apply(clean_text)."""
+    # factorize gộp 1 / 1.0 / True thành một nhóm nên chỉ dùng khi cột toàn chuỗi
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        return series.apply(clean_text)
+    codes, uniques = pd.factorize(series)
+    # Mã -1 (NaN/None) -> 'Unknown' ở vị trí cuối
+    lookup = np.array([clean_text(v) for v in uniques] + ['Unknown'], dtype=object)
+    return pd.Series(lookup[codes], index=series.index, name=series.name)
+
 def process_missing_values(df, numeric_cols_to_check):
     # Xác định cột cần impute (numeric columns với 0-95% missing)
     impute_cols = []
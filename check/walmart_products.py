@@ -1,74 +1,23 @@
 import pandas as pd
 import os
-from charset_normalizer import from_path
+import sys
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Dùng chung bộ đọc CSV với etl.py (csv_reader.py, không phải import cả etl.py): C engine, encoding cache, dòng hỏng ghi ra staging/bad_lines
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csv_reader import safe_read_csv  # noqa: E402
+
 def safe_read_walmart(file_path):
-    """Try several encodings and parser fallbacks to read a messy CSV.
+    """Read a messy CSV with the shared csv_reader.safe_read_csv.
 
+    Malformed lines are skipped by the C engine and quarantined to a sidecar file
+    instead of re-parsing the whole file with engine='python'.
     Returns a DataFrame or raises a RuntimeError with a helpful message.
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File does not exist: {file_path}")
-
-    # Try to detect encoding first
-    detected = None
-    try:
-        det = from_path(file_path)
-        best = det.best()
-        if best:
-            detected = best.encoding
-    except Exception:
-        detected = None
-
-    encodings_to_try = [
-        detected,
-        'utf-8', 'utf-8-sig',
-        'cp1252', 'windows-1252',
-        'latin1', 'iso-8859-1',
-    ]
-    encodings_to_try = [e for e in dict.fromkeys(encodings_to_try) if e]
-
-    # Try reading with the fast C engine first, then fallback to python engine
-    last_err = None
-    for enc in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=enc, low_memory=False)
-            print(f"Read success with encoding={enc} (C engine)")
-            return df
-        except UnicodeDecodeError as e:
-            last_err = e
-            # try next encoding
-            continue
-        except pd.errors.ParserError as e:
-            # Tokenization/parsing error with C engine — try python engine with permissive on_bad_lines
-            try:
-                df = pd.read_csv(file_path, encoding=enc, engine='python', on_bad_lines='warn')
-                print(f"Read success with encoding={enc} (python engine, on_bad_lines=warn)")
-                return df
-            except Exception as e2:
-                last_err = e2
-                continue
-        except Exception as e:
-            last_err = e
-            continue
-
-    # Final fallback: latin1 + python engine (will not fail on byte values but may produce mangled text)
-    try:
-        df = pd.read_csv(file_path, encoding='latin1', engine='python', on_bad_lines='warn')
-        print("Read success with fallback encoding=latin1 (python engine)")
-        # try to coerce text columns back to utf-8 where possible
-        for col in df.select_dtypes(include=['object']).columns:
-            try:
-                df[col] = df[col].astype(str).apply(lambda s: s.encode('latin1').decode('utf-8', errors='replace'))
-            except Exception:
-                pass
-        return df
-    except Exception as e:
-        raise RuntimeError(f"Cannot read file despite fallbacks: {file_path} | Last error: {last_err or e}")
+    return safe_read_csv(file_path)
 
 def transform(df):
     # Xử lý trùng lặp
@@ -116,24 +65,19 @@ def set_category(df, category_columns):
 def drop_low_null_products(df, root_category_column, value_columns, threshold=0.05):
     if root_category_column not in df.columns or not all(col in df.columns for col in value_columns):
         return df
-    categories_to_check = df[root_category_column].unique()
-
-    indices_to_drop = []
-    for category in categories_to_check:
-        cat_df = df[df[root_category_column] == category]
-        total_count = len(cat_df)
-
-        null_rows_mask = cat_df[value_columns].isna().any(axis=1)
-        null_rows = cat_df[null_rows_mask]
 
-        missing_count = len(null_rows)
-        if missing_count / total_count <= threshold or missing_count == len(cat_df):
-            indices_to_drop.extend(null_rows.index.tolist())
+    # Một lần groupby: số dòng rỗng và tổng số dòng của từng category, broadcast về từng dòng
+    null_rows_mask = df[value_columns].isna().any(axis=1)
+    grouped = null_rows_mask.groupby(df[root_category_column], observed=True, sort=False)
+    missing_count = grouped.transform('sum')
+    total_count = grouped.transform('size')
+    # Dòng có category rỗng không thuộc nhóm nào (NaN) nên được giữ lại
+    drop_mask = null_rows_mask & ((missing_count / total_count <= threshold) | (missing_count == total_count))
 
-    df.drop(indices_to_drop, inplace=True)
+    df.drop(df.index[drop_mask.to_numpy()], inplace=True)
 
     cols_str = ', '.join(value_columns)
-    logger.info(f"Đã loại bỏ {len(indices_to_drop)} sản phẩm có giá trị rỗng vượt quá {threshold*100}% trong cột '{cols_str}' theo '{root_category_column}'.")
+    logger.info(f"Đã loại bỏ {int(drop_mask.sum())} sản phẩm có giá trị rỗng vượt quá {threshold*100}% trong cột '{cols_str}' theo '{root_category_column}'.")
     return df
 
 # Hàm fill missing values bằng giá trị trung bình của category
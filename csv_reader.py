@@ -0,0 +1,363 @@
+"""
+Đọc CSV "bẩn": phát hiện encoding trên mẫu bytes (cache theo fingerprint của file) và đọc bằng
+C engine của pandas, dòng sai số cột bị bỏ qua và ghi nguyên văn ra sidecar <bảng>.bad_lines.csv.
+
+Chỉ phụ thuộc pandas + charset-normalizer (pyarrow tuỳ chọn) để các script kiểm tra trong check/
+dùng được mà không import cả etl.py (duckdb, sklearn, profiler, cấu hình logging).
+etl.py dùng chung safe_read_csv / collect_bad_lines / encoding cache cho extract, streaming và DuckDB.
+"""
+import codecs
+import csv
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import warnings
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+from charset_normalizer import from_bytes
+
+from csv_repair import repair_options
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow là tuỳ chọn, chỉ cần cho cột string Arrow
+    pa = None
+
+ENCODING_CACHE_PATH = './staging/encoding_cache.json'  # Cache encoding theo file (đặt None để tắt)
+ENCODING_SAMPLE_BLOCK_SIZE = 256 * 1024  # Kích thước mỗi block mẫu dùng để phát hiện encoding (bytes)
+ENCODING_SAMPLE_BLOCKS = 8  # Số block ngẫu nhiên lấy ở giữa file
+BAD_LINES_DIR = './staging/bad_lines'  # Dòng hỏng (sai số cột) bị bỏ qua lúc đọc được ghi nguyên văn vào <bảng>.bad_lines.csv (None = chỉ log)
+
+# Danh sách encoding ưu tiên thử (rất rộng)
+ENCODINGS_TO_TRY = [
+    'utf-8', 'utf-8-sig',
+    'cp1252', 'windows-1252',
+    'latin1', 'iso-8859-1',
+    'cp1250', 'cp1251', 'cp1253', 'cp1254', 'cp1255', 'cp1256',
+    'gb2312', 'gbk', 'big5',
+    'shift-jis', 'euc-jp', 'euc-kr',
+    'ascii'
+]
+
+logger = logging.getLogger(__name__)
+
+def table_name_for(file_path):
+    file_name = os.path.basename(file_path).split('.')[0]
+    table_name = re.sub(r"[^0-9a-zA-Z_]", "_", file_name)
+    if re.match(r"^[0-9]", table_name):
+        table_name = "t_" + table_name
+    return table_name
+
+# ==================== ENCODING ====================
+def _read_sample_blocks(file_path, block_size=None, n_blocks=None):
+    """Đọc mẫu bytes giới hạn của file: block đầu, vài block ngẫu nhiên ở giữa và block cuối.
+
+    Các block giữa/cuối bắt đầu sau ký tự xuống dòng đầu tiên để không cắt ngang
+    một ký tự nhiều byte. Vị trí ngẫu nhiên được seed theo kích thước file nên
+    cùng một file luôn cho cùng một mẫu.
+    """
+    block_size = block_size or ENCODING_SAMPLE_BLOCK_SIZE
+    n_blocks = ENCODING_SAMPLE_BLOCKS if n_blocks is None else n_blocks
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if file_size <= block_size * (n_blocks + 2):
+            return [f.read()]
+
+        blocks = [f.read(block_size)]
+        rng = random.Random(file_size)
+        offsets = sorted(rng.randrange(block_size, file_size - 2 * block_size) for _ in range(n_blocks))
+        offsets.append(file_size - block_size)
+        for offset in offsets:
+            f.seek(offset)
+            block = f.read(block_size)
+            newline = block.find(b'\n')
+            if newline != -1:
+                block = block[newline + 1:]
+            blocks.append(block)
+    return blocks
+
+def _sample_fingerprint(file_path, blocks):
+    """Fingerprint của file gồm kích thước, mtime và hash nội dung của mẫu (không hash toàn bộ file)."""
+    stat = os.stat(file_path)
+    digest = hashlib.sha1()
+    for block in blocks:
+        digest.update(block)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': digest.hexdigest()}
+
+def _decodes_sample(blocks, encoding):
+    """Kiểm tra encoding bằng cách chỉ decode mẫu; byte cuối block bị cắt dở không bị tính là lỗi."""
+    try:
+        for block in blocks:
+            codecs.getincrementaldecoder(encoding)().decode(block, final=False)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+def _load_encoding_cache():
+    if not ENCODING_CACHE_PATH or not os.path.exists(ENCODING_CACHE_PATH):
+        return {}
+    try:
+        with open(ENCODING_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Không đọc được encoding cache {ENCODING_CACHE_PATH}: {e}")
+        return {}
+
+def _save_encoding_cache(cache):
+    if not ENCODING_CACHE_PATH:
+        return
+    try:
+        os.makedirs(os.path.dirname(ENCODING_CACHE_PATH) or '.', exist_ok=True)
+        # Ghi file tạm rồi thay thế để không ai đọc được cache ghi dở
+        tmp_path = f"{ENCODING_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, ENCODING_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Không ghi được encoding cache {ENCODING_CACHE_PATH}: {e}")
+
+def detect_encoding_candidates(file_path, blocks):
+    """Trả về danh sách encoding decode được mẫu, encoding phát hiện tự động đứng đầu."""
+    # 1. Phát hiện encoding bằng charset-normalizer trên mẫu
+    try:
+        best = from_bytes(b''.join(blocks), cp_isolation=None).best()
+        if not best:
+            raise ValueError("Không phát hiện được encoding")
+        detected_encoding = best.encoding
+        # Độ tin cậy = 1 - chaos (tỉ lệ ký tự "lộn xộn" sau decode); coherence chỉ đo độ khớp ngôn ngữ,
+        # bằng 0 với file ASCII thuần
+        logger.info(f"Phát hiện encoding: {detected_encoding} (độ tin cậy: {1 - best.chaos:.2f}, "
+                    f"coherence: {best.coherence:.2f}) cho file: {file_path}")
+    except Exception as e:
+        logger.warning(f"Không thể phát hiện encoding tự động: {e}. Dùng fallback.")
+        detected_encoding = None
+
+    # 2. Loại bỏ None, trùng lặp và các encoding không decode được mẫu
+    encodings = list(dict.fromkeys([e for e in [detected_encoding] + ENCODINGS_TO_TRY if e]))
+    candidates = [enc for enc in encodings if _decodes_sample(blocks, enc)]
+    logger.debug(f"Encoding decode được mẫu: {candidates}")
+    return candidates
+
+def encoding_candidates(file_path, measure=None):
+    """Sinh các encoding nên thử: encoding đã cache (nếu file không đổi) rồi tới các encoding decode được mẫu.
+
+    Là generator nên bước phát hiện trên mẫu chỉ chạy khi encoding đã cache không dùng được.
+    measure(bytes_in): context manager tuỳ chọn bọc bước phát hiện (vd. đo bộ nhớ trong etl.py).
+    """
+    blocks = _read_sample_blocks(file_path)
+    fingerprint = _sample_fingerprint(file_path, blocks)
+    _sample_fingerprints[os.path.abspath(file_path)] = fingerprint
+    cached = _load_encoding_cache().get(os.path.abspath(file_path))
+
+    # 1. Dùng encoding đã cache nếu file không đổi
+    cached_encoding = None
+    if cached and all(cached.get(k) == v for k, v in fingerprint.items()):
+        cached_encoding = cached['encoding']
+        logger.info(f"Dùng encoding đã cache: {cached_encoding} cho file: {file_path}")
+        yield cached_encoding
+
+    # 2. Ngược lại (hoặc cache không còn đúng) phát hiện trên mẫu
+    with measure(sum(len(b) for b in blocks)) if measure else nullcontext():
+        candidates = detect_encoding_candidates(file_path, blocks)
+    for enc in candidates:
+        if enc != cached_encoding:
+            yield enc
+
+_deferred_encodings = None
+# Fingerprint tính lúc phát hiện encoding (encoding_candidates), remember_encoding dùng lại
+_sample_fingerprints = {}
+
+@contextmanager
+def defer_encoding_cache():
+    """Gom encoding đã đọc thành công trong khối with thay vì ghi cache ngay; yield dict
+    {đường dẫn tuyệt đối: fingerprint + encoding}.
+
+    Dùng trong process worker: process chính ghi cache một lần bằng save_encodings, nên các
+    worker không cùng đọc - sửa - ghi đè file cache.
+    """
+    global _deferred_encodings
+    previous, _deferred_encodings = _deferred_encodings, {}
+    try:
+        yield _deferred_encodings
+    finally:
+        _deferred_encodings = previous
+
+def save_encodings(entries):
+    """Gộp các entry {đường dẫn tuyệt đối: fingerprint + encoding} vào cache, chỉ ghi khi có thay đổi."""
+    cache = _load_encoding_cache()
+    changed = {path: entry for path, entry in entries.items() if cache.get(path) != entry}
+    if changed:
+        cache.update(changed)
+        _save_encoding_cache(cache)
+
+def remember_encoding(file_path, encoding):
+    """Ghi encoding đã đọc thành công vào cache theo fingerprint của file.
+
+    Dùng fingerprint đã tính ở encoding_candidates (không đọc lại mẫu); chỉ tính lại nếu file
+    chưa đi qua encoding_candidates.
+    """
+    path = os.path.abspath(file_path)
+    fingerprint = _sample_fingerprints.pop(path, None) or _sample_fingerprint(file_path, _read_sample_blocks(file_path))
+    entry = {path: dict(fingerprint, encoding=encoding)}
+    if _deferred_encodings is not None:
+        _deferred_encodings.update(entry)
+    else:
+        save_encodings(entry)
+
+# ==================== STRING ARROW ====================
+def string_dtype():
+    """dtype string Arrow, giá trị thiếu là NaN như cột object."""
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        return pd.StringDtype('pyarrow')
+
+@contextmanager
+def string_inference(enabled):
+    """Khi enabled (và có pyarrow), read_csv tạo thẳng cột string Arrow thay vì object Python."""
+    try:
+        pd.get_option('future.infer_string')
+    except (KeyError, pd.errors.OptionError):
+        yield
+        return
+    if not enabled or pa is None:
+        yield
+        return
+    with pd.option_context('future.infer_string', True):
+        yield
+
+def to_arrow_strings(df):
+    """Chuyển (tại chỗ) các cột object chỉ chứa chuỗi sang string Arrow."""
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            df[col] = df[col].astype(string_dtype())
+    return df
+
+# ==================== DÒNG HỎNG ====================
+BAD_LINE_RE = re.compile(r'Skipping line (\d+): (.*)')
+
+def write_bad_lines(file_path, table_name, rows):
+    """Ghi các dòng hỏng (số dòng, lỗi, nội dung gốc) ra <BAD_LINES_DIR>/<bảng>.bad_lines.csv.
+
+    Không có dòng hỏng thì xoá file của lần đọc trước (nếu có).
+    """
+    path = os.path.join(BAD_LINES_DIR, f"{table_name}.bad_lines.csv") if BAD_LINES_DIR else None
+    if not rows:
+        if path and os.path.exists(path):
+            os.remove(path)
+        return
+    if path:
+        os.makedirs(BAD_LINES_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'error', 'raw'])
+            writer.writerows(rows)
+    logger.warning(f"Bảng '{table_name}': bỏ qua {len(rows):,} dòng hỏng trong {file_path}"
+                   + (f", đã ghi vào {path}" if path else ""))
+
+def _raw_records(file_path, encoding, numbers):
+    """Nội dung gốc của các bản ghi có số thứ tự trong numbers (đánh số như C engine của pandas:
+    từ 1, tính cả header và dòng trống).
+
+    Chỉ đếm dấu ngoặc kép trên từng dòng vật lý để biết dòng xuống nằm trong một trường
+    quoted hay kết thúc bản ghi, không parse trường nên nhanh hơn nhiều so với đọc lại bằng
+    engine='python'. Dừng ngay khi đã lấy đủ.
+    """
+    wanted = set(numbers)
+    records, parts, in_quote, number = {}, [], False, 1
+    with open(file_path, 'rb') as f:
+        for line in f:
+            if number in wanted:
+                parts.append(line)
+            in_quote ^= line.count(b'"') % 2 == 1
+            if in_quote:
+                continue
+            if parts:
+                records[number] = b''.join(parts).rstrip(b'\r\n').decode(encoding, errors='replace')
+                parts = []
+                if len(records) == len(wanted):
+                    break
+            number += 1
+    return records
+
+@contextmanager
+def collect_bad_lines(file_path, encoding, table_name=None):
+    """Dùng quanh pd.read_csv(..., on_bad_lines='warn') với C engine.
+
+    Gom số dòng bị bỏ qua từ ParserWarning, đọc xong (không lỗi) thì lấy nội dung gốc của
+    chỉ những dòng đó và ghi ra sidecar (write_bad_lines) thay vì đọc lại cả file bằng
+    engine='python'. Cảnh báo khác bắt được trong lúc đọc được phát lại như cũ.
+    Lưu ý: khi đọc với usecols, pandas cắt bớt cột thừa thay vì báo dòng hỏng.
+    """
+    bad_lines = {}
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', pd.errors.ParserWarning)
+            yield
+    finally:
+        for w in caught:
+            matches = BAD_LINE_RE.findall(str(w.message)) if issubclass(w.category, pd.errors.ParserWarning) else []
+            if not matches:
+                warnings.showwarning(w.message, w.category, w.filename, w.lineno)
+            bad_lines.update((int(number), error) for number, error in matches)
+    raw = _raw_records(file_path, encoding, bad_lines) if bad_lines else {}
+    write_bad_lines(file_path, table_name or table_name_for(file_path),
+                    [(number, error, raw.get(number)) for number, error in sorted(bad_lines.items())])
+
+# ==================== ĐỌC CSV ====================
+def safe_read_csv(file_path, repair_columns=False, arrow_strings=False, encodings=None, **kwargs):
+    """
+    Đọc CSV an toàn 100% với bất kỳ encoding nào.
+    Encoding được phát hiện trên mẫu bytes giới hạn và cache theo (size, mtime, hash)
+    nên file không đổi sẽ bỏ qua bước phát hiện.
+    Luôn đọc bằng C engine; dòng sai số cột bị bỏ qua và ghi ra sidecar (collect_bad_lines),
+    hoặc được cắt / bù về số cột của header nếu repair_columns (repair_options).
+    arrow_strings: cột text dạng string Arrow (cần pyarrow). encodings: các encoding thử lần
+    lượt (mặc định encoding_candidates(file_path)).
+    Trả về DataFrame hoặc raise lỗi rõ ràng.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File không tồn tại: {file_path}")
+    kwargs.setdefault('on_bad_lines', 'warn')
+    arrow_strings = arrow_strings and pa is not None
+
+    # Đọc toàn bộ file chỉ với các encoding đã qua kiểm tra trên mẫu
+    for enc in encoding_candidates(file_path) if encodings is None else encodings:
+        try:
+            options = dict(kwargs, **repair_options(file_path, enc, kwargs.get('usecols'))) if repair_columns else kwargs
+            with string_inference(arrow_strings), collect_bad_lines(file_path, enc):
+                df = pd.read_csv(file_path, encoding=enc, low_memory=False, **options)
+            if arrow_strings:
+                to_arrow_strings(df)
+            logger.info(f"Đọc thành công với encoding: {enc}")
+            remember_encoding(file_path, enc)
+            return df
+        except UnicodeDecodeError:
+            logger.debug(f"Thất bại với encoding: {enc}")
+            continue
+        except pd.errors.ParserError as e:
+            # Lỗi cấu trúc (vd. ngoặc kép không đóng tới cuối file), đổi encoding không giúp được
+            raise RuntimeError(f"Không thể parse file: {file_path} | Lỗi: {e}") from e
+        except Exception as e:
+            logger.debug(f"Lỗi khác với {enc}: {e}")
+            continue
+
+    # Fallback cuối cùng: Đọc bằng 'latin1' (đọc được mọi byte, không crash)
+    logger.warning(f"Dùng fallback 'latin1' cho file: {file_path}")
+    try:
+        options = dict(kwargs, **repair_options(file_path, 'latin1', kwargs.get('usecols'))) if repair_columns else kwargs
+        with string_inference(arrow_strings), collect_bad_lines(file_path, 'latin1'):
+            df = pd.read_csv(file_path, encoding='latin1', low_memory=False, **options)
+        # Cố gắng chuyển về UTF-8 nếu có thể
+        df = df.apply(lambda x: x.str.encode('latin1').str.decode('utf-8', errors='replace')
+                      if x.dtype == "object" or isinstance(x.dtype, pd.StringDtype) else x)
+        if arrow_strings:
+            to_arrow_strings(df)
+        return df
+    except Exception as e:
+        raise RuntimeError(f"Không thể đọc file dù đã thử mọi cách: {file_path} | Lỗi: {e}")
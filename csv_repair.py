@@ -0,0 +1,44 @@
+"""
+Đọc CSV có dòng sai số trường so với header (vd. marketing_data: 29 trường dữ liệu, header 28 cột)
+bằng C engine của pandas: trường thừa bị cắt, dòng thiếu được bù ngay lúc parse.
+
+Chỉ phụ thuộc csv + pandas để script độc lập (Preprocess_marketing_data.py) dùng được mà không
+import cả etl.py; etl.py dùng chung csv_header / repair_options cho extract, streaming và DuckDB.
+"""
+import csv
+
+import pandas as pd
+
+
+def csv_header(file_path, encoding):
+    """Tên các cột trong header (bản ghi đầu tiên) của file."""
+    with open(file_path, 'r', encoding=encoding, newline='') as f:
+        header = next(csv.reader(f), [])
+    if header and header[0].startswith('\ufeff'):
+        header[0] = header[0][1:]
+    return header
+
+def repair_options(file_path, encoding, usecols=None):
+    """Tham số pd.read_csv cắt / bù mọi dòng về đúng số cột của header ngay trong C engine.
+
+    usecols theo vị trí + names của đúng các cột đó: trường thừa (vd. dòng 29 trường với header
+    28 cột) bị bỏ lúc parse, dòng thiếu trường được bù ô rỗng, kể cả khi cả chunk đều thừa / thiếu.
+    Ô bù là NaN như ô rỗng trong file (hoặc '' với keep_default_na=False / na_filter=False):
+    C engine không phân biệt ô bù với ô rỗng thật.
+    Không dựng list Python cho từng dòng nên dùng được cả với chunksize. usecols (list hoặc
+    callable) của bảng vẫn được áp dụng. (names dài hơn header hay usecols dạng callable đều
+    làm pandas lỗi hoặc lệch cột khi dòng đầu tiên thừa trường.)
+    """
+    header = csv_header(file_path, encoding)
+    if callable(usecols):
+        positions = [i for i, c in enumerate(header) if usecols(c)]
+    elif usecols is not None:
+        positions = [i for i, c in enumerate(header) if c in set(usecols)]
+    else:
+        positions = list(range(len(header)))
+    return {'names': [header[i] for i in positions], 'header': 0, 'usecols': positions}
+
+def read_csv_repaired(file_path, encoding='utf-8', **kwargs):
+    """pd.read_csv với repair_options (kwargs khác truyền thẳng cho read_csv, usecols theo tên cột)."""
+    options = dict(kwargs, **repair_options(file_path, encoding, kwargs.get('usecols')))
+    return pd.read_csv(file_path, encoding=encoding, **options)
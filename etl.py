@@ -1,203 +1,521 @@
 import duckdb
 import pandas as pd
-from charset_normalizer import from_path
 import glob
+import codecs
+import argparse
+import cProfile
+import hashlib
+import json
+import random
 import logging
 import os
+import queue
 import re
+import shutil
+import threading
+import time
 import numpy as np
+import joblib
+import sklearn
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import KNNImputer, IterativeImputer
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from etl_profiler import StackSampler, PeakAllocationTracer, cprofile_summary
+import csv_reader
+from csv_reader import (collect_bad_lines, defer_encoding_cache, remember_encoding, save_encodings, string_dtype,
+                        string_inference, table_name_for, to_arrow_strings, write_bad_lines)
+from csv_repair import csv_header, repair_options
+from numeric_parsing import parse_numeric, parse_numeric_series
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow là tuỳ chọn, không có thì chuyển DataFrame giữa các process
+    pa = None
 
 
 
 SOURCE_DIR = './data/Raw'  # Thư mục chứa file CSV
 CLEAN_DIR = './data/Clean'  # Thư mục lưu file CSV đã làm sạch
+CLEAN_FORMAT = 'csv'  # 'csv' (một file UTF-8) hoặc 'parquet' (nén, giữ schema, chia partition theo partition_by của bảng)
+PARQUET_COMPRESSION = 'zstd'
 DATABASE_PATH = './staging/staging.db'     # File path DuckDB cho staging (có thể dùng ':memory:' cho in-memory)
 OVERWRITE_TABLES = False
+INCREMENTAL = True  # Bỏ qua file nguồn không đổi (theo manifest), thay bảng của file đã đổi
+MANIFEST_TABLE = 'etl_manifest'  # Bảng manifest file nguồn trong staging.db
+MERGE_LOADS = True  # Bảng đã có: upsert theo merge_keys trong một transaction (OVERWRITE_TABLES=True vẫn thay cả bảng)
+CATEGORY_ENUMS = True  # Lưu cột category dạng ENUM của DuckDB, mã ổn định giữa các lần chạy
+CATEGORY_DICTIONARY_TABLE = 'etl_category_dictionaries'  # Từ điển (bảng, cột, mã, giá trị) của các cột ENUM
+TRANSFORM_VERSION = '3'  # Tăng khi logic transform thay đổi để chạy lại mọi file
 DATE_FORMAT = '%m-%d-%y'
+# Encoding (cache, mẫu phát hiện) và dòng hỏng (BAD_LINES_DIR): cấu hình trong csv_reader.py
+STREAMING = False  # Bật chế độ streaming: đọc/transform/load từng chunk với bộ nhớ giới hạn
+CHUNK_SIZE = 100_000  # Số dòng mỗi chunk khi streaming
+ETL_ROW_ID = '__etl_row_id'  # Cột thứ tự dòng gốc dùng nội bộ khi streaming
+PARTITION_VALUES_ATTR = 'etl_partition_values'  # df.attrs: cột partition bị drop_low_value_columns loại, chỉ dùng khi lưu Parquet
+OUTLIER_QUANTILES = 'exact'  # Streaming: 'exact' (quantile_cont trong DuckDB) hoặc 'sketch' (KLL sketch gộp theo batch)
+QUANTILE_SKETCH_K = 1000  # Độ chính xác của KLL sketch (lớn hơn = chính xác hơn, tốn bộ nhớ hơn)
+WORKERS = 1  # Số process extract + transform song song (mỗi file một process)
+PIPELINE = True  # Lưu file sạch và load DuckDB ở thread nền trong khi extract + transform file tiếp theo
+PIPELINE_QUEUE_SIZE = 2  # Số bảng đã transform tối đa chờ lưu/load (giới hạn bộ nhớ)
+ENGINE = 'pandas'  # 'pandas' hoặc 'duckdb' (đọc CSV song song và transform bằng SQL trong DuckDB)
+TEXT_CLEAN_WORKERS = 1  # Số process làm sạch cột text dài (Specifications); 1 = chạy tuần tự
+TEXT_CLEAN_PARALLEL_MIN = 50_000  # Chỉ chia process khi số giá trị khác nhau của cột vượt ngưỡng này
+# Các chuỗi được coi là NA (giống mặc định của pandas.read_csv)
+PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# Kiểu read_csv của DuckDB được phép suy ra: như pandas.read_csv (không tự nhận ngày giờ)
+DUCKDB_TYPE_CANDIDATES = ['BOOLEAN', 'BIGINT', 'DOUBLE', 'VARCHAR']
+
+# Cấu hình cột cho từng bảng
+MARKETING_NUMERIC_COLUMNS = ['Price', 'Monthly Price', 'Num Of Reviews', 'Average Rating', 'Number Of Ratings',
+                             'Five Star', 'Four Star', 'Three Star', 'Two Star', 'One Star']
+MARKETING_TEXT_COLUMNS = ['Title', 'Manufacturer', 'Model Name', 'Carrier', 'Color Category', 'Internal Memory', 'Screen Size', 'Specifications']
+MARKETING_LONG_TEXT_COLUMNS = ['Specifications']  # Cột text dài, gần như mỗi dòng một giá trị khác nhau
+MARKETING_BOOL_COLUMNS = ['Stock', 'Discontinued', 'Broken Link']
+# Nhóm giá / rating của feature_engineering; thứ tự nhãn là thứ tự của ENUM khi load
+PRICE_RANGE_BINS = [0, 50, 100, 200, 500, float('inf')]
+PRICE_RANGE_LABELS = ['Budget', 'Mid', 'Premium', 'High-end', 'Luxury']
+RATING_QUALITY_BINS = [0, 2, 3, 4, 5]
+RATING_QUALITY_LABELS = ['Poor', 'Fair', 'Good', 'Excellent']
+MARKETING_IMPUTE_COLUMNS = ['Price', 'Monthly Price', 'Average Rating', 'Num Of Reviews',
+                            'Number Of Ratings', 'Five Star', 'Four Star', 'Three Star',
+                            'Two Star', 'One Star']
+MARKETING_OUTLIER_COLUMNS = ['Price', 'Monthly Price', 'Average Rating', 'Num Of Reviews', 'Number Of Ratings']
+# Impute quy mô lớn (xem docstring smart_impute_numeric về đánh đổi độ chính xác / tốc độ)
+IMPUTE_PARTITION_COLUMN = 'Manufacturer'  # Cột chia khối khi tìm láng giềng KNN (None = không chia)
+IMPUTE_PARTITION_MIN_ROWS = 100_000  # Chỉ chia khối khi bảng lớn hơn ngưỡng này; nhỏ hơn thì KNN trên toàn bảng
+IMPUTE_MIN_GROUP_ROWS = 50  # Khối nhỏ hơn (hoặc key rỗng) được impute chung bằng KNN toàn bảng
+IMPUTE_KNN_MAX_DONORS = 100_000  # Số dòng tối đa làm tập láng giềng của mỗi khối KNN (lấy mẫu ngẫu nhiên)
+IMPUTE_MICE_MAX_SAMPLES = 100_000  # Số dòng tối đa dùng để fit IterativeImputer (None = toàn bảng)
+IMPUTE_BATCH_SIZE = 10_000  # Số dòng mỗi lần transform để giới hạn bộ nhớ
+IMPUTE_WORKING_MEMORY_MB = 16  # Bộ nhớ tối đa (MB) cho mỗi khối ma trận khoảng cách KNN của sklearn
+IMPUTE_RANDOM_STATE = 42
+IMPUTER_STORE_DIR = None  # Tuỳ chọn, vd. './staging/imputers': lưu imputer đã fit để batch sau chỉ transform (None = luôn fit lại)
+IMPUTER_DRIFT_THRESHOLD = 0.5  # Fit lại khi mean một cột lệch quá (ngưỡng × độ lệch chuẩn lúc fit)
+REFIT_IMPUTERS = False  # True: xoá imputer đã lưu và fit lại ở lần chạy này
+COPY_FREE = False  # Impute / feature sửa DataFrame tại chỗ thay vì copy (giảm bộ nhớ đỉnh; dedup và drop cột vẫn copy, xem transform_data)
+MEMORY_REPORT = False  # Log RSS trước/sau và RSS đỉnh của từng bước transform
+METRICS_TABLE = 'etl_run_metrics'  # Bảng trong staging.db lưu thời gian, CPU, RSS, số dòng, bytes từng bước của mỗi lần chạy (None = tắt)
+METRICS_LOG_PATH = None  # File JSON lines ghi thêm các bản ghi đó, vd. './staging/etl_metrics.jsonl' (None = tắt)
+ARROW_STRINGS = False  # Giữ cột text dạng string Arrow (cần pyarrow) từ lúc đọc, qua làm sạch, tới lúc load DuckDB
+PROFILE_DIR = None  # Tuỳ chọn, vd. './staging/profiles': lưu ColumnProfile của bảng sau transform, mỗi lần chạy một thư mục (None = tắt)
+# Profile hiệu năng từng bảng của run_etl (python etl.py --profile), xem profile_section
+PROFILER = None  # 'cprofile' (tất định, đếm mọi lời gọi hàm), 'sample' (lấy mẫu stack, chi phí thấp) hoặc None = tắt
+PROFILE_MEMORY = False  # Trace cấp phát bằng tracemalloc, quy bộ nhớ lúc đỉnh về từng dòng code trong etl.py
+PROFILE_TOP_N = 20  # Số hàm / dòng nóng nhất ghi vào log
+PROFILE_SAMPLE_INTERVAL = 0.005  # Giây giữa hai lần lấy mẫu stack
+PROFILER_DIR = './staging/profiler'  # Lưu kết quả profile, mỗi lần chạy một thư mục theo run id
+PRODUCTS_FILTER_COLUMNS = ['product_id','product_name','brand','final_price','initial_price','discount','review_count','rating','category_name','root_category_name','available_for_delivery', 'available_for_pickup']
+PRODUCTS_CATEGORY_FEATURES = ['brand', 'category_name', 'root_category_name', 'available_for_delivery', 'available_for_pickup']
+PRODUCTS_VALUE_COLUMNS = ['initial_price', 'discount']
+API_KEY_COLUMNS = ['fetch_time', 'us_item_id', 'product_id']
+API_KEEP_COLUMNS = ['title', 'rating', 'reviews', 'seller_name', 'query', 'price_per_unit', 'two_day_shipping', 'free_shipping', 'free_shipping_with_walmart_plus', 'out_of_stock']
+
+# Khai báo transform của từng bảng dưới dạng dữ liệu, compile_plan biên dịch thành TransformPlan
+# dùng chung cho engine pandas, streaming và DuckDB. Bảng không khai báo chỉ được loại duplicate.
+# Các khoá (đều không bắt buộc):
+#   read_columns / read_dtypes: cột và kiểu đẩy xuống bước đọc CSV (usecols / dtype)
+#   repair_columns: True để cắt / bù mọi dòng về đúng số cột của header ngay lúc đọc (vd. dữ liệu
+#                   29 trường với header 28 cột) thay vì coi là dòng hỏng, xem repair_options
+#   keep_columns: chỉ giữ các cột này sau khi đọc
+#   numeric_columns / text_columns / bool_columns / category_columns / currency_columns: kiểu từng cột
+#   long_text_columns: cột text dài, làm sạch song song với TEXT_CLEAN_WORKERS process
+#   derived_category_columns: {cột: nhãn theo thứ tự} của cột category có thứ tự do bước features tạo ra
+#                             (load thành ENUM theo đúng thứ tự nhãn); category_columns không có thứ tự,
+#                             giá trị được thêm vào ENUM theo thứ tự xuất hiện
+#   date_columns: {cột: {'format': ..., 'parts': {cột mới: year | month | day | dayofweek | day_name}}}
+#   dedup_keys / dedup_order: giữ bản ghi cuối (theo dedup_order) của mỗi key, dùng key đầu tiên có trong bảng
+#   merge_keys: key (tên cột nguồn) để upsert vào bảng đã có, mặc định là key của dedup_keys;
+#               các cột này không bị drop_low_value_columns loại bỏ
+#   partition_by: cột chia partition (thư mục col=value) khi lưu file sạch dạng Parquet; cột bị
+#                 drop_low_value_columns loại vẫn được dùng để chia partition (lấy từ bảng trước
+#                 khi drop), bảng load vào DuckDB giống nhau với mọi CLEAN_FORMAT
+#   impute: {'method': 'smart', 'columns': [...]} (KNN/MICE/median, xem smart_impute_numeric) hoặc
+#           {'method': 'category_mean', 'by': cột category, 'columns': [...], 'drop_threshold': ...}
+#   outliers: {'columns': [...]}
+#   features: tên hàm tạo feature trong module, nhận (df, inplace)
+#   drop_low_value_columns / normalize_column_names: True để chạy bước tương ứng
+TABLE_SPECS = {
+    'walmart_products': {
+        'read_columns': PRODUCTS_FILTER_COLUMNS,
+        'read_dtypes': {'brand': 'category', 'category_name': 'category', 'root_category_name': 'category'},
+        'keep_columns': PRODUCTS_FILTER_COLUMNS,
+        'category_columns': PRODUCTS_CATEGORY_FEATURES,
+        'currency_columns': ['discount'],
+        'merge_keys': ['product_id'],
+        'partition_by': ['root_category_name'],
+        'impute': {'method': 'category_mean', 'by': 'root_category_name', 'columns': PRODUCTS_VALUE_COLUMNS,
+                   'drop_threshold': 0.05},
+    },
+    'cleaned_products_api': {
+        'read_columns': API_KEY_COLUMNS + API_KEEP_COLUMNS,
+        'keep_columns': API_KEY_COLUMNS + API_KEEP_COLUMNS,
+        'dedup_keys': ['us_item_id', 'product_id'],
+        'dedup_order': 'fetch_time',
+    },
+    'marketing_data': {
+        'repair_columns': True,
+        'numeric_columns': MARKETING_NUMERIC_COLUMNS,
+        'text_columns': MARKETING_TEXT_COLUMNS,
+        'long_text_columns': MARKETING_LONG_TEXT_COLUMNS,
+        'bool_columns': MARKETING_BOOL_COLUMNS,
+        'date_columns': {'Crawl Timestamp': {'format': '%Y-%m-%d %H:%M:%S %z', 'parts': {
+            'crawl_year': 'year', 'crawl_month': 'month', 'crawl_day': 'day', 'crawl_dayofweek': 'dayofweek'}}},
+        'impute': {'method': 'smart', 'columns': MARKETING_IMPUTE_COLUMNS},
+        'outliers': {'columns': MARKETING_OUTLIER_COLUMNS},
+        'merge_keys': ['Uniq Id'],
+        'partition_by': ['crawl_year', 'crawl_month'],
+        'features': 'feature_engineering',
+        'derived_category_columns': {'price_range': PRICE_RANGE_LABELS, 'rating_quality': RATING_QUALITY_LABELS},
+        'drop_low_value_columns': True,
+        'normalize_column_names': True,
+    },
+    'walmart_customers_purchases': {
+        'date_columns': {'Purchase_Date': {'format': DATE_FORMAT, 'parts': {
+            'Year': 'year', 'Month': 'month', 'DayOfWeek': 'day_name'}}},
+        'merge_keys': ['Customer_ID', 'Product_Name', 'Purchase_Date'],
+        'partition_by': ['Year', 'Month'],
+    },
+}
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def safe_read_csv(file_path, **kwargs):
-    """
-    Đọc CSV an toàn 100% với bất kỳ encoding nào.
-    Trả về DataFrame hoặc raise lỗi rõ ràng.
-    """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File không tồn tại: {file_path}")
+# ==================== STRING ARROW ====================
+def arrow_strings_enabled():
+    return ARROW_STRINGS and pa is not None
 
-    # 1. Phát hiện encoding chính xác bằng charset-normalizer
+# ==================== ĐỌC CSV ====================
+def encoding_candidates(file_path):
+    """csv_reader.encoding_candidates, bước phát hiện encoding trên mẫu được đo như một memory_stage."""
+    table_name = table_name_for(file_path)
+    return csv_reader.encoding_candidates(
+        file_path, lambda bytes_in: memory_stage('detect_encoding', table_name, bytes_in=bytes_in))
+
+def safe_read_csv(file_path, repair_columns=False, **kwargs):
+    """csv_reader.safe_read_csv theo cấu hình của etl.py (ARROW_STRINGS, đo bước phát hiện encoding)."""
+    return csv_reader.safe_read_csv(file_path, repair_columns=repair_columns, arrow_strings=arrow_strings_enabled(),
+                                    encodings=encoding_candidates(file_path), **kwargs)
+
+def read_options(table_name):
+    """Tham số usecols/dtype cho pd.read_csv theo khai báo của bảng (cột không có trong file bị bỏ qua)."""
+    spec = TABLE_SPECS.get(table_name, {})
+    options = {}
+    if spec.get('read_columns'):
+        options['usecols'] = set(spec['read_columns']).__contains__
+    if spec.get('read_dtypes'):
+        options['dtype'] = spec['read_dtypes']
+    return options
+
+# Hàm Extract
+def extract_csv(file_path, table_name=None):
+    """Extract: Đọc dữ liệu từ một file CSV, chỉ các cột (và kiểu) bảng table_name cần."""
+    repair_columns = TABLE_SPECS.get(table_name, {}).get('repair_columns', False)
+    return safe_read_csv(file_path, repair_columns=repair_columns, **read_options(table_name))
+
+# ==================== ĐO BỘ NHỚ ====================
+def _proc_status_mb(field):
+    """Giá trị (MB) của một trường trong /proc/self/status (VmRSS, VmHWM), None nếu không có."""
     try:
-        detection = from_path(file_path, cp_isolation=None)  # Không giới hạn
-        best = detection.best()
-        if not best:
-            raise ValueError("Không phát hiện được encoding")
-        detected_encoding = best.encoding
-        confidence = best.confidence  # Độ tin cậy (0.0 - 1.0)
-        logger.info(f"Phát hiện encoding: {detected_encoding} (độ tin cậy: {confidence:.2f}) cho file: {file_path}")
-    except Exception as e:
-        logger.warning(f"Không thể phát hiện encoding tự động: {e}. Dùng fallback.")
-        detected_encoding = None
-
-    # 2. Danh sách encoding ưu tiên thử (rất rộng)
-    encodings_to_try = [
-        detected_encoding,           # Ưu tiên phát hiện tự động
-        'utf-8', 'utf-8-sig',
-        'cp1252', 'windows-1252',
-        'latin1', 'iso-8859-1',
-        'cp1250', 'cp1251', 'cp1253', 'cp1254', 'cp1255', 'cp1256',
-        'gb2312', 'gbk', 'big5',
-        'shift-jis', 'euc-jp', 'euc-kr',
-        'ascii'
-    ]
-    # Loại bỏ None và trùng lặp
-    encodings_to_try = list(dict.fromkeys([e for e in encodings_to_try if e]))
-
-    # 3. Thử đọc với từng encoding
-    for enc in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=enc, low_memory=False, **kwargs)
-            logger.info(f"Đọc thành công với encoding: {enc}")
-            return df
-        except UnicodeDecodeError:
-            logger.debug(f"Thất bại với encoding: {enc}")
-            continue
-        except Exception as e:
-            logger.debug(f"Lỗi khác với {enc}: {e}")
-            continue
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
 
-    # 4. Fallback cuối cùng: Đọc bằng 'latin1' (đọc được mọi byte, không crash)
-    logger.warning(f"Dùng fallback 'latin1' cho file: {file_path}")
+def _reset_peak_rss():
+    """Đặt lại RSS đỉnh (VmHWM) của process về RSS hiện tại (Linux)."""
     try:
-        df = pd.read_csv(file_path, encoding='latin1', low_memory=False, **kwargs)
-        # Cố gắng chuyển về UTF-8 nếu có thể
-        df = df.apply(lambda x: x.str.encode('latin1').str.decode('utf-8', errors='replace') if x.dtype == "object" else x)
-        return df
-    except Exception as e:
-        raise RuntimeError(f"Không thể đọc file dù đã thử mọi cách: {file_path} | Lỗi: {e}")
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
 
-# Hàm Extract
-def extract_csv(file_path):
-    """Extract: Đọc dữ liệu từ một file CSV."""
-    return safe_read_csv(file_path)
+# Bản ghi memory_stage của lần chạy hiện tại (None = không thu thập), xem collect_stage_metrics
+_stage_metrics = None
+
+@contextmanager
+def collect_stage_metrics():
+    """Thu thập bản ghi của mọi memory_stage trong khối with (kể cả ở thread nền); yield list bản ghi."""
+    global _stage_metrics
+    previous, _stage_metrics = _stage_metrics, []
+    try:
+        yield _stage_metrics
+    finally:
+        _stage_metrics = previous
+
+@contextmanager
+def memory_stage(stage, table_name, rows_in=None, bytes_in=None):
+    """Đo một bước ETL: thời gian thực, CPU, RSS trước/sau, RSS đỉnh, số dòng và bytes vào/ra.
+
+    Yield dict bản ghi để caller điền rows_out / bytes_out. Bản ghi được gom khi đang trong
+    collect_stage_metrics; MEMORY_REPORT bật thì log thêm RSS. CPU là process_time của cả
+    process và RSS đỉnh tính từ lần đặt lại gần nhất, nên bước chạy song song (thread nền
+    của PipelineStages) hoặc lồng nhau (detect_encoding trong extract) đo chồng lên nhau.
+    """
+    record = {'table_name': table_name, 'stage': stage, 'rows_in': rows_in, 'rows_out': None,
+              'bytes_in': bytes_in, 'bytes_out': None}
+    if _stage_metrics is None and not MEMORY_REPORT:
+        yield record
+        return
+    record['started_at'] = datetime.now()
+    _reset_peak_rss()
+    before = _proc_status_mb('VmRSS')
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        after, peak = _proc_status_mb('VmRSS'), _proc_status_mb('VmHWM')
+        record.update(wall_seconds=time.perf_counter() - wall, cpu_seconds=time.process_time() - cpu,
+                      rss_before_mb=before, rss_after_mb=after,
+                      peak_rss_delta_mb=peak - before if before is not None and peak is not None else None)
+        if _stage_metrics is not None:
+            _stage_metrics.append(record)
+        if MEMORY_REPORT and before is not None:
+            logger.info(f"[bộ nhớ] {table_name} · {stage}: RSS {before:,.0f} -> {after:,.0f} MB, đỉnh {peak:,.0f} MB",
+                        extra={'stage': stage, 'rss_before_mb': before, 'rss_after_mb': after, 'peak_rss_mb': peak})
+
+def _path_size(path):
+    """Tổng số bytes của file hoặc thư mục (file sạch dạng Parquet partition)."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else None
 
 # Hàm Transform
-def transform_data(df, table_name):
-    # Xử lý duplicate data
-    initial_row_count = len(df)
-    df = df.drop_duplicates().reset_index(drop=True)
-    final_row_count = len(df)
-    duplicates_removed = initial_row_count - final_row_count
-    logger.info(f"Bảng '{table_name}': Đã xử lý và loại bỏ {duplicates_removed} bản ghi trùng lặp.")
-    # Xử lý missing values
-
-        # Xử lý cho table cleaned_products_api
-    cols_to_keep = {'title', 'rating', 'reviews', 'seller_name', 'query', 'price_per_unit', 'two_day_shipping', 'free_shipping', 'free_shipping_with_walmart_plus', 'out_of_stock', }
-    if table_name == 'cleaned_products_api':
-        if "fetch_time" in df.columns:
-            df.sort_values(by="fetch_time", inplace=True)
-        if "us_item_id" in df.columns:
-            df = df.drop_duplicates(subset=["us_item_id"], keep="last")
-        elif "product_id" in df.columns:
-            df = df.drop_duplicates(subset=["product_id"], keep="last")
-
-        # Xử lý cho table marketing_data
-    elif table_name == 'marketing_data':
-        # Parse numeric columns
-        numeric_columns = {
-        'Price': 'Price',
-        'Monthly Price': 'Monthly Price', 
-        'Num Of Reviews': 'Num Of Reviews',
-        'Average Rating': 'Average Rating',
-        'Number Of Ratings': 'Number Of Ratings',
-        'Five Star': 'Five Star',
-        'Four Star': 'Four Star',
-        'Three Star': 'Three Star',
-        'Two Star': 'Two Star',
-        'One Star': 'One Star'
-        }
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(parse_numeric)
-                null_pct = df[col].isna().sum() / len(df) * 100
-        
-        # Clean text columns
-        text_columns = ['Title', 'Manufacturer', 'Model Name', 'Carrier', 'Color Category', 'Internal Memory', 'Screen Size', 'Specifications']
-        for col in text_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(clean_text)
-        
-        # Parse boolean columns
-        bool_map = {
-            'true': True, 'True': True, 'TRUE': True, True: True, 't': True, 'T': True, '1': True,
-            'false': False, 'False': False, 'FALSE': False, False: False, 'f': False, 'F': False, '0': False
-        }
-        bool_columns = ['Stock', 'Discontinued', 'Broken Link']
-        for col in bool_columns:
-            if col in df.columns:
-                df[col] = df[col].map(bool_map)
-                df[col] = df[col].fillna(False).astype(bool)
-
-        # Parse Datetime columns
-        if 'Crawl Timestamp' in df.columns:
-            time_format = '%Y-%m-%d %H:%M:%S %z'
-            df['Crawl Timestamp'] = pd.to_datetime(df['Crawl Timestamp'], format=time_format, errors='coerce')
-            df['crawl_year'] = df['Crawl Timestamp'].dt.year
-            df['crawl_month'] = df['Crawl Timestamp'].dt.month
-            df['crawl_day'] = df['Crawl Timestamp'].dt.day
-            df['crawl_dayofweek'] = df['Crawl Timestamp'].dt.dayofweek
-
-        # Xử lý Missing values
-        numeric_cols_to_check = ['Price', 'Monthly Price', 'Average Rating', 'Num Of Reviews', 
-                    'Number Of Ratings', 'Five Star', 'Four Star', 'Three Star', 
-                    'Two Star', 'One Star']
-        df = process_missing_values(df, numeric_cols_to_check)
-        
-        # Xử lý Outliers
-        outlier_cols = ['Price', 'Monthly Price', 'Average Rating', 'Num Of Reviews', 'Number Of Ratings']
-        df = detect_and_handle_outliers(df, outlier_cols)
+def transform_data(df, table_name, run_id=None):
+    """Transform một bảng theo kế hoạch biên dịch từ TABLE_SPECS, xem TransformPlan.run.
 
-        # Xây dựng Features
-        df = feature_engineering(df)
+    run_id (nếu có) dùng để lưu ColumnProfile của bảng kết quả.
+    COPY_FREE=True: impute và feature ghi thẳng vào df (không copy cả bảng); df đầu vào bị
+    thay đổi. Chưa đạt bộ nhớ đỉnh ~1.5x bảng đầu vào (marketing_data 200k dòng: 2.4x, mặc định
+    3.4x, xem benchmarks/bench_transform_memory.py) vì hai bước vẫn copy dù gọi inplace=True:
+    dedup (duplicated() hash cả bảng, drop(index=...) dựng lại mọi block khi có dòng trùng) và
+    drop(columns=...) của low-value columns (dựng lại block chứa cột bị bỏ).
+    """
+    return compile_plan(table_name).run(df, run_id)
 
-        # Xử lý low_value columns
-        df = drop_low_value_columns(df)
+def transform_rows(df, table_name):
+    """Các bước transform chỉ phụ thuộc từng dòng (dùng được trên từng chunk khi streaming)."""
+    return compile_plan(table_name).transform_rows(df)
 
-        # Normalize column names
-        df = normalize_column_names(df)
-    
-        # Xử lý cho table walmart_customers_purchases
-    elif table_name == 'walmart_customers_purchases':
-        df['Purchase_Date'] = pd.to_datetime(df['Purchase_Date'], format=DATE_FORMAT, errors='coerce')
-        df['Year'] = df['Purchase_Date'].dt.year
-        df['Month'] = df['Purchase_Date'].dt.month
-        df['DayOfWeek'] = df['Purchase_Date'].dt.day_name() 
-        df.reset_index(drop=True, inplace=True)
-    
-        # Xử lý cho table walmart_products
-    else:
-        # Giữ các cột cần thiết
-        filter_columns = ['product_id','product_name','brand','final_price','initial_price','discount','review_count','rating','category_name','root_category_name','available_for_delivery', 'available_for_pickup']
-        keep(df, filter_columns)
-        # Chuyển kiểu dữ liệu phân loại
-        category_features = ['brand', 'category_name', 'root_category_name', 'available_for_delivery', 'available_for_pickup']
-        set_category(df, category_features) 
-        # Xử lý discount
-        df['discount'] = df['discount'].str.replace('$', '', regex=False)
-        df['discount'] = df['discount'].astype("float64")
-
-        # Xử lý missing values
-        # Loại bỏ các sản phẩm có giá trị 'initial_price' rỗng thấp hơn 5%
-        columns_to_process = ['initial_price', 'discount']
-        df = drop_low_null_products(df, 'root_category_name', columns_to_process)
+# ==================== KẾ HOẠCH TRANSFORM ====================
+BOOL_VALUES = {
+    'true': True, 'True': True, 'TRUE': True, True: True, 't': True, 'T': True, '1': True,
+    'false': False, 'False': False, 'FALSE': False, False: False, 'f': False, 'F': False, '0': False
+}
+
+# Biểu thức SQL của các phần ngày trong date_columns (dayofweek: thứ Hai = 0 như pandas);
+# phần số được ép về kiểu pandas tạo ra, xem _transform_rows_sql
+SQL_DATE_PARTS = {'year': 'year({})', 'month': 'month({})', 'day': 'day({})',
+                  'dayofweek': '(isodow({}) - 1)', 'day_name': 'dayname({})'}
+
+def parse_bool_series(series):
+    """Chuỗi true/false/t/f/1/0 -> bool, giá trị khác (kể cả rỗng) -> False."""
+    return series.map(BOOL_VALUES).fillna(False).astype(bool)
+
+def parse_currency_series(series):
+    """Bỏ ký hiệu '$' rồi chuyển sang float64 (cột đã là số thì chỉ đổi kiểu)."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    return series.str.replace('$', '', regex=False).astype('float64')
+
+def _date_part(dates, part):
+    value = getattr(dates.dt, part)
+    return value() if callable(value) else value
+
+class TransformPlan:
+    """Kế hoạch transform của một bảng, biên dịch một lần từ khai báo trong TABLE_SPECS.
+
+    Bước theo dòng (transform_rows) gom mọi chuyển kiểu cột thành một lượt duyệt: mỗi cột
+    được chuyển đúng một lần bằng hàm vector hoá của kiểu đó. Các bước toàn bảng
+    (table_steps) chạy tuần tự, mỗi bước trong memory_stage, dùng chung một ColumnProfile.
+    """
+
+    def __init__(self, table_name, spec):
+        self.table_name = table_name
+        self.spec = spec
+        self.keep_columns = spec.get('keep_columns')
+        self.date_columns = spec.get('date_columns', {})
+        self.dedup_keys = spec.get('dedup_keys', [])
+        self.dedup_order = spec.get('dedup_order')
+        self.merge_keys = spec.get('merge_keys', [])
+        self.partition_by = spec.get('partition_by', [])
+        self.impute = spec.get('impute')
+        self.outlier_columns = spec.get('outliers', {}).get('columns', [])
+        self.features = globals()[spec['features']] if spec.get('features') else None
+        self.category_labels = dict(spec.get('derived_category_columns', {}))
+        self.category_columns = spec.get('category_columns', []) + list(self.category_labels)
+
+        # Hàm chuyển kiểu của từng cột
+        long_text = set(spec.get('long_text_columns', []))
+        self.column_ops = {}
+        for col in spec.get('numeric_columns', []):
+            self.column_ops[col] = parse_numeric_series
+        for col in spec.get('text_columns', []):
+            self.column_ops[col] = self._long_text_op if col in long_text else clean_text_series
+        for col in spec.get('bool_columns', []):
+            self.column_ops[col] = parse_bool_series
+        for col in spec.get('category_columns', []):
+            self.column_ops[col] = lambda series: series.astype('category')
+        for col in spec.get('currency_columns', []):
+            self.column_ops[col] = parse_currency_series
+
+        # Các bước toàn bảng theo thứ tự chạy
+        self.table_steps = []
+        if self.dedup_keys:
+            self.table_steps.append(('latest_by_key', self._keep_latest))
+        if self.impute and self.impute['method'] == 'category_mean':
+            self.table_steps.append(('drop_low_null', self._drop_low_null))
+            self.table_steps.append(('category_mean', self._fill_category_mean))
+        elif self.impute:
+            self.table_steps.append(('missing_values', self._impute_missing))
+        if self.outlier_columns:
+            self.table_steps.append(('outliers', self._handle_outliers))
+        if self.features:
+            self.table_steps.append(('features', self._add_features))
+        if spec.get('drop_low_value_columns'):
+            self.table_steps.append(('low_value_columns', self._drop_low_value))
+        if spec.get('normalize_column_names'):
+            self.table_steps.append(('normalize_columns', self._normalize_columns))
+        self.uses_profile = any(stage in ('missing_values', 'outliers', 'low_value_columns')
+                                for stage, _ in self.table_steps)
+        # Parse numeric/text/bool, impute KNN/MICE, outlier và feature chỉ có bản pandas
+        self.needs_pandas = bool(spec.get('numeric_columns') or spec.get('text_columns') or spec.get('bool_columns')
+                                 or self.outlier_columns or self.features
+                                 or (self.impute and self.impute['method'] == 'smart'))
+
+    def _long_text_op(self, series):
+        return clean_text_series(series, workers=TEXT_CLEAN_WORKERS)
+
+    def run(self, df, run_id=None):
+        """Loại duplicate, transform_rows rồi các bước toàn bảng; trả về bảng kết quả."""
+        with memory_stage('dedup', self.table_name, rows_in=len(df)) as record:
+            df = self.drop_duplicates(df)
+            record['rows_out'] = len(df)
+        with memory_stage('transform_rows', self.table_name, rows_in=len(df)) as record:
+            df = self.transform_rows(df)
+            record['rows_out'] = len(df)
+        # Thống kê cột dùng chung cho các bước missing / outlier / low-value
+        profile = ColumnProfile(df) if self.uses_profile else None
+        for stage, step in self.table_steps:
+            with memory_stage(stage, self.table_name, rows_in=len(df)) as record:
+                df = step(df, profile)
+                record['rows_out'] = len(df)
+
+        if run_id and PROFILE_DIR:
+            save_profile(profile or ColumnProfile(df), self.table_name, run_id)
+        return df
+
+    def drop_duplicates(self, df):
+        # Xử lý duplicate data
+        initial_row_count = len(df)
+        if COPY_FREE:
+            # Không có bản ghi trùng thì không tạo bảng mới; có thì drop(inplace=True) vẫn copy
+            # các dòng giữ lại sang block mới
+            duplicated = df.duplicated().to_numpy()
+            if duplicated.any():
+                df.drop(index=df.index[duplicated], inplace=True)
+            df.reset_index(drop=True, inplace=True)
+        else:
+            df = df.drop_duplicates().reset_index(drop=True)
+        duplicates_removed = initial_row_count - len(df)
+        logger.info(f"Bảng '{self.table_name}': Đã xử lý và loại bỏ {duplicates_removed} bản ghi trùng lặp.")
+        return df
+
+    def transform_rows(self, df):
+        """Giữ cột cần thiết, chuyển kiểu mỗi cột một lần, parse ngày và tách phần ngày."""
+        if self.keep_columns is not None:
+            keep(df, self.keep_columns + [ETL_ROW_ID])
+        for col in list(df.columns):
+            op = self.column_ops.get(col)
+            if op is not None:
+                df[col] = op(df[col])
+        for col, date_spec in self.date_columns.items():
+            if col not in df.columns:
+                continue
+            df[col] = pd.to_datetime(df[col], format=date_spec['format'], errors='coerce')
+            for name, part in date_spec.get('parts', {}).items():
+                df[name] = _date_part(df[col], part)
+        return df
+
+    def dedup_key(self, columns):
+        """Key đầu tiên trong dedup_keys có trong bảng, hoặc None."""
+        return next((key for key in self.dedup_keys if key in columns), None)
+
+    def output_names(self, names):
+        """Tên cột nguồn -> tên trong bảng kết quả (sau normalize_column_names nếu có)."""
+        if self.spec.get('normalize_column_names'):
+            return list(normalize_column_names(pd.DataFrame(columns=list(names))).columns)
+        return list(names)
+
+    def merge_key_columns(self, columns):
+        """Tên cột (trong bảng kết quả) của key upsert, hoặc None nếu bảng không có đủ cột key."""
+        keys = list(self.merge_keys)
+        if not keys and self.dedup_key(columns):
+            keys = [self.dedup_key(columns)]
+        keys = self.output_names(keys)
+        return keys if keys and all(key in columns for key in keys) else None
+
+    def partition_columns(self, columns):
+        """Cột chia partition (tên trong bảng kết quả) có trong columns."""
+        return [col for col in self.output_names(self.partition_by) if col in columns]
+
+    def _keep_latest(self, df, profile):
+        # Giữ bản ghi cuối (theo dedup_order) của mỗi key
+        if self.dedup_order and self.dedup_order in df.columns:
+            df.sort_values(by=self.dedup_order, inplace=True)
+        key = self.dedup_key(df.columns)
+        if key:
+            df = df.drop_duplicates(subset=[key], keep="last")
+        return df
+
+    def _drop_low_null(self, df, profile):
+        # Loại bỏ các sản phẩm có giá trị rỗng trong category ít rỗng (<= drop_threshold)
+        return drop_low_null_products(df, self.impute['by'], self.impute['columns'],
+                                      threshold=self.impute.get('drop_threshold', 0.05))
+
+    def _fill_category_mean(self, df, profile):
         # Điền các missing values bằng giá trị trung bình của category
-        df = fill_missing_with_category_mean(df, 'root_category_name', columns_to_process)
+        return fill_missing_with_category_mean(df, self.impute['by'], self.impute['columns'])
 
-    return df
+    def _impute_missing(self, df, profile):
+        return process_missing_values(df, self.impute['columns'], table_name=self.table_name, profile=profile, inplace=COPY_FREE)
+
+    def _handle_outliers(self, df, profile):
+        return detect_and_handle_outliers(df, self.outlier_columns, profile=profile)
+
+    def _add_features(self, df, profile):
+        df = self.features(df, inplace=COPY_FREE)
+        if profile is not None:
+            profile.update(df)
+        return df
+
+    def _drop_low_value(self, df, profile):
+        partitions = [col for col in self.partition_by if col in df.columns]
+        before = df[partitions] if partitions else None
+        df = drop_low_value_columns(df, profile=profile, inplace=COPY_FREE, protected_columns=self.merge_keys)
+        dropped = [col for col in partitions if col not in df.columns]
+        if dropped:
+            # Parquet vẫn chia partition theo cột đã drop, xem save_cleaned_data
+            df.attrs[PARTITION_VALUES_ATTR] = before[dropped]
+        return df
+
+    def _normalize_columns(self, df, profile):
+        original_columns = list(df.columns)
+        df = normalize_column_names(df)
+        if profile is not None:
+            profile.rename(dict(zip(original_columns, df.columns)))
+            profile.update(df)
+        return df
+
+def compile_plan(table_name):
+    """TransformPlan của bảng theo TABLE_SPECS (bảng không khai báo: chỉ loại duplicate)."""
+    return TransformPlan(table_name, TABLE_SPECS.get(table_name, {}))
 
 # ===========================================================================
 # Tiền xử lý cho bảng walmart_products
@@ -205,7 +523,8 @@ def transform_data(df, table_name):
 # Hàm giữ lại các thuộc tính cần thiết
 def keep(df, features):
     cols_to_drop = [col for col in df.columns if col not in features]
-    df.drop(columns=cols_to_drop, axis=1, inplace=True)
+    if cols_to_drop:
+        df.drop(columns=cols_to_drop, inplace=True)
 
 # Hàm set các biến phân loại về kiểu category
 def set_category(df, category_columns):
@@ -217,24 +536,19 @@ def set_category(df, category_columns):
 def drop_low_null_products(df, root_category_column, value_columns, threshold=0.05):
     if root_category_column not in df.columns or not all(col in df.columns for col in value_columns):
         return df
-    categories_to_check = df[root_category_column].unique()
-
-    indices_to_drop = []
-    for category in categories_to_check:
-        cat_df = df[df[root_category_column] == category]
-        total_count = len(cat_df)
-
-        null_rows_mask = cat_df[value_columns].isna().any(axis=1)
-        null_rows = cat_df[null_rows_mask]
 
-        missing_count = len(null_rows)
-        if missing_count / total_count <= threshold or missing_count == len(cat_df):
-            indices_to_drop.extend(null_rows.index.tolist())
+    # Một lần groupby: số dòng rỗng và tổng số dòng của từng category, broadcast về từng dòng
+    null_rows_mask = df[value_columns].isna().any(axis=1)
+    grouped = null_rows_mask.groupby(df[root_category_column], observed=True, sort=False)
+    missing_count = grouped.transform('sum')
+    total_count = grouped.transform('size')
+    # Dòng có category rỗng không thuộc nhóm nào (NaN) nên được giữ lại
+    drop_mask = null_rows_mask & ((missing_count / total_count <= threshold) | (missing_count == total_count))
 
-    df.drop(indices_to_drop, inplace=True)
+    df.drop(df.index[drop_mask.to_numpy()], inplace=True)
 
     cols_str = ', '.join(value_columns)
-    logger.info(f"Đã loại bỏ {len(indices_to_drop)} sản phẩm có giá trị rỗng vượt quá {threshold*100}% trong cột '{cols_str}' theo '{root_category_column}'.")
+    logger.info(f"Đã loại bỏ {int(drop_mask.sum())} sản phẩm có giá trị rỗng vượt quá {threshold*100}% trong cột '{cols_str}' theo '{root_category_column}'.")
     return df
 
 # Hàm fill missing values bằng giá trị trung bình của category
@@ -255,21 +569,9 @@ def fill_missing_with_category_mean(df, root_category_column, value_columns):
 # ===========================================================================
 # Tiền xử lý cho bảng marketing_data
 
-def parse_numeric(value):
-    """Parse a single value into float, handling common NA markers and currency/commas."""
-    try:
-        if pd.isna(value):
-            return np.nan
-        sval = str(value).strip()
-        if sval.lower() in ['na', 'n/a', 'null', 'none', '']:
-            return np.nan
-        # Remove currency symbols and thousands separators, keep minus and dot
-        cleaned = re.sub(r"[^0-9\-\.]", "", sval)
-        if cleaned in ['', '-', '.']:
-            return np.nan
-        return float(cleaned)
-    except Exception:
-        return np.nan
+# Regex của clean_text, compile một lần
+WHITESPACE_RE = re.compile(r'\s+')
+EDGE_SPECIAL_RE = re.compile(r'^[^\w]+|[^\w]+$')
 
 def clean_text(text):
     """Làm sạch text: normalize whitespace, handle NA"""
@@ -279,35 +581,369 @@ def clean_text(text):
     text = str(text).strip()
     
     # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = WHITESPACE_RE.sub(' ', text)
     
     # Remove special characters ở đầu/cuối
-    text = re.sub(r'^[^\w]+|[^\w]+$', '', text)
+    text = EDGE_SPECIAL_RE.sub('', text)
     
     return text if text else 'Unknown'
 
-def process_missing_values(df, numeric_cols_to_check):
+def _clean_text_values(values):
+    """clean_text cho một list giá trị (hàm top-level để gửi sang process con)."""
+    return [clean_text(v) for v in values]
+
+def clean_text_series(series, workers=1):
+    """clean_text cho cả cột nhưng mỗi giá trị khác nhau chỉ làm sạch một lần rồi map ngược lại.
+
+    Kết quả giống hệt series.apply(clean_text). Khi workers > 1 và cột có nhiều giá trị
+    khác nhau (vd Specifications) thì các giá trị được chia đều cho nhiều process.
+    """
+    # factorize gộp 1 / 1.0 / True thành một nhóm nên chỉ dùng khi cột toàn chuỗi
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        return series.apply(clean_text)
+
+    codes, uniques = pd.factorize(series)
+    uniques = list(uniques)
+    if workers > 1 and len(uniques) >= TEXT_CLEAN_PARALLEL_MIN:
+        size = -(-len(uniques) // (workers * 4))
+        batches = [uniques[i:i + size] for i in range(0, len(uniques), size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            cleaned = [v for batch in executor.map(_clean_text_values, batches) for v in batch]
+    else:
+        cleaned = _clean_text_values(uniques)
+
+    # Mã -1 (NaN/None) -> 'Unknown' ở vị trí cuối
+    if arrow_strings_enabled():
+        # Lấy theo mã trên mảng Arrow, không tạo mảng object theo từng dòng
+        values = pd.array(cleaned + ['Unknown'], dtype=string_dtype()).take(codes)
+    else:
+        values = np.array(cleaned + ['Unknown'], dtype=object)[codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+# ==================== COLUMN PROFILE ====================
+class ColumnProfile:
+    """Thống kê từng cột của DataFrame, tính một lần và dùng chung giữa các bước transform.
+
+    Mỗi cột có: dtype, số null, số giá trị unique, min/max và phân vị 1/25/75/99 (cột số).
+    Thống kê được tính khi cần, một lần gọi cho tất cả cột chưa có. Bước nào sửa cột
+    thì gọi invalidate/update với các cột đó; các cột khác giữ nguyên thống kê.
+    """
+    QUANTILES = (0.01, 0.25, 0.75, 0.99)
+
+    def __init__(self, df):
+        self.df = df
+        self._stats = {}
+
+    @property
+    def row_count(self):
+        return len(self.df)
+
+    def update(self, df, mutated=()):
+        """Gắn DataFrame mới (sau một bước transform); mutated là các cột bước đó đã sửa."""
+        self.df = df
+        self.invalidate(list(mutated) + [col for col in self._stats if col not in df.columns])
+
+    def invalidate(self, columns):
+        for col in columns:
+            self._stats.pop(col, None)
+
+    def rename(self, mapping):
+        self._stats = {mapping.get(col, col): stats for col, stats in self._stats.items()}
+
+    def compute(self, columns=None):
+        """Tính thống kê cho các cột chưa có (mặc định tất cả cột) trong một lần."""
+        columns = list(self.df.columns) if columns is None else columns
+        stale = [col for col in columns if col not in self._stats and col in self.df.columns]
+        if not stale:
+            return
+        frame = self.df[stale]
+        null_counts = frame.isna().sum()
+        unique_counts = frame.nunique()
+        numeric = [col for col in stale if pd.api.types.is_numeric_dtype(frame[col].dtype)
+                   and not pd.api.types.is_bool_dtype(frame[col].dtype)]
+        if numeric:
+            quantiles = frame[numeric].quantile(list(self.QUANTILES))
+            minimums, maximums = frame[numeric].min(), frame[numeric].max()
+        for col in stale:
+            stats = {'dtype': str(frame[col].dtype), 'nulls': int(null_counts[col]), 'nunique': int(unique_counts[col])}
+            if col in numeric:
+                stats.update(min=minimums[col], max=maximums[col])
+                stats.update({f"p{round(q * 100):02d}": quantiles.at[q, col] for q in self.QUANTILES})
+            self._stats[col] = stats
+
+    def get(self, column, stat):
+        self.compute([column])
+        return self._stats[column].get(stat)
+
+    def missing_pcts(self, columns):
+        """% null của các cột trong một lần quét. Cột chưa có thống kê chỉ được đếm null (không
+        tính nunique/phân vị, cũng không lưu), vì thường là cột sắp bị sửa ngay sau đó (impute)."""
+        nulls = {col: self._stats[col]['nulls'] for col in columns if col in self._stats}
+        rest = [col for col in columns if col not in nulls]
+        if rest:
+            nulls.update(self.df[rest].isna().sum().to_dict())
+        return {col: nulls[col] / self.row_count * 100 for col in columns}
+
+    def quantile(self, column, q):
+        """Phân vị đã tính (q thuộc QUANTILES) của một cột số."""
+        return self.get(column, f"p{round(q * 100):02d}")
+
+    def null_counts(self, columns=None):
+        columns = list(self.df.columns) if columns is None else columns
+        self.compute(columns)
+        return pd.Series({col: self._stats[col]['nulls'] for col in columns}, dtype='int64')
+
+    def unique_counts(self, columns=None):
+        columns = list(self.df.columns) if columns is None else columns
+        self.compute(columns)
+        return pd.Series({col: self._stats[col]['nunique'] for col in columns}, dtype='int64')
+
+    def to_dict(self):
+        self.compute()
+        return {'rows': self.row_count,
+                'columns': {col: {key: _json_value(value) for key, value in self._stats[col].items()}
+                            for col in self.df.columns}}
+
+def _json_value(value):
+    """Giá trị thống kê (numpy / Timestamp / NaN) -> kiểu ghi được JSON."""
+    if value is None or (np.isscalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+def new_run_id():
+    """Id của một lần chạy ETL, dùng đặt tên artifact của lần chạy đó."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.urandom(3).hex()}"
+
+def save_profile(profile, table_name, run_id):
+    """Ghi profile của bảng ra PROFILE_DIR/<run_id>/<table_name>.json."""
+    if not PROFILE_DIR or not run_id:
+        return
+    run_dir = os.path.join(PROFILE_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, f"{table_name}.json")
+    artifact = {'run_id': run_id, 'table': table_name, 'created_at': datetime.now().isoformat(timespec='seconds')}
+    artifact.update(profile.to_dict())
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=2)
+    logger.info(f"Đã lưu profile bảng {table_name} vào: {path}")
+
+def process_missing_values(df, numeric_cols_to_check, missing_pct=None, medians=None, table_name=None, profile=None, inplace=False,
+                           models=None):
+    """missing_pct/medians: thống kê tính trước trên toàn bảng (streaming), mặc định tính trên df.
+    models: imputer KNN/MICE đã fit trên toàn bảng (streaming), xem smart_impute_numeric.
+    table_name: lưu/dùng lại imputer đã fit của bảng, xem smart_impute_numeric.
+    profile: ColumnProfile của df (dùng chung với các bước sau), được cập nhật các cột đã impute.
+    inplace: impute trực tiếp trên df thay vì trên bản copy."""
     # Xác định cột cần impute (numeric columns với 0-95% missing)
-    impute_cols = []
-    for col in numeric_cols_to_check:
-        if col in df.columns:
-            missing_pct = df[col].isna().sum() / len(df) * 100
-            if 0 < missing_pct < 95:
-                impute_cols.append(col)
+    if missing_pct is None:
+        profile = profile or ColumnProfile(df)
+        missing_pct = profile.missing_pcts([col for col in numeric_cols_to_check if col in df.columns])
+    impute_cols = [col for col in numeric_cols_to_check if col in df.columns and 0 < missing_pct.get(col, 0) < 95]
 
     if impute_cols:
-        df = smart_impute_numeric(df, impute_cols)
+        df = smart_impute_numeric(df, impute_cols, missing_pct=missing_pct, medians=medians, table_name=table_name, inplace=inplace,
+                                  models=models)
+    if profile is not None:
+        profile.update(df, mutated=impute_cols)
 
     return df
 
-def smart_impute_numeric(df, columns):
+def _sample_positions(positions, max_rows):
+    """Tối đa max_rows vị trí lấy ngẫu nhiên (cố định seed), giữ nguyên thứ tự gốc."""
+    if max_rows is None or len(positions) <= max_rows:
+        return positions
+    rng = np.random.default_rng(IMPUTE_RANDOM_STATE)
+    return np.sort(rng.choice(positions, max_rows, replace=False))
+
+def _partition_positions(codes):
+    """Chia vị trí dòng theo mã khối (kết quả của pd.factorize)."""
+    order = np.argsort(codes, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+
+def _transform_in_batches(imputer, values, target_positions, result):
+    # working_memory giới hạn khối khoảng cách của KNNImputer (mặc định sklearn là 1GB)
+    with sklearn.config_context(working_memory=IMPUTE_WORKING_MEMORY_MB):
+        for start in range(0, len(target_positions), IMPUTE_BATCH_SIZE):
+            batch = target_positions[start:start + IMPUTE_BATCH_SIZE]
+            result[batch] = imputer.transform(values[batch])
+
+def _fit_knn(values, keys=None):
+    """Fit KNN: một KNNImputer cho mỗi khối theo keys và một KNNImputer toàn bảng.
+
+    Khối quá nhỏ, key rỗng hoặc có cột rỗng hoàn toàn không có imputer riêng,
+    dòng của chúng được impute bằng imputer toàn bảng.
+    """
+    model = {'groups': {}, 'global': None}
+    if keys is not None:
+        codes, uniques = pd.factorize(keys)
+        for positions in _partition_positions(codes):
+            if codes[positions[0]] == -1 or len(positions) < IMPUTE_MIN_GROUP_ROWS:
+                continue
+            donors = np.asfortranarray(values[_sample_positions(positions, IMPUTE_KNN_MAX_DONORS)])
+            if np.isnan(donors).all(axis=0).any():
+                continue
+            model['groups'][uniques[codes[positions[0]]]] = KNNImputer(n_neighbors=5, weights='distance').fit(donors)
+
+    # Giữ layout cột (như DataFrame) để khoảng cách làm tròn giống hệt fit_transform trên toàn bảng
+    donors = np.asfortranarray(values[_sample_positions(np.arange(len(values)), IMPUTE_KNN_MAX_DONORS)])
+    model['global'] = KNNImputer(n_neighbors=5, weights='distance').fit(donors)
+    return model
+
+def _transform_knn(model, values, keys=None):
+    """KNN impute ma trận values (n x k) bằng model của _fit_knn. Chỉ transform các dòng có NaN, theo batch."""
+    result = values.copy()
+    targets = np.flatnonzero(np.isnan(values).any(axis=1))
+    if keys is not None and model['groups'] and len(targets):
+        codes, uniques = pd.factorize(keys)
+        target_codes = codes[targets]
+        leftover = []
+        for positions in _partition_positions(target_codes):
+            group_targets = targets[positions]
+            code = target_codes[positions[0]]
+            imputer = model['groups'].get(uniques[code]) if code != -1 else None
+            if imputer is None:
+                leftover.append(group_targets)
+                continue
+            _transform_in_batches(imputer, values, group_targets, result)
+        targets = np.sort(np.concatenate(leftover)) if leftover else targets[:0]
+
+    if len(targets):
+        _transform_in_batches(model['global'], values, targets, result)
+    return result
+
+def _mice_impute(values, imputer=None):
+    """IterativeImputer fit trên tối đa IMPUTE_MICE_MAX_SAMPLES dòng rồi transform theo batch.
+
+    imputer đã fit (vd load từ IMPUTER_STORE_DIR) thì chỉ transform. Trả về (imputer, kết quả).
+    Luôn fit() rồi transform() (không dùng fit_transform, vốn trả về giá trị của vòng lặp cuối
+    lúc fit và khác transform()) để lần chạy fit mới và lần dùng lại imputer đã lưu cho cùng kết quả.
+    """
+    if imputer is None:
+        imputer = IterativeImputer(max_iter=10, random_state=IMPUTE_RANDOM_STATE)
+        imputer.fit(values[_sample_positions(np.arange(len(values)), IMPUTE_MICE_MAX_SAMPLES)])
+    result = values.copy()
+    _transform_in_batches(imputer, values, np.flatnonzero(np.isnan(values).any(axis=1)), result)
+    return imputer, result
+
+# ==================== LƯU IMPUTER ĐÃ FIT ====================
+def _imputer_path(table_name, kind, columns):
+    digest = hashlib.sha1('\x1f'.join(columns).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(IMPUTER_STORE_DIR, f"{table_name}__{kind}__{digest}.joblib")
+
+def _imputer_config(kind):
+    """Cấu hình ảnh hưởng tới imputer; khác với lúc fit thì phải fit lại."""
+    config = {'kind': kind, 'sklearn': sklearn.__version__, 'random_state': IMPUTE_RANDOM_STATE}
+    if kind == 'knn':
+        config.update(partition_column=IMPUTE_PARTITION_COLUMN, partition_min_rows=IMPUTE_PARTITION_MIN_ROWS,
+                      min_group_rows=IMPUTE_MIN_GROUP_ROWS, max_donors=IMPUTE_KNN_MAX_DONORS)
+    else:
+        config.update(max_samples=IMPUTE_MICE_MAX_SAMPLES)
+    return config
+
+def _column_stats(values, columns):
+    """Thống kê từng cột lúc fit (mean, std, % missing) dùng để phát hiện drift."""
+    with np.errstate(all='ignore'):
+        return {'rows': len(values), 'columns': {
+            col: {'mean': float(np.nanmean(values[:, i])) if not np.isnan(values[:, i]).all() else None,
+                  'std': float(np.nanstd(values[:, i])) if not np.isnan(values[:, i]).all() else None,
+                  'missing_pct': float(np.isnan(values[:, i]).mean() * 100) if len(values) else 0.0}
+            for i, col in enumerate(columns)}}
+
+def _drifted_columns(fit_stats, stats):
+    """Cột có mean lệch quá IMPUTER_DRIFT_THRESHOLD độ lệch chuẩn so với lúc fit."""
+    drifted = []
+    for col, current in stats['columns'].items():
+        fitted = fit_stats['columns'][col]
+        if current['mean'] is None or fitted['mean'] is None:
+            continue
+        shift = abs(current['mean'] - fitted['mean'])
+        # Cột hằng lúc fit: mọi thay đổi mean đều tính là drift
+        limit = IMPUTER_DRIFT_THRESHOLD * fitted['std'] if fitted['std'] else 0
+        if shift > limit:
+            drifted.append(col)
+    return drifted
+
+def load_imputer(table_name, kind, columns, values):
+    """Imputer đã fit của (bảng, tầng, tập cột), hoặc None nếu chưa có / schema đổi / dữ liệu drift."""
+    path = _imputer_path(table_name, kind, columns)
+    if not os.path.exists(path):
+        return None
+    try:
+        state = joblib.load(path)
+    except Exception as e:
+        logger.warning(f"Không đọc được imputer đã lưu {path}: {e}")
+        return None
+
+    if state.get('columns') != list(columns) or state.get('config') != _imputer_config(kind):
+        logger.info(f"Schema/cấu hình thay đổi, fit lại imputer {kind} cho {table_name}")
+        return None
+    drifted = _drifted_columns(state['stats'], _column_stats(values, columns))
+    if drifted:
+        logger.info(f"Dữ liệu drift ở cột {', '.join(drifted)}, fit lại imputer {kind} cho {table_name}")
+        return None
+    logger.info(f"Dùng imputer {kind} đã lưu cho {table_name} (fit lúc {state['fitted_at']}, {state['stats']['rows']:,} dòng), chỉ transform")
+    return state['model']
+
+def save_imputer(table_name, kind, columns, values, model):
+    """Lưu imputer đã fit cùng thống kê dữ liệu lúc fit vào IMPUTER_STORE_DIR."""
+    os.makedirs(IMPUTER_STORE_DIR, exist_ok=True)
+    path = _imputer_path(table_name, kind, columns)
+    state = {'model': model, 'columns': list(columns), 'config': _imputer_config(kind),
+             'stats': _column_stats(values, columns), 'fitted_at': datetime.now().isoformat(timespec='seconds')}
+    tmp_path = f"{path}.tmp"
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, path)
+
+def clear_imputers(table_name=None):
+    """Xoá imputer đã lưu (của một bảng hoặc tất cả) để lần chạy sau fit lại."""
+    if not IMPUTER_STORE_DIR:
+        return
+    pattern = f"{table_name}__*.joblib" if table_name else '*.joblib'
+    for path in glob.glob(os.path.join(IMPUTER_STORE_DIR, pattern)):
+        os.remove(path)
+
+def _impute_tier(col_missing_pct):
+    """Tầng impute theo % missing của cột: 'knn', 'mice', 'median' hoặc None (không thiếu)."""
+    if 0 < col_missing_pct < 5:
+        return 'knn'
+    if 5 <= col_missing_pct < 30:
+        return 'mice'
+    if col_missing_pct >= 30:
+        return 'median'
+    return None
+
+def smart_impute_numeric(df, columns, missing_pct=None, medians=None, table_name=None, inplace=False, models=None):
     """
     Impute numeric columns với strategy thông minh:
     - <5% missing: KNN Imputation
     - 5-30% missing: Iterative Imputation (MICE)
     - >30% missing: Median Imputation
+
+    missing_pct/medians (dict theo cột) cho phép chọn tầng và median theo thống kê
+    toàn bảng khi df chỉ là một batch.
+
+    Với bảng lớn, KNN và MICE gốc tốn O(n^2) thời gian/bộ nhớ nên:
+    - KNN: bảng > IMPUTE_PARTITION_MIN_ROWS dòng thì láng giềng chỉ tìm trong cùng
+      IMPUTE_PARTITION_COLUMN (Manufacturer), tập láng giềng mỗi khối tối đa
+      IMPUTE_KNN_MAX_DONORS dòng. Nhanh hơn nhiều, nhưng dòng có thể mất láng giềng gần
+      hơn ở hãng khác và tập láng giềng lấy mẫu có thể bỏ sót láng giềng gần nhất.
+    - MICE: fit trên tối đa IMPUTE_MICE_MAX_SAMPLES dòng; hệ số hồi quy ước lượng từ mẫu
+      nên lệch nhẹ so với fit toàn bảng, đổi lại thời gian fit không tăng theo số dòng.
+    - Transform chạy theo batch IMPUTE_BATCH_SIZE dòng nên bộ nhớ bị giới hạn.
+    Bảng nhỏ hơn các ngưỡng trên cho kết quả như KNN/MICE trên toàn bảng.
+
+    table_name: khi có (và IMPUTER_STORE_DIR bật) imputer KNN/MICE đã fit được lưu theo
+    bảng + tập cột; lần sau chỉ transform, trừ khi schema/cấu hình đổi hoặc dữ liệu drift
+    (xem load_imputer) hoặc đã gọi clear_imputers.
+
+    inplace=True ghi giá trị impute thẳng vào df (không copy cả bảng).
+
+    models: {'knn': model của _fit_knn, 'mice': IterativeImputer} đã fit sẵn (streaming fit một
+    lần trên toàn bảng staging, xem _fit_streaming_imputers); tầng có model thì chỉ transform.
     """
-    df_result = df.copy()
+    df_result = df if inplace else df.copy()
     
     cols_to_knn = []
     cols_to_mice = []
@@ -315,88 +951,118 @@ def smart_impute_numeric(df, columns):
     
     for col in columns:
         if col in df_result.columns:
-            missing_pct = df[col].isna().sum() / len(df) * 100
-            if 0 < missing_pct < 5:
+            col_missing_pct = missing_pct[col] if missing_pct is not None else df[col].isna().sum() / len(df) * 100
+            tier = _impute_tier(col_missing_pct)
+            if tier == 'knn':
                 cols_to_knn.append(col)
-            elif 5 <= missing_pct < 30:
+            elif tier == 'mice':
                 cols_to_mice.append(col)
-            elif missing_pct >= 30:
+            elif tier == 'median':
                 cols_to_median.append(col)
         
+    models = models or {}
+    persist = bool(IMPUTER_STORE_DIR and table_name)
+    partition_keys = None
+    if IMPUTE_PARTITION_COLUMN in df_result.columns:
+        partition_keys = df_result[IMPUTE_PARTITION_COLUMN]
+
     if cols_to_knn:
-        # KNN Imputation
-        # Tìm các cột tương quan để làm features
+        # KNN Imputation, chia khối theo IMPUTE_PARTITION_COLUMN khi bảng lớn
         try:
-            imputer_knn = KNNImputer(n_neighbors=5, weights='distance')
-            df_result[cols_to_knn] = imputer_knn.fit_transform(df_result[cols_to_knn])
+            values = df_result[cols_to_knn].to_numpy(dtype='float64', na_value=np.nan)
+            model = models.get('knn')
+            if model is None and persist:
+                model = load_imputer(table_name, 'knn', cols_to_knn, values)
+            if model is None:
+                large = len(df_result) > IMPUTE_PARTITION_MIN_ROWS
+                model = _fit_knn(values, partition_keys if large else None)
+                if persist:
+                    save_imputer(table_name, 'knn', cols_to_knn, values, model)
+            df_result[cols_to_knn] = _transform_knn(model, values, partition_keys)
         except ValueError as e:
             cols_to_median.extend(cols_to_knn)
         
     if cols_to_mice:
         # Iterative Imputation (MICE)            
         try:
-            imputer = IterativeImputer(max_iter=10, random_state=42)
-            df_result[cols_to_mice] = imputer.fit_transform(df_result[cols_to_mice])
+            values = df_result[cols_to_mice].to_numpy(dtype='float64', na_value=np.nan)
+            imputer = models.get('mice')
+            if imputer is None and persist:
+                imputer = load_imputer(table_name, 'mice', cols_to_mice, values)
+            fitted = imputer is None
+            imputer, imputed = _mice_impute(values, imputer)
+            df_result[cols_to_mice] = imputed
+            if persist and fitted:
+                save_imputer(table_name, 'mice', cols_to_mice, values, imputer)
         except ValueError as e:
             cols_to_median.extend(cols_to_mice)
             
     if cols_to_median:
         # Median Imputation
         for col in cols_to_median:
-            median_val = df[col].median()
+            median_val = medians[col] if medians is not None and col in medians else df[col].median()
             if pd.isna(median_val):
                 median_val = 0
             df_result[col] = df_result[col].fillna(median_val)
 
     return df_result
 
-def detect_and_handle_outliers(df, columns_to_check):
+def _outlier_bounds(column, p1, Q1, Q3, p99, outlier_count, row_count):
+    """Chọn khoảng clip theo tỉ lệ outlier (chung cho pandas, SQL và sketch); None = giữ nguyên."""
+    if outlier_count == 0:
+        return None
+    IQR = Q3 - Q1
+    outlier_pct = outlier_count / row_count * 100
+    logger.info(f"   • {column}: {outlier_count:,} outliers ({outlier_pct:.2f}%)")
+    if outlier_pct < 5:
+        # Winsorization
+        return (p1, p99)
+    if outlier_pct < 15:
+        # IQR Capping
+        return (Q1 - 1.5 * IQR, Q3 + 1.5 * IQR)
+    return None
+
+def detect_and_handle_outliers(df, columns_to_check, bounds=None, profile=None):
     """
     Phát hiện và xử lí outliers với IQR method
     Strategy:
     - <5% outliers: Winsorization (1st-99th percentile)
     - 5-15% outliers: IQR Capping
     - >15% outliers: Giữ nguyên
+
+    bounds: dict cột -> (lower, upper) đã tính trước trên toàn bảng; khi có thì chỉ clip.
+    profile: ColumnProfile của df; phân vị lấy từ profile, cột bị clip được invalidate.
     """
-    for column in columns_to_check:
-        if not pd.api.types.is_numeric_dtype(df[column].dtype):
-            continue
-        
-        Q1 = df[column].quantile(0.25)
-        Q3 = df[column].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        outliers = ((df[column] < lower_bound) | (df[column] > upper_bound))
-        outlier_count = outliers.sum()
-        outlier_pct = outlier_count / len(df) * 100
-        
-        if outlier_count == 0:
-            continue
-        
-        logger.info(f"   • {column}: {outlier_count:,} outliers ({outlier_pct:.2f}%)")
-        
-        if outlier_pct < 5:
-            # Winsorization
-            p1 = df[column].quantile(0.01)
-            p99 = df[column].quantile(0.99)
-            df[column] = df[column].clip(lower=p1, upper=p99)
-            
-        elif outlier_pct < 15:
-            # IQR Capping
-            df[column] = df[column].clip(lower=lower_bound, upper=upper_bound)
-        
+    if bounds is None:
+        bounds = {}
+        profile = profile or ColumnProfile(df)
+        columns = [c for c in columns_to_check if pd.api.types.is_numeric_dtype(df[c].dtype)]
+        # Một lần tính phân vị 1/25/75/99 cho mọi cột, một lần đếm outlier cho mọi cột
+        profile.compute(columns)
+        quantiles = {c: [profile.quantile(c, q) for q in (0.01, 0.25, 0.75, 0.99)] for c in columns}
+        Q1 = pd.Series({c: quantiles[c][1] for c in columns}, dtype='float64')
+        Q3 = pd.Series({c: quantiles[c][2] for c in columns}, dtype='float64')
+        frame = df[columns]
+        outlier_counts = (frame.lt(Q1 - 1.5 * (Q3 - Q1)) | frame.gt(Q3 + 1.5 * (Q3 - Q1))).sum()
+        for column in columns:
+            column_bounds = _outlier_bounds(column, *quantiles[column], outlier_counts[column], len(df))
+            if column_bounds is not None:
+                bounds[column] = column_bounds
+                profile.invalidate([column])
+
+    for column, (lower, upper) in bounds.items():
+        if column in df.columns:
+            df[column] = df[column].clip(lower=lower, upper=upper)
     return df
 
-def feature_engineering(df):
+def feature_engineering(df, inplace=False):
     """Create several derived features and return a new DataFrame.
 
     The function copies the input DataFrame, creates features on the copy,
-    and returns the enhanced DataFrame. The original `df` is not modified.
+    and returns the enhanced DataFrame. The original `df` is not modified,
+    unless `inplace=True`, in which case the features are added to `df` itself.
     """
-    df_featured = df.copy()
+    df_featured = df if inplace else df.copy()
     features_created = []
 
     # total star ratings
@@ -416,8 +1082,8 @@ def feature_engineering(df):
     if 'Price' in df_featured.columns:
         df_featured['price_range'] = pd.cut(
             df_featured['Price'].astype(float),
-            bins=[0, 50, 100, 200, 500, float('inf')],
-            labels=['Budget', 'Mid', 'Premium', 'High-end', 'Luxury']
+            bins=PRICE_RANGE_BINS,
+            labels=PRICE_RANGE_LABELS
         )
         features_created.append('price_range')
 
@@ -425,8 +1091,8 @@ def feature_engineering(df):
     if 'Average Rating' in df_featured.columns:
         df_featured['rating_quality'] = pd.cut(
             df_featured['Average Rating'].astype(float),
-            bins=[0, 2, 3, 4, 5],
-            labels=['Poor', 'Fair', 'Good', 'Excellent']
+            bins=RATING_QUALITY_BINS,
+            labels=RATING_QUALITY_LABELS
         )
         features_created.append('rating_quality')
 
@@ -443,11 +1109,27 @@ def feature_engineering(df):
 
     return df_featured
 
-def drop_low_value_columns(df):
+def drop_low_value_columns(df, profile=None, inplace=False, protected_columns=None):
+    profile = profile or ColumnProfile(df)
+    drop_candidates = find_low_value_columns(profile.null_counts(), profile.unique_counts(), profile.row_count,
+                                             protected_columns)
+
+    if drop_candidates and inplace:
+        df.drop(columns=drop_candidates, inplace=True)
+    elif drop_candidates:
+        df = df.drop(columns=drop_candidates)
+    profile.update(df)
+    
+    return df
+
+def find_low_value_columns(null_counts, unique_counts, row_count, protected_columns=None):
+    """Chọn cột cần drop từ số null và số giá trị unique của từng cột (trừ protected_columns, vd. key upsert)."""
     drop_candidates = []
-    for col in df.columns:
-        null_pct = df[col].isna().sum() / len(df) * 100
-        unique_count = df[col].nunique()
+    for col in null_counts.index:
+        if protected_columns and col in protected_columns:
+            continue
+        null_pct = null_counts[col] / row_count * 100
+        unique_count = unique_counts[col]
         
         should_drop = False
     
@@ -458,16 +1140,13 @@ def drop_low_value_columns(df):
         elif unique_count == 1:
             should_drop = True
     # Drop ID columns không cần thiết
-        elif col in ['Uniq Id', 'Pageurl'] and unique_count > len(df) * 0.95:
+        elif col in ['Uniq Id', 'Pageurl'] and unique_count > row_count * 0.95:
             should_drop = True
     
         if should_drop:
             drop_candidates.append(col)
 
-    if drop_candidates:
-        df = df.drop(columns=drop_candidates)
-    
-    return df
+    return drop_candidates
 
 def normalize_column_names(df):
     df.columns = (df.columns
@@ -479,70 +1158,1311 @@ def normalize_column_names(df):
     return df
 
 # Hàm lưu DataFrame đã làm sạch
-def save_cleaned_data(df, original_filename):
+def save_cleaned_data(df, original_filename, table_name=None):
+    """Lưu bảng đã làm sạch vào CLEAN_DIR theo CLEAN_FORMAT.
+
+    'parquet': partition theo partition_by của table_name, xem clean_path. Cột partition đã bị
+    drop_low_value_columns loại (df.attrs[PARTITION_VALUES_ATTR]) được thêm lại vào file Parquet.
+    """
     if not os.path.exists(CLEAN_DIR):
         os.makedirs(CLEAN_DIR)
-    
-    clean_filename = f"cleaned_{original_filename}"
-    clean_path = os.path.join(CLEAN_DIR, clean_filename)
-    
-    # Lưu file với encoding utf-8
-    try:
-        df.to_csv(clean_path, index=False, encoding='utf-8')
+
+    table_name = table_name or table_name_for(original_filename)
+    with memory_stage('save', table_name, rows_in=len(df)) as record:
+        if CLEAN_FORMAT == 'parquet':
+            plan = compile_plan(table_name)
+            dropped = df.attrs.get(PARTITION_VALUES_ATTR)
+            if dropped is not None:
+                names = plan.output_names(dropped.columns)
+                df = df.assign(**{name: dropped[col].to_numpy() for col, name in zip(dropped.columns, names)})
+            partition_cols = plan.partition_columns(df.columns)
+            clean_path = clean_output_path(original_filename, partition_cols)
+            try:
+                _write_parquet(df, clean_path, partition_cols)
+                logger.info(f"Đã lưu dữ liệu đã làm sạch vào: {clean_path}")
+            except Exception as e:
+                logger.error(f"Lỗi khi lưu file đã làm sạch {clean_path}: {e}")
+        else:
+            clean_filename = f"cleaned_{original_filename}"
+            clean_path = os.path.join(CLEAN_DIR, clean_filename)
+
+            # Lưu file với encoding utf-8
+            try:
+                df.to_csv(clean_path, index=False, encoding='utf-8')
+                logger.info(f"Đã lưu dữ liệu đã làm sạch vào: {clean_path}")
+            except Exception as e:
+                logger.error(f"Lỗi khi lưu file đã làm sạch {clean_path}: {e}")
+        record['rows_out'], record['bytes_out'] = len(df), _path_size(clean_path)
+
+def clean_output_path(original_filename, partition_cols=None):
+    """Đường dẫn file sạch: CSV giữ tên file gốc; Parquet là một file .parquet, hoặc
+    thư mục cleaned_<tên>/col=value/... khi có partition."""
+    if CLEAN_FORMAT != 'parquet':
+        return os.path.join(CLEAN_DIR, f"cleaned_{original_filename}")
+    stem = os.path.splitext(original_filename)[0]
+    return os.path.join(CLEAN_DIR, f"cleaned_{stem}" if partition_cols else f"cleaned_{stem}.parquet")
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _replace_path(tmp_path, path):
+    """Thay output cũ bằng output vừa ghi xong ở tmp_path."""
+    _remove_path(path)
+    os.replace(tmp_path, path)
+
+def _write_parquet(df, path, partition_cols):
+    """Ghi Parquet bằng pyarrow: category -> dictionary, datetime giữ timezone, metadata pandas."""
+    import pyarrow.parquet as pq
+
+    # Cột partition số nguyên bị lưu thành float (có NaN) -> Int64 để tên thư mục là year=2020
+    for col in partition_cols:
+        if pd.api.types.is_float_dtype(df[col]):
+            values = df[col].dropna()
+            if (values == values.round()).all():
+                df = df.assign(**{col: df[col].astype('Int64')})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path + '.tmp'
+    _remove_path(tmp_path)
+    if partition_cols:
+        pq.write_to_dataset(table, tmp_path, partition_cols=partition_cols, compression=PARQUET_COMPRESSION)
+    else:
+        pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+    _replace_path(tmp_path, path)
+
+def save_cleaned_sql(conn, select_sql, original_filename, plan):
+    """save_cleaned_data cho bảng đang ở trong DuckDB: COPY select_sql ra CSV hoặc Parquet."""
+    os.makedirs(CLEAN_DIR, exist_ok=True)
+    with memory_stage('save', plan.table_name) as record:
+        clean_path, record['rows_out'] = _copy_cleaned_sql(conn, select_sql, original_filename, plan)
+        record['bytes_out'] = _path_size(clean_path)
+
+def _copy_cleaned_sql(conn, select_sql, original_filename, plan):
+    """COPY của save_cleaned_sql; trả về (đường dẫn file sạch, số dòng đã ghi)."""
+    if CLEAN_FORMAT != 'parquet':
+        clean_path = clean_output_path(original_filename)
+        row_count = conn.execute(f"COPY ({select_sql}) TO {_quote_literal(clean_path)} (HEADER, DELIMITER ',')").fetchone()[0]
         logger.info(f"Đã lưu dữ liệu đã làm sạch vào: {clean_path}")
-    except Exception as e:
-        logger.error(f"Lỗi khi lưu file đã làm sạch {clean_path}: {e}")
+        return clean_path, row_count
+
+    col_types = {row[0]: row[1] for row in conn.execute(f"DESCRIBE {select_sql}").fetchall()}
+    partition_cols = plan.partition_columns(col_types)
+    clean_path = clean_output_path(original_filename, partition_cols)
+    options = ["FORMAT PARQUET", f"COMPRESSION {PARQUET_COMPRESSION}"]
+    if partition_cols:
+        options.append("PARTITION_BY (" + ", ".join(_quote_ident(c) for c in partition_cols) + ")")
+        # Cột partition số thực (năm, tháng) -> BIGINT để tên thư mục là year=2020
+        casts = [f"CAST({_quote_ident(c)} AS BIGINT) AS {_quote_ident(c)}"
+                 for c in partition_cols if col_types[c] in ('DOUBLE', 'FLOAT')]
+        if casts:
+            select_sql = f"SELECT * REPLACE ({', '.join(casts)}) FROM ({select_sql})"
+    tmp_path = clean_path + '.tmp'
+    _remove_path(tmp_path)
+    row_count = conn.execute(f"COPY ({select_sql}) TO {_quote_literal(tmp_path)} ({', '.join(options)})").fetchone()[0]
+    _replace_path(tmp_path, clean_path)
+    logger.info(f"Đã lưu dữ liệu đã làm sạch vào: {clean_path}")
+    return clean_path, row_count
 
 # ===========================================================================
+# Streaming ETL: transform từng chunk, các bước cần toàn bảng chạy trong DuckDB
+
+def _quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _row_count(conn, table):
+    return conn.execute(f"SELECT count(*) FROM {_quote_ident(table)}").fetchone()[0]
+
+def _table_columns(conn, table):
+    """Danh sách (tên cột, kiểu DuckDB) của bảng."""
+    return [(row[0], row[1]) for row in conn.execute(f"DESCRIBE {_quote_ident(table)}").fetchall()]
+
+def _common_sql_type(conn, left, right):
+    """Kiểu chung nhỏ nhất của hai kiểu DuckDB (như UNION ALL), vd BIGINT + DOUBLE -> DOUBLE."""
+    return conn.execute(f"DESCRIBE SELECT CAST(NULL AS {left}) AS v UNION ALL SELECT CAST(NULL AS {right})").fetchone()[1]
 
+def _append_chunk(conn, table, df, create):
+    """Ghi một chunk vào bảng tạm. Chunk đầu tạo bảng theo kiểu suy ra từ chunk đó.
+
+    Chunk sau suy ra kiểu khác (vd BIGINT rồi DOUBLE, số rồi chuỗi) thì cột trong bảng được
+    nới sang kiểu chung (như pandas đọc cả file một lần) trước khi insert, không ép giá trị
+    của chunk về kiểu cũ (TRY_CAST làm mất giá trị thành NULL hoặc làm tròn số thực).
+    """
+    df = df.copy()
+    for col in df.select_dtypes(include='category').columns:
+        df[col] = df[col].astype(object)
+
+    conn.register('tmp_chunk', df)
+    try:
+        if create:
+            # Cột toàn null (không phải số) tạo kiểu VARCHAR để chunk sau không bị lệch kiểu
+            select = ", ".join(
+                f"CAST({_quote_ident(c)} AS VARCHAR) AS {_quote_ident(c)}"
+                if df[c].isna().all() and not pd.api.types.is_numeric_dtype(df[c]) else _quote_ident(c)
+                for c in df.columns
+            )
+            conn.execute(f"CREATE TABLE {_quote_ident(table)} AS SELECT {select} FROM tmp_chunk")
+        else:
+            t = _quote_ident(table)
+            chunk_types = {row[0]: row[1] for row in conn.execute("DESCRIBE tmp_chunk").fetchall()}
+            for name, dtype in _table_columns(conn, table):
+                chunk_type = chunk_types.get(name)
+                if chunk_type in (None, dtype) or df[name].isna().all():
+                    continue
+                c = _quote_ident(name)
+                # Cột chỉ toàn null tới giờ (vd VARCHAR tạm của chunk đầu) nhận luôn kiểu của chunk này
+                has_values = conn.execute(f"SELECT count({c}) FROM {t}").fetchone()[0] > 0
+                new_type = _common_sql_type(conn, dtype, chunk_type) if has_values else chunk_type
+                if new_type != dtype:
+                    logger.debug(f"Bảng tạm '{table}': nới cột '{name}' từ {dtype} sang {new_type}")
+                    conn.execute(f"ALTER TABLE {t} ALTER {c} TYPE {new_type}")
+            select = ", ".join(
+                f"CAST({_quote_ident(name)} AS {dtype}) AS {_quote_ident(name)}"
+                for name, dtype in _table_columns(conn, table) if name in df.columns
+            )
+            conn.execute(f"INSERT INTO {t} BY NAME SELECT {select} FROM tmp_chunk")
+    finally:
+        conn.unregister('tmp_chunk')
+
+def _iter_table_batches(conn, table, batch_size):
+    """Đọc lại bảng DuckDB theo batch (thứ tự dòng gốc) dưới dạng DataFrame."""
+    cursor = conn.cursor()
+    try:
+        reader = cursor.execute(
+            f"SELECT * FROM {_quote_ident(table)} ORDER BY {_quote_ident(ETL_ROW_ID)}"
+        ).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield batch.to_pandas()
+    finally:
+        cursor.close()
+
+def _is_numeric_sql_type(dtype):
+    return dtype.split('(')[0] in ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT',
+                                   'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE', 'DECIMAL')
+
+def stage_csv_chunks(conn, file_path, table_name, stage_table, chunk_size):
+    """Pass 1: đọc file theo chunk, chạy transform_rows và append vào bảng staging tạm.
+
+    Trả về số dòng đã đọc.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File không tồn tại: {file_path}")
+
+    plan = compile_plan(table_name)
+    for enc in encoding_candidates(file_path):
+        conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(stage_table)}")
+        try:
+            row_count = 0
+            options = read_options(table_name)
+            if plan.spec.get('repair_columns'):
+                options.update(repair_options(file_path, enc, options.get('usecols')))
+            with string_inference(arrow_strings_enabled()), collect_bad_lines(file_path, enc, table_name):
+                for chunk in pd.read_csv(file_path, encoding=enc, chunksize=chunk_size, on_bad_lines='warn', **options):
+                    chunk.insert(0, ETL_ROW_ID, np.arange(row_count, row_count + len(chunk)))
+                    chunk = plan.transform_rows(chunk)
+                    _append_chunk(conn, stage_table, chunk, create=row_count == 0)
+                    row_count += len(chunk)
+                    logger.info(f"Bảng '{table_name}': đã stream {row_count:,} dòng")
+            remember_encoding(file_path, enc)
+            return row_count
+        except UnicodeDecodeError:
+            logger.debug(f"Thất bại với encoding: {enc}")
+            continue
+    raise RuntimeError(f"Không thể stream file với encoding nào: {file_path}")
+
+def _dedup_sql(conn, source, target, table_name):
+    """Loại bỏ bản ghi trùng lặp trên toàn bảng, giữ lần xuất hiện đầu tiên."""
+    columns = [c for c, _ in _table_columns(conn, source)]
+    cols = ", ".join(_quote_ident(c) for c in columns if c != ETL_ROW_ID)
+    row_id = _quote_ident(ETL_ROW_ID)
+    # Bảng đọc thẳng từ CSV chưa có cột thứ tự: dùng rowid (theo thứ tự insert)
+    source_row_id = row_id if ETL_ROW_ID in columns else 'rowid'
+    before = _row_count(conn, source)
+    with memory_stage('dedup', table_name, rows_in=before) as record:
+        conn.execute(f"""
+            CREATE TABLE {_quote_ident(target)} AS
+            SELECT min({source_row_id}) AS {row_id}, {cols} FROM {_quote_ident(source)} GROUP BY ALL
+        """)
+        after = record['rows_out'] = _row_count(conn, target)
+    logger.info(f"Bảng '{table_name}': Đã xử lý và loại bỏ {before - after} bản ghi trùng lặp.")
+
+def _sql_outlier_bounds(conn, table, columns_to_check):
+    """Tính bounds outlier trên toàn bảng bằng DuckDB, cùng strategy với detect_and_handle_outliers."""
+    col_types = dict(_table_columns(conn, table))
+    columns = [c for c in columns_to_check if c in col_types and _is_numeric_sql_type(col_types[c])]
+    if not columns:
+        return {}
+    t = _quote_ident(table)
+    # Phân vị của mọi cột trong một lần quét, số outlier của mọi cột trong lần quét thứ hai
+    row = conn.execute("SELECT count(*), " + ", ".join(
+        f"quantile_cont({_quote_ident(c)}, [0.01, 0.25, 0.75, 0.99])" for c in columns
+    ) + f" FROM {t}").fetchone()
+    row_count = row[0]
+    quantiles = {c: q for c, q in zip(columns, row[1:]) if q is not None and q[1] is not None}
+    if not quantiles:
+        return {}
+    conditions, params = [], []
+    for column, (p1, Q1, Q3, p99) in quantiles.items():
+        IQR = Q3 - Q1
+        c = _quote_ident(column)
+        conditions.append(f"count_if({c} < ? OR {c} > ?)")
+        params.extend([Q1 - 1.5 * IQR, Q3 + 1.5 * IQR])
+    outlier_counts = conn.execute(f"SELECT {', '.join(conditions)} FROM {t}", params).fetchone()
+
+    bounds = {}
+    for (column, q), outlier_count in zip(quantiles.items(), outlier_counts):
+        column_bounds = _outlier_bounds(column, *q, outlier_count, row_count)
+        if column_bounds is not None:
+            bounds[column] = column_bounds
+    return bounds
+
+class QuantileSketch:
+    """KLL sketch: phân vị xấp xỉ với bộ nhớ O(k log n), gộp được giữa các chunk / file.
+
+    Giá trị được đưa vào theo batch (update) hoặc gộp từ sketch khác (merge). Khi sketch
+    chưa phải nén (ít hơn k giá trị) thì quantiles cho kết quả chính xác như pandas;
+    sau đó sai số hạng (rank) vào khoảng O(1/k).
+    """
+
+    def __init__(self, k=None, seed=IMPUTE_RANDOM_STATE):
+        self.k = k or QUANTILE_SKETCH_K
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # Số phần tử lẻ thì giữ lại phần tử cuối ở level hiện tại
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self._rng.randint(0, 1):len(items) - len(items) % 2:2]
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+                level = 0
+                continue
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.compactors[0] = np.concatenate([self.compactors[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2.0 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return [None] * len(qs)
+        if len(self.compactors) == 1:
+            return [float(v) for v in np.quantile(self.compactors[0], qs)]
+        items, weights = self._weighted_items()
+        cumulative = np.cumsum(weights)
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return [float(items[min(pos, len(items) - 1)]) for pos in positions]
+
+    def count_outside(self, lower, upper):
+        """Số giá trị (xấp xỉ) < lower hoặc > upper."""
+        items, weights = self._weighted_items()
+        return int(round(weights[(items < lower) | (items > upper)].sum()))
+
+def sketch_outlier_bounds(sketches, row_count):
+    """Bounds outlier từ các QuantileSketch (cột -> sketch), cùng strategy với detect_and_handle_outliers."""
+    bounds = {}
+    for column, sketch in sketches.items():
+        p1, Q1, Q3, p99 = sketch.quantiles([0.01, 0.25, 0.75, 0.99])
+        if Q1 is None:
+            continue
+        IQR = Q3 - Q1
+        outlier_count = sketch.count_outside(Q1 - 1.5 * IQR, Q3 + 1.5 * IQR)
+        column_bounds = _outlier_bounds(column, p1, Q1, Q3, p99, outlier_count, row_count)
+        if column_bounds is not None:
+            bounds[column] = column_bounds
+    return bounds
+
+def _sample_table_values(conn, table, columns, max_rows, key_column=None):
+    """(ma trận float của columns, keys) trên các dòng _sample_positions chọn (theo thứ tự ETL_ROW_ID).
+
+    Cùng vị trí mẫu như smart_impute_numeric chọn trên bảng đầy đủ trong bộ nhớ, nên bảng
+    không quá max_rows dòng cho đúng ma trận đó.
+    """
+    row_count = _row_count(conn, table)
+    positions = _sample_positions(np.arange(row_count), max_rows)
+    select = [f"CAST({_quote_ident(c)} AS DOUBLE) AS {_quote_ident(c)}" for c in columns]
+    if key_column:
+        select.append(f"{_quote_ident(key_column)} AS __key")
+    numbered = (f"SELECT *, row_number() OVER (ORDER BY {_quote_ident(ETL_ROW_ID)}) - 1 AS __pos "
+                f"FROM {_quote_ident(table)}")
+    sql = f"SELECT {', '.join(select)} FROM ({numbered})"
+    sampled = len(positions) < row_count
+    if sampled:
+        conn.register('tmp_positions', pd.DataFrame({'pos': positions}))
+        sql += " WHERE __pos IN (SELECT pos FROM tmp_positions)"
+    try:
+        sample = conn.execute(sql + " ORDER BY __pos").df()
+    finally:
+        if sampled:
+            conn.unregister('tmp_positions')
+    values = sample[columns].to_numpy(dtype='float64', na_value=np.nan)
+    return values, (sample['__key'] if key_column else None)
+
+def _fit_streaming_imputers(conn, source, columns, missing_pct, row_count):
+    """Fit imputer KNN/MICE một lần trên toàn bảng staging cho mọi batch của _finalize_pandas_sql.
+
+    Chọn tầng và lấy mẫu như smart_impute_numeric trên cả bảng, nên bảng không vượt
+    IMPUTE_KNN_MAX_DONORS / IMPUTE_MICE_MAX_SAMPLES dòng cho cùng imputer (và cùng kết quả) với
+    chế độ thường. Bảng lớn hơn: khối KNN theo IMPUTE_PARTITION_COLUMN chỉ lấy láng giềng trong
+    mẫu IMPUTE_KNN_MAX_DONORS dòng của toàn bảng, thay vì trong toàn bộ dòng của khối.
+    Tầng fit lỗi (ValueError) không có model, batch tự xử lý như smart_impute_numeric.
+    """
+    tiers = {}
+    for col in columns:
+        tiers.setdefault(_impute_tier(missing_pct.get(col, 0)), []).append(col)
+    models = {}
+    key_column = IMPUTE_PARTITION_COLUMN if IMPUTE_PARTITION_COLUMN in dict(_table_columns(conn, source)) else None
+    if tiers.get('knn'):
+        large = row_count > IMPUTE_PARTITION_MIN_ROWS
+        values, keys = _sample_table_values(conn, source, tiers['knn'], IMPUTE_KNN_MAX_DONORS,
+                                            key_column if large else None)
+        try:
+            models['knn'] = _fit_knn(values, keys)
+        except ValueError as e:
+            logger.warning(f"Không fit được KNN trên toàn bảng ({e}), impute theo từng batch")
+    if tiers.get('mice'):
+        values, _ = _sample_table_values(conn, source, tiers['mice'], IMPUTE_MICE_MAX_SAMPLES)
+        try:
+            models['mice'] = IterativeImputer(max_iter=10, random_state=IMPUTE_RANDOM_STATE).fit(values)
+        except ValueError as e:
+            logger.warning(f"Không fit được MICE trên toàn bảng ({e}), impute theo từng batch")
+    return models
+
+def _finalize_pandas_sql(conn, source, plan, chunk_size):
+    """Impute, xử lý outlier và tạo feature theo batch với thống kê tính trên toàn bảng.
+
+    Median và imputer KNN/MICE được tính / fit một lần trên toàn bảng (_fit_streaming_imputers),
+    các batch chỉ transform.
+    """
+    table_name = plan.table_name
+    col_types = dict(_table_columns(conn, source))
+    impute_cols = plan.impute['columns'] if plan.impute and plan.impute['method'] == 'smart' else []
+    numeric_cols = [c for c in impute_cols if c in col_types and _is_numeric_sql_type(col_types[c])]
+    row_count = conn.execute(f"SELECT count(*) FROM {_quote_ident(source)}").fetchone()[0]
+    missing_pct, medians = {}, {}
+    if numeric_cols and row_count:
+        stats = conn.execute("SELECT " + ", ".join(
+            f"count({_quote_ident(c)}), median({_quote_ident(c)})" for c in numeric_cols
+        ) + f" FROM {_quote_ident(source)}").fetchone()
+        for i, col in enumerate(numeric_cols):
+            missing_pct[col] = (row_count - stats[2 * i]) / row_count * 100
+            medians[col] = stats[2 * i + 1]
+
+    # Sketch phân vị của cột outlier được cập nhật ngay khi impute từng batch
+    sketches = {}
+    if OUTLIER_QUANTILES == 'sketch':
+        sketches = {c: QuantileSketch() for c in plan.outlier_columns
+                    if c in col_types and _is_numeric_sql_type(col_types[c])}
+
+    # Impute missing values theo batch, chọn tầng KNN/MICE/median theo tỉ lệ missing toàn bảng
+    fit_cols = [c for c in numeric_cols if 0 < missing_pct.get(c, 0) < 95]
+    models = _fit_streaming_imputers(conn, source, fit_cols, missing_pct, row_count) if fit_cols else {}
+    imputed = f"{table_name}__imputed"
+    for i, batch in enumerate(_iter_table_batches(conn, source, chunk_size)):
+        batch = process_missing_values(batch, numeric_cols, missing_pct=missing_pct, medians=medians, models=models)
+        for col, sketch in sketches.items():
+            sketch.update(batch[col].to_numpy(dtype='float64', na_value=np.nan))
+        _append_chunk(conn, imputed, batch, create=i == 0)
+
+    # Outlier bounds trên toàn bảng đã impute, clip và tạo features theo batch
+    if sketches:
+        bounds = sketch_outlier_bounds(sketches, row_count)
+    else:
+        bounds = _sql_outlier_bounds(conn, imputed, plan.outlier_columns)
+    featured = f"{table_name}__featured"
+    for i, batch in enumerate(_iter_table_batches(conn, imputed, chunk_size)):
+        batch = detect_and_handle_outliers(batch, plan.outlier_columns, bounds=bounds)
+        if plan.features:
+            batch = plan.features(batch)
+        _append_chunk(conn, featured, batch, create=i == 0)
+    conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(imputed)}")
+    return featured
+
+def _finalize_category_mean_sql(conn, table, category, value_columns, threshold=0.05):
+    """drop_low_null_products và fill_missing_with_category_mean viết bằng SQL."""
+    columns = [c for c, _ in _table_columns(conn, table)]
+    if category not in columns or not all(col in columns for col in value_columns):
+        return
+    t, cat = _quote_ident(table), _quote_ident(category)
+    null_cond = " OR ".join(f"{_quote_ident(c)} IS NULL" for c in value_columns)
+    dropped = conn.execute(f"""
+        DELETE FROM {t} WHERE ({null_cond}) AND {cat} IN (
+            SELECT {cat} FROM {t} GROUP BY {cat}
+            HAVING avg(CASE WHEN {null_cond} THEN 1.0 ELSE 0.0 END) <= {threshold} OR bool_and({null_cond})
+        )
+    """).fetchone()[0]
+    logger.info(f"Đã loại bỏ {dropped} sản phẩm có giá trị rỗng vượt quá {threshold*100}% trong cột '{', '.join(value_columns)}' theo '{category}'.")
+
+    for col in value_columns:
+        c = _quote_ident(col)
+        conn.execute(f"""
+            UPDATE {t} SET {c} = m.mean_value
+            FROM (SELECT {cat} AS category, avg({c}) AS mean_value FROM {t} GROUP BY {cat}) m
+            WHERE {t}.{c} IS NULL AND {t}.{cat} = m.category
+        """)
+    logger.info(f"Đã điền giá trị missing trong cột '{', '.join(value_columns)}' bằng giá trị trung bình của category tương ứng.")
+
+def _finalize_sql_table(conn, source, table_name, file_path, chunk_size, temp_tables, manifest_entry=None):
+    """Các bước toàn bảng sau transform_rows, rồi lưu file sạch và load bảng đích.
+
+    source: bảng DuckDB đã qua transform_rows và loại duplicate, có cột ETL_ROW_ID.
+    Bảng trung gian được thêm vào temp_tables để caller xoá.
+    """
+    plan = compile_plan(table_name)
+    result = source
+    order_by = _quote_ident(ETL_ROW_ID)
+
+    # Giữ bản ghi mới nhất của mỗi key
+    if plan.dedup_keys:
+        columns = [c for c, _ in _table_columns(conn, source)]
+        key = plan.dedup_key(columns)
+        latest = plan.dedup_order if plan.dedup_order in columns else None
+        order = (f"{_quote_ident(latest)} DESC NULLS FIRST, " if latest else "") + f"{_quote_ident(ETL_ROW_ID)} DESC"
+        if latest:
+            order_by = f"{_quote_ident(latest)} NULLS LAST, {order_by}"
+        if key:
+            result = f"{table_name}__latest"
+            temp_tables.append(result)
+            with memory_stage('latest_by_key', table_name, rows_in=_row_count(conn, source)) as record:
+                conn.execute(f"""
+                    CREATE TABLE {_quote_ident(result)} AS SELECT * FROM {_quote_ident(source)}
+                    QUALIFY row_number() OVER (PARTITION BY {_quote_ident(key)} ORDER BY {order}) = 1
+                """)
+                record['rows_out'] = _row_count(conn, result)
+
+    if plan.impute and plan.impute['method'] == 'category_mean':
+        with memory_stage('category_mean', table_name, rows_in=_row_count(conn, result)) as record:
+            _finalize_category_mean_sql(conn, result, plan.impute['by'], plan.impute['columns'],
+                                        plan.impute.get('drop_threshold', 0.05))
+            record['rows_out'] = _row_count(conn, result)
+    if plan.needs_pandas:
+        # missing_values / outliers / features chạy theo batch nên đo chung một bước
+        with memory_stage('pandas_steps', table_name, rows_in=_row_count(conn, result)) as record:
+            result = _finalize_pandas_sql(conn, result, plan, chunk_size)
+            record['rows_out'] = _row_count(conn, result)
+        temp_tables.append(result)
+
+    # Xử lý low_value columns và normalize column names
+    columns = [c for c, _ in _table_columns(conn, result) if c != ETL_ROW_ID]
+    dropped = set()
+    if plan.spec.get('drop_low_value_columns'):
+        stats = conn.execute("SELECT count(*), " + ", ".join(
+            f"count({_quote_ident(c)}), count(DISTINCT {_quote_ident(c)})" for c in columns
+        ) + f" FROM {_quote_ident(result)}").fetchone()
+        null_counts = pd.Series({c: stats[0] - stats[1 + 2 * i] for i, c in enumerate(columns)})
+        unique_counts = pd.Series({c: stats[2 + 2 * i] for i, c in enumerate(columns)})
+        dropped = set(find_low_value_columns(null_counts, unique_counts, stats[0], plan.merge_keys))
+        columns = [c for c in columns if c not in dropped]
+    output_names = columns
+    if plan.spec.get('normalize_column_names'):
+        output_names = list(normalize_column_names(pd.DataFrame(columns=columns)).columns)
+
+    select = ", ".join(f"{_quote_ident(c)} AS {_quote_ident(n)}" for c, n in zip(columns, output_names))
+    select_sql = f"SELECT {select} FROM {_quote_ident(result)} ORDER BY {order_by}"
+    # Cột category (đang là VARCHAR trong DuckDB) được load thành ENUM: cột có thứ tự theo nhãn khai
+    # báo, cột không thứ tự theo thứ tự xuất hiện trong bảng kết quả (như category_columns_of)
+    col_types = dict(_table_columns(conn, result))
+    category_columns = {}
+    for c, n in zip(columns, output_names):
+        if c in plan.category_columns and col_types[c] == 'VARCHAR':
+            category_columns[n] = plan.category_labels.get(c) or [row[0] for row in conn.execute(f"""
+                SELECT v FROM (SELECT CAST({_quote_ident(c)} AS VARCHAR) AS v, row_number() OVER (ORDER BY {order_by}) AS rn
+                               FROM {_quote_ident(result)})
+                WHERE v IS NOT NULL GROUP BY v ORDER BY min(rn)
+            """).fetchall()]
+
+    # Lưu dữ liệu đã làm sạch; Parquet vẫn chia partition theo cột partition đã drop
+    save_sql = select_sql
+    partition_dropped = [c for c in plan.partition_by if c in dropped]
+    if CLEAN_FORMAT == 'parquet' and partition_dropped:
+        extra = ", ".join(f"{_quote_ident(c)} AS {_quote_ident(n)}"
+                          for c, n in zip(partition_dropped, plan.output_names(partition_dropped)))
+        save_sql = f"SELECT {select}, {extra} FROM {_quote_ident(result)} ORDER BY {order_by}"
+    save_cleaned_sql(conn, save_sql, os.path.basename(file_path), plan)
+
+    # Load vào DuckDB
+    with memory_stage('load', table_name, rows_in=_row_count(conn, result)) as record:
+        create_table(conn, table_name, select_sql, manifest_entry, category_columns)
+        record['rows_out'] = _row_count(conn, table_name)
+
+def stream_etl_file(conn, file_path, table_name, chunk_size=None, manifest_entry=None):
+    """ETL một file với bộ nhớ giới hạn.
+
+    Pass 1 đọc file theo chunk_size dòng, chạy transform_rows (parse numeric, clean text,
+    bool, date parts) và append vào bảng tạm trong DuckDB. Các bước cần toàn bảng
+    (duplicate, impute, outlier bounds, low-value columns) chạy sau đó trên bảng tạm:
+    thống kê tính bằng SQL, imputer KNN/MICE fit một lần trên toàn bảng (lấy mẫu như chế độ
+    thường), phần cần pandas/sklearn chạy lại theo batch.
+    Khác với chế độ thường, duplicate được loại sau transform_rows.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    stage, dedup = f"{table_name}__stage", f"{table_name}__dedup"
+    temp_tables = [stage, dedup]
+    try:
+        with memory_stage('extract', table_name, bytes_in=os.path.getsize(file_path)) as record:
+            # Gồm cả transform_rows từng chunk
+            record['rows_out'] = stage_csv_chunks(conn, file_path, table_name, stage, chunk_size)
+        _dedup_sql(conn, stage, dedup, table_name)
+        conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(stage)}")
+        _finalize_sql_table(conn, dedup, table_name, file_path, chunk_size, temp_tables, manifest_entry)
+    finally:
+        for temp in temp_tables:
+            conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(temp)}")
+
+# ===========================================================================
+# Engine DuckDB: đọc CSV bằng parser song song của DuckDB, transform đơn giản bằng SQL
+
+def _quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _duckdb_encoding(encoding):
+    """Tên encoding tương ứng mà read_csv của DuckDB hỗ trợ, hoặc None."""
+    name = codecs.lookup(encoding).name
+    if name in ('utf-8', 'utf-8-sig', 'ascii'):
+        return 'utf-8'
+    if name in ('utf-16', 'utf-16-le', 'utf-16-be'):
+        return 'utf-16'
+    if name == 'latin-1' or name == 'iso8859-1':
+        return 'latin-1'
+    return None
+
+def read_csv_duckdb(conn, file_path, target, types=None, columns=None, repair_columns=False):
+    """Đọc CSV thẳng vào bảng DuckDB target (song song, không qua pandas).
+
+    Giá trị NA và kiểu cột được suy ra giống mặc định của pandas.read_csv: chỉ các kiểu trong
+    DUCKDB_TYPE_CANDIDATES, cột số nguyên có NULL thành DOUBLE (float64). columns: chỉ đọc các
+    cột này (cột không có trong file bị bỏ qua), DuckDB không parse các cột còn lại.
+    Dòng hỏng bị bỏ qua và ghi ra sidecar như safe_read_csv (write_bad_lines); với
+    repair_columns thì dòng thừa trường bị cắt, dòng thiếu được bù NULL (như repair_options).
+    Trả về False nếu encoding của file không được DuckDB hỗ trợ.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File không tồn tại: {file_path}")
+
+    encoding = next(iter(encoding_candidates(file_path)), None)
+    duckdb_encoding = _duckdb_encoding(encoding) if encoding else None
+    if duckdb_encoding is None:
+        logger.warning(f"DuckDB không hỗ trợ encoding {encoding} của file {file_path}")
+        return False
+
+    # store_rejects: dòng hỏng (sai số cột, không ép được kiểu) bị bỏ qua và ghi vào bảng tạm reject_errors
+    options = [f"encoding = {_quote_literal(duckdb_encoding)}", "header = true", "store_rejects = true",
+               "nullstr = [" + ", ".join(_quote_literal(v) for v in PANDAS_NA_VALUES) + "]",
+               "auto_type_candidates = [" + ", ".join(_quote_literal(t) for t in DUCKDB_TYPE_CANDIDATES) + "]"]
+    if types:
+        options.append("types = {" + ", ".join(f"{_quote_literal(c)}: {_quote_literal(t)}" for c, t in types.items()) + "}")
+    if repair_columns:
+        # Trường thừa thành cột column<i> (chỉ chọn cột của header), dòng thiếu được bù NULL
+        options += ["strict_mode = false", "null_padding = true"]
+    source = f"read_csv({_quote_literal(file_path)}, {', '.join(options)})"
+    select = '*'
+    if columns is not None or repair_columns:
+        header = csv_header(file_path, encoding) if repair_columns else \
+            [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+        select = ', '.join(_quote_ident(c) for c in header if columns is None or c in set(columns)) or '*'
+    conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(target)}")
+    # Bảng reject chỉ nhận lần đọc này (scan không có lỗi không ghi gì vào đó)
+    conn.execute("DROP TABLE IF EXISTS reject_errors")
+    conn.execute("DROP TABLE IF EXISTS reject_scans")
+    conn.execute(f"CREATE TABLE {_quote_ident(target)} AS SELECT {select} FROM {source}")
+    # pandas đọc cột số nguyên có giá trị thiếu thành float64
+    int_columns = [c for c, dtype in _table_columns(conn, target) if dtype == 'BIGINT' and c not in (types or {})]
+    if int_columns:
+        t = _quote_ident(target)
+        null_counts = conn.execute("SELECT " + ", ".join(
+            f"count(*) - count({_quote_ident(c)})" for c in int_columns) + f" FROM {t}").fetchone()
+        for col, nulls in zip(int_columns, null_counts):
+            if nulls:
+                conn.execute(f"ALTER TABLE {t} ALTER {_quote_ident(col)} TYPE DOUBLE")
+    write_bad_lines(file_path, table_name_for(file_path), conn.execute(
+        "SELECT line, first(error_message), trim(first(csv_line), chr(13) || chr(10)) "
+        "FROM reject_errors GROUP BY line ORDER BY line").fetchall())
+    remember_encoding(file_path, encoding)
+    return True
+
+def _transform_rows_sql(conn, source, target, plan):
+    """Phiên bản SQL của TransformPlan.transform_rows: keep, currency và date columns.
+
+    Các kiểu cột chỉ có bản pandas (numeric/text/bool) không có ở đây, xem plan.needs_pandas;
+    category giữ nguyên VARCHAR trong DuckDB. Phần ngày dạng số có kiểu như pandas (.dt):
+    INTEGER, hoặc DOUBLE khi cột có ngày rỗng / không parse được.
+    """
+    columns = [c for c, _ in _table_columns(conn, source)]
+    if plan.keep_columns is not None:
+        # Giữ các cột cần thiết
+        columns = [c for c in columns if c == ETL_ROW_ID or c in plan.keep_columns]
+    currency = set(plan.spec.get('currency_columns', []))
+    select, parts = [], []
+    for col in columns:
+        c = _quote_ident(col)
+        if col in currency:
+            select.append(f"TRY_CAST(replace(CAST({c} AS VARCHAR), '$', '') AS DOUBLE) AS {c}")
+        elif col in plan.date_columns:
+            date_spec = plan.date_columns[col]
+            parsed = f"try_strptime({c}, {_quote_literal(date_spec['format'])})"
+            select.append(f"{parsed} AS {c}")
+            has_missing = conn.execute(f"SELECT count(*) > count({parsed}) FROM {_quote_ident(source)}").fetchone()[0]
+            part_type = 'DOUBLE' if has_missing else 'INTEGER'
+            for name, part in date_spec.get('parts', {}).items():
+                expr = SQL_DATE_PARTS[part].format(parsed)
+                if part != 'day_name':
+                    expr = f"CAST({expr} AS {part_type})"
+                parts.append(f"{expr} AS {_quote_ident(name)}")
+        else:
+            select.append(c)
+    conn.execute(f"CREATE TABLE {_quote_ident(target)} AS SELECT {', '.join(select + parts)} FROM {_quote_ident(source)}")
+
+def duckdb_etl_file(conn, file_path, table_name, manifest_entry=None, run_id=None):
+    """ETL một file với engine DuckDB.
+
+    CSV được đọc bằng read_csv song song của DuckDB. Duplicate, keep/currency/ngày,
+    dedup theo key và mean fill theo category chạy bằng SQL. Bảng có bước chỉ có bản
+    pandas (plan.needs_pandas, vd. marketing_data cần sklearn) được lấy ra pandas rồi chạy
+    transform_data. Trả về False nếu file phải đi đường pandas.
+    """
+    plan = compile_plan(table_name)
+    raw, dedup, rows = f"{table_name}__raw", f"{table_name}__dedup", f"{table_name}__rows"
+    temp_tables = [raw, dedup, rows]
+    # Cột ngày đọc dạng chuỗi để parse đúng định dạng khai báo
+    types = {col: 'VARCHAR' for col in plan.date_columns} or None
+    try:
+        with memory_stage('extract', table_name, bytes_in=os.path.getsize(file_path)) as record:
+            if not read_csv_duckdb(conn, file_path, raw, types=types, columns=plan.spec.get('read_columns'),
+                                   repair_columns=plan.spec.get('repair_columns', False)):
+                return False
+            record['rows_out'] = _row_count(conn, raw)
+
+        if plan.needs_pandas:
+            df = conn.execute(f"SELECT * FROM {_quote_ident(raw)}").df()
+            conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(raw)}")
+            if arrow_strings_enabled():
+                to_arrow_strings(df)
+            df = transform_data(df, table_name, run_id)
+            save_cleaned_data(df, os.path.basename(file_path), table_name)
+            load_table(conn, df, table_name, manifest_entry)
+            return True
+
+        _dedup_sql(conn, raw, dedup, table_name)
+        conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(raw)}")
+        with memory_stage('transform_rows', table_name, rows_in=_row_count(conn, dedup)) as record:
+            _transform_rows_sql(conn, dedup, rows, plan)
+            record['rows_out'] = _row_count(conn, rows)
+        _finalize_sql_table(conn, rows, table_name, file_path, CHUNK_SIZE, temp_tables, manifest_entry)
+        return True
+    finally:
+        for temp in temp_tables:
+            conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(temp)}")
+
+# ===========================================================================
+
+
+# ===========================================================================
+# Manifest file nguồn cho ETL incremental
+
+def _ensure_manifest(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            source_path VARCHAR PRIMARY KEY,
+            table_name VARCHAR,
+            size BIGINT,
+            mtime DOUBLE,
+            content_hash VARCHAR,
+            row_count BIGINT,
+            transform_version VARCHAR,
+            loaded_at TIMESTAMP
+        )
+    """)
+
+def _file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def check_source(conn, file_path, table_name):
+    """So file nguồn với manifest.
+
+    Trả về (entry, unchanged). Hash chỉ được tính lại khi size/mtime khác manifest;
+    unchanged=True khi hash và TRANSFORM_VERSION trùng và bảng đích vẫn tồn tại.
+    """
+    stat = os.stat(file_path)
+    source_path = os.path.abspath(file_path)
+    row = conn.execute(
+        f"SELECT size, mtime, content_hash, transform_version FROM {MANIFEST_TABLE} WHERE source_path = ?", [source_path]
+    ).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+        content_hash = row[2]
+    else:
+        content_hash = _file_hash(file_path)
+    entry = {'source_path': source_path, 'table_name': table_name, 'size': stat.st_size,
+             'mtime': stat.st_mtime, 'content_hash': content_hash}
+
+    table_exists = conn.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [table_name]
+    ).fetchone()[0] > 0
+    unchanged = bool(row) and row[2] == content_hash and row[3] == TRANSFORM_VERSION and table_exists
+    if unchanged and row[1] != stat.st_mtime:
+        # Nội dung không đổi nhưng mtime đổi (vd. touch): cập nhật để lần sau khỏi hash lại
+        conn.execute(f"UPDATE {MANIFEST_TABLE} SET mtime = ? WHERE source_path = ?", [stat.st_mtime, source_path])
+    return entry, unchanged
+
+def _record_manifest(conn, entry, row_count):
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {MANIFEST_TABLE}
+        VALUES (?, ?, ?, ?, ?, ?, ?, current_timestamp)
+    """, [entry['source_path'], entry['table_name'], entry['size'], entry['mtime'],
+          entry['content_hash'], row_count, TRANSFORM_VERSION])
+
+# ===========================================================================
+# Metric từng bước của mỗi lần chạy (memory_stage -> METRICS_TABLE / METRICS_LOG_PATH)
+
+METRICS_COLUMNS = {
+    'table_name': 'VARCHAR', 'stage': 'VARCHAR', 'started_at': 'TIMESTAMP',
+    'wall_seconds': 'DOUBLE', 'cpu_seconds': 'DOUBLE',
+    'rss_before_mb': 'DOUBLE', 'rss_after_mb': 'DOUBLE', 'peak_rss_delta_mb': 'DOUBLE',
+    'rows_in': 'BIGINT', 'rows_out': 'BIGINT', 'bytes_in': 'BIGINT', 'bytes_out': 'BIGINT',
+}
+
+def _ensure_metrics(conn):
+    columns = ", ".join(f"{name} {dtype}" for name, dtype in METRICS_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (run_id VARCHAR, {columns})")
+
+def write_run_metrics(conn, run_id, records):
+    """Ghi bản ghi memory_stage của một lần chạy vào METRICS_TABLE và METRICS_LOG_PATH (JSON lines)."""
+    if not records:
+        return
+    if METRICS_TABLE:
+        _ensure_metrics(conn)
+        conn.executemany(
+            f"INSERT INTO {METRICS_TABLE} VALUES ({', '.join(['?'] * (len(METRICS_COLUMNS) + 1))})",
+            [[run_id] + [record.get(name) for name in METRICS_COLUMNS] for record in records])
+    if METRICS_LOG_PATH:
+        os.makedirs(os.path.dirname(METRICS_LOG_PATH) or '.', exist_ok=True)
+        with open(METRICS_LOG_PATH, 'a', encoding='utf-8') as f:
+            for record in records:
+                line = {'run_id': run_id, **{name: record.get(name) for name in METRICS_COLUMNS}}
+                f.write(json.dumps(line, default=str, ensure_ascii=False) + '\n')
+    logger.info(f"Đã ghi {len(records)} metric của lần chạy {run_id}")
+
+# ===========================================================================
+
+
+# ==================== TỪ ĐIỂN CATEGORY / ENUM ====================
+def _ensure_category_dictionaries(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CATEGORY_DICTIONARY_TABLE} (
+            table_name VARCHAR,
+            column_name VARCHAR,
+            code INTEGER,
+            value VARCHAR,
+            PRIMARY KEY (table_name, column_name, value)
+        )
+    """)
+
+def category_dictionary(conn, table_name, column, values):
+    """Từ điển (theo thứ tự mã) của một cột category.
+
+    Giá trị chưa có được thêm vào cuối nên mã của giá trị cũ không đổi giữa các lần chạy.
+    """
+    dictionary = [row[0] for row in conn.execute(
+        f"SELECT value FROM {CATEGORY_DICTIONARY_TABLE} WHERE table_name = ? AND column_name = ? ORDER BY code",
+        [table_name, column]).fetchall()]
+    known = set(dictionary)
+    new_values = [v for v in dict.fromkeys(values) if v not in known]
+    if new_values:
+        new_df = pd.DataFrame({'table_name': table_name, 'column_name': column,
+                               'code': np.arange(len(dictionary), len(dictionary) + len(new_values), dtype='int32'),
+                               'value': pd.Series(new_values, dtype=object)})
+        conn.register('tmp_dictionary', new_df)
+        try:
+            conn.execute(f"INSERT INTO {CATEGORY_DICTIONARY_TABLE} SELECT * FROM tmp_dictionary")
+        finally:
+            conn.unregister('tmp_dictionary')
+        dictionary += new_values
+    return dictionary
+
+def category_columns_of(data):
+    """{cột: các giá trị category} của các cột category dạng chuỗi trong DataFrame hoặc pyarrow.Table.
+
+    Category có thứ tự (vd. pd.cut) giữ thứ tự category; category không thứ tự lấy các giá trị
+    có trong dữ liệu theo thứ tự xuất hiện, giống _finalize_sql_table của engine SQL.
+    """
+    if isinstance(data, pd.DataFrame):
+        columns = {}
+        for col in data.columns:
+            dtype = data[col].dtype
+            if not isinstance(dtype, pd.CategoricalDtype) or \
+                    pd.api.types.infer_dtype(dtype.categories, skipna=True) not in ('string', 'empty'):
+                continue
+            if dtype.ordered:
+                columns[col] = list(dtype.categories)
+            else:
+                codes = pd.unique(data[col].cat.codes.to_numpy())
+                columns[col] = list(dtype.categories[codes[codes >= 0]])
+        return columns
+    columns = {}
+    for field in data.schema:
+        if pa.types.is_dictionary(field.type) and (pa.types.is_string(field.type.value_type)
+                                                   or pa.types.is_large_string(field.type.value_type)):
+            column = data.column(field.name)
+            if field.type.ordered:
+                chunks = column.chunks
+                columns[field.name] = list(dict.fromkeys(v for chunk in chunks for v in chunk.dictionary.to_pylist()))
+            else:
+                columns[field.name] = [v for v in column.cast(field.type.value_type).unique().to_pylist() if v is not None]
+    return columns
+
+def _enum_select(conn, table_name, select_sql, category_columns):
+    """select_sql với các cột category được CAST sang ENUM theo từ điển ổn định của bảng.
+
+    category_columns: {cột: giá trị category theo thứ tự}, xem category_columns_of. Từ điển đã lưu
+    chỉ được thêm giá trị mới vào cuối nên mã cũ không đổi.
+    """
+    if not CATEGORY_ENUMS or not category_columns:
+        return select_sql
+    _ensure_category_dictionaries(conn)
+    replace = []
+    for col, values in category_columns.items():
+        c = _quote_ident(col)
+        dictionary = category_dictionary(conn, table_name, col, values)
+        if dictionary:
+            enum = "ENUM(" + ", ".join(_quote_literal(v) for v in dictionary) + ")"
+            replace.append(f"CAST({c} AS {enum}) AS {c}")
+    if not replace:
+        return select_sql
+    return f"SELECT * REPLACE ({', '.join(replace)}) FROM ({select_sql})"
+
+# ===========================================================================
+
+# ==================== UPSERT THEO KEY ====================
+def _table_exists(conn, table_name):
+    return conn.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [table_name]).fetchone()[0] > 0
+
+def _merge_keys(conn, table_name, select_sql):
+    """Cột key để upsert select_sql vào bảng đã có, hoặc None (thay cả bảng / bỏ qua như trước)."""
+    if not MERGE_LOADS or OVERWRITE_TABLES or not _table_exists(conn, table_name):
+        return None
+    columns = [row[0] for row in conn.execute(f"DESCRIBE {select_sql}").fetchall()]
+    return compile_plan(table_name).merge_key_columns(columns)
+
+def merge_table(conn, table_name, select_sql, keys):
+    """Upsert select_sql vào bảng đã có theo keys (caller mở transaction).
+
+    Key có dòng mới hoặc thay đổi (so sánh cả dòng) được xoá khỏi bảng rồi chèn lại từ
+    dữ liệu mới; key không đổi và key không có trong dữ liệu mới được giữ nguyên, nên số
+    dòng ghi tỉ lệ với phần thay đổi. Trả về False nếu schema khác bảng hiện có.
+    """
+    incoming, delta = f"{table_name}__incoming", f"{table_name}__delta_keys"
+    conn.execute(f"CREATE OR REPLACE TABLE {_quote_ident(incoming)} AS {select_sql}")
+    try:
+        target_types = dict(_table_columns(conn, table_name))
+        new_types = dict(_table_columns(conn, incoming))
+        if set(target_types) != set(new_types):
+            return False
+        for col, dtype in new_types.items():
+            if dtype == target_types[col]:
+                continue
+            if not (dtype.startswith('ENUM') and target_types[col].startswith('ENUM')):
+                return False
+            # Từ điển category chỉ thêm giá trị nên ENUM mới chứa mọi giá trị của ENUM cũ
+            conn.execute(f"ALTER TABLE {_quote_ident(table_name)} ALTER {_quote_ident(col)} TYPE {dtype}")
+
+        t, i, d = _quote_ident(table_name), _quote_ident(incoming), _quote_ident(delta)
+        columns = ", ".join(_quote_ident(c) for c in new_types)
+        key_list = ", ".join(_quote_ident(k) for k in keys)
+
+        def matches(left, right):
+            return " AND ".join(f"{left}.{_quote_ident(k)} IS NOT DISTINCT FROM {right}.{_quote_ident(k)}" for k in keys)
+
+        # Key thay đổi: dòng mới chưa có trong bảng, hoặc dòng cũ của key đó không còn trong dữ liệu mới
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE {d} AS SELECT DISTINCT {key_list} FROM (
+                (SELECT {columns} FROM {i} EXCEPT ALL SELECT {columns} FROM {t})
+                UNION ALL
+                (SELECT {columns} FROM {t} WHERE EXISTS (SELECT 1 FROM {i} WHERE {matches(i, t)})
+                 EXCEPT ALL SELECT {columns} FROM {i})
+            )
+        """)
+        changed_keys = conn.execute(f"SELECT count(*) FROM {d}").fetchone()[0]
+        deleted = conn.execute(f"DELETE FROM {t} WHERE EXISTS (SELECT 1 FROM {d} WHERE {matches(d, t)})").fetchone()[0]
+        inserted = conn.execute(f"""
+            INSERT INTO {t} BY NAME SELECT * FROM {i} WHERE EXISTS (SELECT 1 FROM {d} WHERE {matches(d, i)})
+        """).fetchone()[0]
+        logger.info(f"Bảng '{table_name}': upsert theo ({', '.join(keys)}): {changed_keys} key mới/thay đổi, "
+                    f"xoá {deleted} dòng cũ, chèn {inserted} dòng.")
+        return True
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(incoming)}")
+        conn.execute(f"DROP TABLE IF EXISTS {_quote_ident(delta)}")
+
+# ===========================================================================
 
 # Hàm Load
-def run_etl():
-    # Kết nối tới DuckDB
-    conn = duckdb.connect(database=DATABASE_PATH)
-    #B1 . Extract dữ liệu từ CSV
+def create_table(conn, table_name, select_sql, manifest_entry=None, category_columns=None):
+    """Tạo bảng đích từ select_sql.
+
+    Bảng đã có và khai báo merge_keys (MERGE_LOADS): upsert theo key, xem merge_table.
+    Có manifest_entry (chế độ incremental): ghi bảng và manifest trong cùng một
+    transaction. Còn lại: giữ hành vi OVERWRITE_TABLES / CREATE TABLE IF NOT EXISTS.
+    category_columns: cột lưu thành ENUM, xem _enum_select.
+    """
+    keys = _merge_keys(conn, table_name, select_sql)
+    if manifest_entry is None and keys is None:
+        # Xoá bảng nếu đã tồn tại và overwrite được bật
+        if OVERWRITE_TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        select_sql = _enum_select(conn, table_name, select_sql, category_columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS {select_sql}")
+        return
+
+    conn.execute("BEGIN TRANSACTION")
     try:
-        csv_files = glob.glob(os.path.join(SOURCE_DIR, '*.csv'))
-        if not csv_files:
-            raise ValueError("No csv files found.")
-        
-        for file_path in csv_files:
-            file_name = os.path.basename(file_path).split('.')[0]
-            df = extract_csv(file_path)
+        # Từ điển category được cập nhật cùng transaction với bảng
+        select_sql = _enum_select(conn, table_name, select_sql, category_columns)
+        if keys is None or not merge_table(conn, table_name, select_sql, keys):
+            if keys is not None:
+                logger.warning(f"Bảng '{table_name}': schema thay đổi, thay cả bảng thay vì upsert.")
+            conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS {select_sql}")
+        if manifest_entry is not None:
+            row_count = conn.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+            _record_manifest(conn, manifest_entry, row_count)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
 
-            table_name = re.sub(r"[^0-9a-zA-Z_]", "_", file_name)
-            if re.match(r"^[0-9]", table_name):
-                table_name = "t_" + table_name
+def load_table(conn, df, table_name, manifest_entry=None):
+    if arrow_strings_enabled() and isinstance(df, pd.DataFrame):
+        # Cột string Arrow được chuyển sang DuckDB không copy
+        df = pa.Table.from_pandas(df, preserve_index=False)
+    conn.register('tmp_df', df)
+    try:
+        with memory_stage('load', table_name, rows_in=len(df)) as record:
+            create_table(conn, table_name, "SELECT * FROM tmp_df", manifest_entry, category_columns_of(df))
+            record['rows_out'] = _row_count(conn, table_name)
+    finally:
+        # Unregister tạm thời để tránh xung đột tên trong vòng lặp tiếp theo
+        try:
+            conn.unregister('tmp_df')
+        except Exception:
+            pass
 
-            print(f"ETLing file {file_path} -> table: {table_name}")
+def extract_transform_file(file_path, table_name, to_arrow=False, run_id=None, save=True):
+    """Extract + transform + lưu file sạch cho một file (chạy được trong process worker).
 
-            # B2. Transform dữ liệu
-            df = transform_data(df, table_name)
-            
-            # Lưu dữ liệu đã làm sạch
-            original_filename = os.path.basename(file_path)
-            save_cleaned_data(df, original_filename)
+    to_arrow=True trả về pyarrow.Table để chuyển sang loader rẻ hơn DataFrame.
+    save=False: caller tự lưu file sạch (vd. ở thread nền, xem PipelineStages).
+    """
+    with memory_stage('extract', table_name, bytes_in=os.path.getsize(file_path)) as record:
+        df = extract_csv(file_path, table_name)
+        record['rows_out'] = len(df)
 
-            # Xoá bảng nếu đã tồn tại và overwrite được bật
-            if OVERWRITE_TABLES:
-                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+    # B2. Transform dữ liệu
+    df = transform_data(df, table_name, run_id)
+    
+    # Lưu dữ liệu đã làm sạch
+    if save:
+        original_filename = os.path.basename(file_path)
+        save_cleaned_data(df, original_filename, table_name)
 
-            # B3. Load dữ liệu vào DuckDB
-            try:
-                conn.register('tmp_df', df)
-                conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM tmp_df")
-                # Unregister tạm thời để tránh xung đột tên trong vòng lặp tiếp theo
+    if to_arrow and pa is not None:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    return df
+
+class PipelineStages:
+    """Lưu file sạch và load DuckDB ở hai thread nền trong khi thread chính extract + transform
+    file tiếp theo.
+
+    Mỗi thread có hàng đợi giới hạn queue_size nên submit() chặn khi thread nền chưa theo kịp,
+    số bảng đã transform nằm trong bộ nhớ không vượt quá giới hạn. Bảng được load theo đúng
+    thứ tự submit, qua cursor riêng của conn. Lỗi ở thread nền được raise lại ở submit()/close().
+    """
+
+    def __init__(self, conn, queue_size=None):
+        self.cursor = conn.cursor()
+        self.error = None
+        self.queues, self.threads = [], []
+        for name, stage in (('etl-save', self._save), ('etl-load', self._load)):
+            stage_queue = queue.Queue(maxsize=queue_size or PIPELINE_QUEUE_SIZE)
+            thread = threading.Thread(target=self._worker, args=(stage_queue, stage), name=name, daemon=True)
+            thread.start()
+            self.queues.append(stage_queue)
+            self.threads.append(thread)
+
+    def _worker(self, stage_queue, stage):
+        while True:
+            item = stage_queue.get()
+            if item is None:
+                return
+            # Sau lỗi đầu tiên chỉ lấy hết hàng đợi để thread chính không bị chặn
+            if self.error is None:
                 try:
-                    conn.unregister('tmp_df')
-                except Exception:
-                    pass
+                    stage(*item)
+                except Exception as e:
+                    self.error = e
+
+    def _save(self, file_path, table_name, df, manifest_entry):
+        save_cleaned_data(df, os.path.basename(file_path), table_name)
+
+    def _load(self, file_path, table_name, df, manifest_entry):
+        try:
+            load_table(self.cursor, df, table_name, manifest_entry)
+        except Exception as e:
+            logger.error(f"Failed to write table {table_name} from {file_path}: {e}")
+            raise
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, file_path, table_name, df, manifest_entry=None):
+        self._raise_error()
+        for stage_queue in self.queues:
+            stage_queue.put((file_path, table_name, df, manifest_entry))
+
+    def close(self, pending=None):
+        """Chờ các bảng đang chờ được lưu/load xong.
+
+        pending: lỗi đang được raise ở thread chính; khi có, lỗi của thread nền không thay thế
+        nó (lỗi đầu tiên được báo) mà chỉ được log.
+        """
+        for stage_queue in self.queues:
+            stage_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.cursor.close()
+        if pending is None:
+            self._raise_error()
+        elif self.error is not None and self.error is not pending:
+            logger.error(f"Lỗi ở thread lưu/load nền (không raise vì đã có lỗi trước đó): {self.error!r}")
+
+def _extract_transform_job(file_path, table_name, run_id=None):
+    """extract_transform_file trong process worker; trả về (pyarrow.Table, metric các bước, encoding
+    đã đọc) cho process chính."""
+    with collect_stage_metrics() as metrics, defer_encoding_cache() as encodings:
+        table = extract_transform_file(file_path, table_name, True, run_id)
+    return table, metrics, encodings
+
+def _run_parallel(conn, csv_files, workers, manifest_entries, run_id=None):
+    """Extract + transform song song mỗi file một process; process chính là loader duy nhất giữ kết nối DuckDB."""
+    # File lớn nhất chạy trước để tổng thời gian gần với file chậm nhất
+    csv_files = sorted(csv_files, key=os.path.getsize, reverse=True)
+    with ProcessPoolExecutor(max_workers=min(workers, len(csv_files))) as pool:
+        futures = {}
+        for file_path in csv_files:
+            table_name = table_name_for(file_path)
+            print(f"ETLing file {file_path} -> table: {table_name}")
+            futures[pool.submit(_extract_transform_job, file_path, table_name, run_id)] = (file_path, table_name)
+
+        # B3. Load dữ liệu vào DuckDB theo thứ tự file hoàn thành
+        for future in as_completed(futures):
+            file_path, table_name = futures[future]
+            try:
+                table, metrics, encodings = future.result()
+                if _stage_metrics is not None:
+                    _stage_metrics.extend(metrics)
+                # Chỉ process chính ghi encoding cache
+                save_encodings(encodings)
+                load_table(conn, table, table_name, manifest_entries.get(file_path))
+                logger.info(f"Đã load bảng {table_name}")
             except Exception as e:
                 logger.error(f"Failed to write table {table_name} from {file_path}: {e}")
+                pool.shutdown(cancel_futures=True)
                 raise
-    except Exception as e:
-        print(f"Error during ETL: {e}")
+
+# ===========================================================================
+# Profile hiệu năng từng bảng của run_etl: cProfile, lấy mẫu stack và trace cấp phát bộ nhớ
+# (StackSampler / PeakAllocationTracer ở etl_profiler.py)
+
+@contextmanager
+def profile_section(name, run_id, profiler=None, memory=False):
+    """Profile khối lệnh (một bảng của run_etl) với profiler 'cprofile' / 'sample' và/hoặc memory.
+
+    Lưu vào PROFILER_DIR/<run_id>/: <name>.prof (pstats, xem bằng snakeviz), <name>.stacks.txt
+    (flamegraph) và <name>.memory.txt; PROFILE_TOP_N hàm / dòng nóng nhất được ghi vào log.
+    """
+    if profiler not in (None, 'cprofile', 'sample'):
+        raise ValueError(f"profiler không hợp lệ: {profiler} (chọn 'cprofile' hoặc 'sample')")
+    if not profiler and not memory:
+        yield
+        return
+    base = os.path.join(PROFILER_DIR, run_id, name)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    tracer = PeakAllocationTracer([__file__], 'etl.py') if memory else None
+    sampler = StackSampler(PROFILE_SAMPLE_INTERVAL) if profiler == 'sample' else None
+    prof = cProfile.Profile() if profiler == 'cprofile' else None
+    for started in (tracer, sampler):
+        if started is not None:
+            started.start()
+    if prof is not None:
+        prof.enable()
+    try:
+        yield
     finally:
-        conn.close()
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(base + '.prof')
+            logger.info(f"[profile] {name}: cProfile -> {base}.prof\n{cprofile_summary(prof, PROFILE_TOP_N)}")
+        if sampler is not None:
+            sampler.stop()
+            sampler.save(base + '.stacks.txt')
+            logger.info(f"[profile] {name}: mẫu stack -> {base}.stacks.txt\n{sampler.summary(PROFILE_TOP_N)}")
+        if tracer is not None:
+            tracer.stop()
+            with open(base + '.memory.txt', 'w', encoding='utf-8') as f:
+                f.write(tracer.summary(None) + "\n")
+            logger.info(f"[profile] {name}: bộ nhớ -> {base}.memory.txt\n{tracer.summary(PROFILE_TOP_N)}")
+
+def run_etl(streaming=None, chunk_size=None, engine=None, workers=None, incremental=None, refit_imputers=None,
+            pipeline=None, profiler=None, profile_memory=None):
+    """Chạy ETL cho mọi file CSV trong SOURCE_DIR.
+
+    streaming=True (mặc định theo STREAMING) xử lý từng file theo chunk_size dòng
+    với bộ nhớ giới hạn, xem stream_etl_file.
+    engine='duckdb' (mặc định theo ENGINE) đọc và transform bằng DuckDB, xem duckdb_etl_file.
+    workers > 1 (mặc định theo WORKERS) chạy extract + transform song song theo file
+    (engine pandas, không streaming), xem _run_parallel.
+    incremental=True (mặc định theo INCREMENTAL) bỏ qua file không đổi theo manifest
+    và thay bảng của file đã đổi trong một transaction, xem check_source.
+    refit_imputers=True (mặc định theo REFIT_IMPUTERS) xoá imputer đã lưu để fit lại,
+    xem smart_impute_numeric.
+    pipeline=True (mặc định theo PIPELINE, engine pandas) lưu file sạch và load DuckDB ở
+    thread nền trong khi transform file tiếp theo, xem PipelineStages.
+    Thời gian, CPU, RSS, số dòng và bytes của từng bước được ghi vào METRICS_TABLE theo
+    run id, xem memory_stage và write_run_metrics.
+    profiler='cprofile' | 'sample' (mặc định theo PROFILER) và profile_memory=True (mặc định
+    theo PROFILE_MEMORY) profile từng bảng, xem profile_section; khi đó các file chạy tuần
+    tự trên thread chính (không song song, không pipeline) để profile đủ mọi bước.
+    """
+    streaming = STREAMING if streaming is None else streaming
+    engine = engine or ENGINE
+    workers = workers or WORKERS
+    incremental = INCREMENTAL if incremental is None else incremental
+    refit_imputers = REFIT_IMPUTERS if refit_imputers is None else refit_imputers
+    pipeline = PIPELINE if pipeline is None else pipeline
+    profiler = PROFILER if profiler is None else profiler
+    profile_memory = PROFILE_MEMORY if profile_memory is None else profile_memory
+    if profiler or profile_memory:
+        workers, pipeline = 1, False
+    if refit_imputers:
+        clear_imputers()
+    run_id = new_run_id()
+    logger.info(f"Bắt đầu lần chạy ETL {run_id}")
+    # Kết nối tới DuckDB
+    conn = duckdb.connect(database=DATABASE_PATH)
+    #B1 . Extract dữ liệu từ CSV
+    with collect_stage_metrics() as metrics:
+        try:
+            csv_files = glob.glob(os.path.join(SOURCE_DIR, '*.csv'))
+            if not csv_files:
+                raise ValueError("No csv files found.")
+
+            # Bỏ qua file không đổi so với manifest
+            manifest_entries = {}
+            if incremental:
+                _ensure_manifest(conn)
+                for file_path in list(csv_files):
+                    entry, unchanged = check_source(conn, file_path, table_name_for(file_path))
+                    if unchanged:
+                        logger.info(f"Bỏ qua file không đổi: {file_path}")
+                        csv_files.remove(file_path)
+                    else:
+                        manifest_entries[file_path] = entry
+                if not csv_files:
+                    return
+
+            if workers > 1 and not streaming and engine == 'pandas':
+                _run_parallel(conn, csv_files, workers, manifest_entries, run_id)
+                return
+
+            # Engine pandas: lưu + load file trước ở thread nền trong khi transform file sau
+            pipeline = PipelineStages(conn) if pipeline and not streaming and engine == 'pandas' else None
+            try:
+                for file_path in csv_files:
+                    table_name = table_name_for(file_path)
+                    manifest_entry = manifest_entries.get(file_path)
+                    print(f"ETLing file {file_path} -> table: {table_name}")
+
+                    with profile_section(table_name, run_id, profiler, profile_memory):
+                        if streaming:
+                            stream_etl_file(conn, file_path, table_name, chunk_size, manifest_entry)
+                            continue
+                        if engine == 'duckdb' and duckdb_etl_file(conn, file_path, table_name, manifest_entry, run_id):
+                            continue
+
+                        df = extract_transform_file(file_path, table_name, run_id=run_id, save=pipeline is None)
+                        if pipeline is not None:
+                            pipeline.submit(file_path, table_name, df, manifest_entry)
+                            continue
+
+                        # B3. Load dữ liệu vào DuckDB
+                        try:
+                            load_table(conn, df, table_name, manifest_entry)
+                        except Exception as e:
+                            logger.error(f"Failed to write table {table_name} from {file_path}: {e}")
+                            raise
+            except BaseException as e:
+                if pipeline is not None:
+                    pipeline.close(pending=e)
+                raise
+            if pipeline is not None:
+                pipeline.close()
+        except Exception as e:
+            print(f"Error during ETL: {e}")
+        finally:
+            # Metric được ghi cả khi lần chạy lỗi, lỗi khi ghi không làm hỏng lần chạy
+            try:
+                write_run_metrics(conn, run_id, metrics)
+            except Exception as e:
+                logger.warning(f"Không ghi được metric của lần chạy {run_id}: {e}")
+            conn.close()
+
+def main(argv=None):
+    global PROFILE_TOP_N
+    parser = argparse.ArgumentParser(description="ETL các file CSV trong SOURCE_DIR vào DuckDB.")
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sample'],
+                        help="Profile từng bảng: cprofile (mặc định, tất định) hoặc sample (lấy mẫu stack)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Trace cấp phát bộ nhớ, quy bộ nhớ lúc đỉnh về từng dòng trong etl.py")
+    parser.add_argument('--profile-top', type=int, help=f"Số hàm / dòng nóng nhất ghi vào log (mặc định {PROFILE_TOP_N})")
+    args = parser.parse_args(argv)
+    if args.profile_top:
+        PROFILE_TOP_N = args.profile_top
+    run_etl(profiler=args.profile, profile_memory=args.profile_memory or None)
 
 if __name__ == "__main__":
-    run_etl()
\ No newline at end of file
+    main()
@@ -0,0 +1,94 @@
+"""
+Parse cột số "bẩn" (NA markers, ký hiệu tiền tệ, dấu phân cách hàng nghìn) thành float64.
+
+Chỉ phụ thuộc numpy + pandas (pyarrow tuỳ chọn) để các script độc lập
+(Preprocess_marketing_data.py, check/marketing_data.py) dùng chung một bản với etl.py
+mà không import cả etl.py. Mỗi bản vector hoá cho kết quả giống hệt apply() bản từng ô
+tương ứng, xem tests/test_parse_numeric.py.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow là tuỳ chọn, chỉ dùng để tăng tốc str ops
+    pa = None
+
+FLOAT_NA_MARKERS = ['NA', 'na', 'N/A', '', 'NULL', 'null']  # Giá trị coi là NaN của parse_float (so khớp nguyên văn)
+
+def _string_dtype():
+    return 'string[pyarrow]' if pa is not None else 'string'
+
+def parse_numeric(value):
+    """Parse a single value into float, handling common NA markers and currency/commas."""
+    try:
+        if pd.isna(value):
+            return np.nan
+        sval = str(value).strip()
+        if sval.lower() in ['na', 'n/a', 'null', 'none', '']:
+            return np.nan
+        # Remove currency symbols and thousands separators, keep minus and dot
+        cleaned = re.sub(r"[^0-9\-\.]", "", sval)
+        if cleaned in ['', '-', '.']:
+            return np.nan
+        return float(cleaned)
+    except Exception:
+        return np.nan
+
+def parse_numeric_series(series):
+    """Phiên bản vector hoá của parse_numeric cho cả cột (cùng ngữ nghĩa, trả về float64).
+
+    Dùng str ops (Arrow-backed nếu có pyarrow), regex kiểm tra dạng số rồi cast một lần,
+    kết quả giống hệt apply(parse_numeric).
+    """
+    result = np.full(len(series), np.nan)
+    positions = np.flatnonzero(series.notna().to_numpy())
+
+    # Cột đã là số: float(str(x)) == x trừ các giá trị str() ra dạng khoa học hoặc inf
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        magnitude = np.abs(values)
+        exact = np.isfinite(values) & (magnitude < 1e16) & ((magnitude >= 1e-4) | (values == 0))
+        result[exact] = values[exact]
+        rest = np.setdiff1d(positions, np.flatnonzero(exact))
+        result[rest] = [parse_numeric(v) for v in series.iloc[rest]]
+        return pd.Series(result, index=series.index, name=series.name)
+
+    sval = series.iloc[positions].astype(_string_dtype())
+    # Remove currency symbols and thousands separators, keep minus and dot.
+    # NA markers ('na', 'null', '' ...) không chứa số nên sau bước này đều rỗng -> NaN.
+    cleaned = sval.str.replace(r"[^0-9\-\.]", "", regex=True)
+    # Chuỗi chỉ gồm 0-9 '-' '.' mà float() chấp nhận
+    valid = cleaned.str.fullmatch(r"-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)").to_numpy(dtype=bool, na_value=False)
+    result[positions[valid]] = cleaned[valid].astype('float64').to_numpy()
+    return pd.Series(result, index=series.index, name=series.name)
+
+def parse_float(value):
+    """Parse numeric values, xử lí NA/null/currency (bản của Preprocess_marketing_data.py).
+
+    Khác parse_numeric: chỉ bỏ ',' '$' '€' '£' rồi float(), nên '1e5', 'inf', ' 12 ' vẫn là số
+    còn ô có chữ khác (vd. '12 USD') là NaN.
+    """
+    if pd.isna(value) or value in FLOAT_NA_MARKERS:
+        return np.nan
+    try:
+        # Remove currency symbols và commas
+        cleaned = str(value).replace(',', '').replace('$', '').replace('€', '').replace('£', '')
+        return float(cleaned)
+    except:
+        return np.nan
+
+def parse_float_series(series):
+    """Phiên bản vector hoá của parse_float cho cả cột, kết quả giống hệt apply(parse_float).
+    Số dạng đơn giản được cast một lần; ô còn lại (hiếm) parse lại bằng parse_float"""
+    result = np.full(len(series), np.nan)
+    positions = np.flatnonzero((series.notna() & ~series.isin(FLOAT_NA_MARKERS)).to_numpy())
+    values = series.iloc[positions]
+    # Remove currency symbols và commas
+    cleaned = values.astype(_string_dtype()).str.replace(r'[,$€£]', '', regex=True)
+    simple = cleaned.str.fullmatch(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)').to_numpy(dtype=bool, na_value=False)
+    result[positions[simple]] = cleaned[simple].astype('float64').to_numpy()
+    result[positions[~simple]] = [parse_float(v) for v in values[~simple]]
+    return pd.Series(result, index=series.index, name=series.name)
@@ -0,0 +1,94 @@
+"""
+Bản vector hoá trong numeric_parsing phải cho kết quả giống hệt bản parse từng ô tương ứng
+(parse_numeric_series / parse_numeric của etl.py và check/marketing_data.py,
+parse_float_series / parse_float của Preprocess_marketing_data.py).
+
+Chạy từ thư mục gốc:  python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from numeric_parsing import parse_float, parse_float_series, parse_numeric, parse_numeric_series  # noqa: E402
+
+PARSERS = [
+    pytest.param(parse_numeric, parse_numeric_series, id='parse_numeric'),
+    pytest.param(parse_float, parse_float_series, id='parse_float'),
+]
+
+EMPTY_LIKE = ['', '-', '.', ' ', '--', '-.', '+']
+NA_MARKERS = ['NA', 'na', 'N/A', 'n/a', 'NULL', 'null', ' null ', 'None', 'none', ' NA ']
+CURRENCY = ['$1,234.50', '€1.234,5', '£3', '$-12', '1,000,000', '$ 7', '12 USD', '-$5.5']
+MALFORMED = ['1.2.3', '--5', '5-', 'abc', '1e5', '1E-3', 'inf', '-inf', 'nan', ' 12 ', '+3', '.5', '5.', '007']
+MIXED = [None, np.nan, pd.NA, 3, -2, 2.5, 0.0, 1e20, 1e-7, float('inf'), True, False]
+
+
+def assert_same(parse_one, vectorized, series):
+    # Parse từng ô thật của cột: Series.apply trên Int64 có NA cast cả cột sang float64 trước
+    # (10**17 thành 1e+17), không phải giá trị ô.
+    expected = pd.Series([parse_one(v) for v in series], dtype='float64')
+    actual = vectorized(series)
+    assert actual.dtype == 'float64'
+    assert actual.index.equals(series.index)
+    assert actual.name == series.name
+    np.testing.assert_array_equal(expected.to_numpy(), actual.to_numpy())
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+@pytest.mark.parametrize('values', [EMPTY_LIKE, NA_MARKERS, CURRENCY, MALFORMED],
+                         ids=['empty_like', 'na_markers', 'currency', 'malformed'])
+@pytest.mark.parametrize('dtype', ['object', 'string', 'string[pyarrow]'])
+def test_string_columns(parse_one, vectorized, values, dtype):
+    if dtype == 'string[pyarrow]':
+        pytest.importorskip('pyarrow')
+    assert_same(parse_one, vectorized, pd.Series(values + [None], dtype=dtype, name='Price'))
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+def test_mixed_object_column(parse_one, vectorized):
+    values = EMPTY_LIKE + NA_MARKERS + CURRENCY + MALFORMED + MIXED
+    assert_same(parse_one, vectorized, pd.Series(values, dtype=object, name='Price'))
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+def test_nullable_integer_column(parse_one, vectorized):
+    assert_same(parse_one, vectorized, pd.Series([1, None, -3, 0, 10**17], dtype='Int64'))
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+def test_float_column(parse_one, vectorized):
+    values = [1e20, 1e-7, 1e16, 1e-4, 0.0, -0.0, np.nan, 5.25, -3.5, float('inf'), float('-inf')]
+    assert_same(parse_one, vectorized, pd.Series(values))
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+def test_duplicate_index_kept(parse_one, vectorized):
+    assert_same(parse_one, vectorized, pd.Series(['1', 'NA', '$2'], index=[7, 7, 7]))
+
+
+@pytest.mark.parametrize('parse_one, vectorized', PARSERS)
+def test_empty_column(parse_one, vectorized):
+    assert_same(parse_one, vectorized, pd.Series([], dtype=object))
+
+
+def test_edge_cases_of_parse_numeric():
+    assert np.isnan(parse_numeric('-'))
+    assert np.isnan(parse_numeric('.'))
+    assert np.isnan(parse_numeric(' N/A '))
+    assert parse_numeric('$1,234.50') == 1234.5
+    assert parse_numeric('€1.234,5') == 1.2345
+    assert parse_numeric('1e5') == 15.0
+
+
+def test_edge_cases_of_parse_float():
+    assert np.isnan(parse_float('-'))
+    assert np.isnan(parse_float(' N/A '))
+    assert parse_float('$1,234.50') == 1234.5
+    assert parse_float('€1.234,5') == 1.2345
+    assert parse_float('1e5') == 100000.0